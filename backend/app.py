@@ -1,67 +1,209 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, make_response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import gzip
 import uuid
 import os
-import jwt  # Make sure PyJWT is installed: pip install PyJWT
-from datetime import datetime, timedelta
+import json
+import logging
+import time
 from functools import wraps
 from dotenv import load_dotenv
 from models import Database, User, Product, ChatSession
-from chatbot_service import ChatbotService
+from chatbot_service import ChatbotService, CHAT_CONTEXT_MESSAGES
+from message_writer import MessageWriter
+from chat_shards import ChatShards
+from conversation_memory import ConversationMemory
+from catalog_snapshot import CatalogSnapshotEngine
+from product_json import ProductJSONCache, product_payload
+from recommendations import RecommendationEngine
+import auth
+import timing
+import metrics
+from catalog_import import CatalogImporter, detect_format, text_stream
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Default JSON provider that records serialization time as a span"""
+
+    def dumps(self, obj, **kwargs):
+        with timing.timed('json_serialize'):
+            return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        with timing.timed('json_serialize'):
+            return super().response(*args, **kwargs)
+
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 app.secret_key = os.getenv('SECRET_KEY', 'fallback-secret-key-for-development')
 
+ALLOWED_ORIGINS = ["http://127.0.0.1:5500", "http://localhost:5500", "http://127.0.0.1:3000", "http://localhost:3000"]
+
 # CORS Configuration
 CORS(app, 
      supports_credentials=True,
-     origins=["http://127.0.0.1:5500", "http://localhost:5500", "http://127.0.0.1:3000", "http://localhost:3000"],
+     origins=ALLOWED_ORIGINS,
      allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
 )
 
+# Send Server-Timing to every client and serve /api/cache/stats without an admin key
+EXPOSE_DIAGNOSTICS = os.getenv('EXPOSE_DIAGNOSTICS', '0') == '1'
+
+def has_admin_key(headers):
+    """True when the request carries X-Admin-Key matching ADMIN_API_KEY"""
+    admin_key = os.getenv('ADMIN_API_KEY')
+    return bool(admin_key) and headers.get('X-Admin-Key') == admin_key
+
+def sees_diagnostics(headers):
+    """Whether a request may see internal timings and cache counters"""
+    return EXPOSE_DIAGNOSTICS or has_admin_key(headers)
+
 # Initialize database and services
 db = Database()
+# Serve product reads from an in-memory columnar snapshot when CATALOG_SNAPSHOT=1
+catalog_engine = CatalogSnapshotEngine(db).start() if os.getenv('CATALOG_SNAPSHOT') == '1' else None
+product_json = ProductJSONCache(db)
 user_service = User(db)
 product_service = Product(db)
-chat_service = ChatSession(db)
+# Chat messages are committed in batches by a background writer unless CHAT_WRITE_BEHIND=0
+write_behind = os.getenv('CHAT_WRITE_BEHIND', '1') != '0'
+writer_options = {'max_delay': float(os.getenv('CHAT_WRITE_DELAY_MS', '5')) / 1000.0}
+message_writer = None
+# With CHAT_SHARDS=N, chat sessions live in N shard files (one writer each) instead of the main database
+chat_shards = None
+if int(os.getenv('CHAT_SHARDS', '0')) > 0:
+    chat_shards = ChatShards(os.getenv('CHAT_SHARD_DIR', 'chat_shards'), int(os.getenv('CHAT_SHARDS')))
+    if write_behind:
+        chat_shards.start_writers(**writer_options)
+elif write_behind:
+    message_writer = MessageWriter(db, **writer_options).start()
+chat_service = ChatSession(db, writer=message_writer, shards=chat_shards)
+# Older turns are folded into a rolling per-session summary off the request path unless CHAT_SUMMARY=0
+conversation_memory = None
+if os.getenv('CHAT_SUMMARY', '1') != '0':
+    conversation_memory = ConversationMemory(
+        chat_service,
+        keep_messages=int(os.getenv('CHAT_SUMMARY_KEEP', 4)),
+        compact_after=int(os.getenv('CHAT_SUMMARY_AFTER', 8))
+    )
 chatbot_service = ChatbotService(db)
+# Neighbor lists for /api/recommendations are refreshed in the background unless RECOMMENDATIONS=0
+recommendation_engine = None
+if os.getenv('RECOMMENDATIONS', '1') != '0':
+    recommendation_engine = RecommendationEngine(
+        db, product_service, chat_service, chatbot_service.retriever,
+        refresh_interval=float(os.getenv('RECOMMENDATIONS_REFRESH_SECONDS', 30))
+    ).start()
+    chatbot_service.recommender = recommendation_engine
+
+metrics.CallbackGauge(
+    'cache_hit_ratio', 'Hit ratio of in-process caches',
+    lambda: {
+        ('catalog',): product_service.cache_stats()['hit_rate'],
+        ('llm',): chatbot_service.response_cache.stats()['hit_rate']
+    },
+    ('cache',)
+)
+metrics.CallbackGauge(
+    'cache_entries', 'Entries held by in-process caches',
+    lambda: {
+        ('catalog',): product_service.cache_stats()['size'],
+        ('llm',): chatbot_service.response_cache.stats()['size']
+    },
+    ('cache',)
+)
+
+# Seconds clients may reuse catalog responses before revalidating with If-None-Match
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_CACHE_MAX_AGE', '0'))
+
+def catalog_cacheable(view):
+    """Conditional GET for catalog reads
+    
+    The strong ETag is the catalog revision stored in the database, so every
+    worker and restart agrees on it, and a matching If-None-Match is
+    answered with 304 without running the view. The revision is read from
+    the in-memory copy, not queried per request. The view can read
+    g.catalog_version to tag what it serializes.
+    """
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return view(*args, **kwargs)
+        
+        etag = db.current_catalog_revision()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            version = g.catalog_version = db.catalog_version
+            response = make_response(view(*args, **kwargs))
+            # Only tag what was certainly built from this revision
+            if (response.status_code != 200 or db.catalog_version != version
+                    or db.current_catalog_revision() != etag):
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'public, max-age={CATALOG_MAX_AGE}, must-revalidate'
+        response.vary.add('Origin')
+        return response
+    return decorated
+
+def json_text_response(body):
+    """Response for an already-serialized JSON document"""
+    return Response(body, mimetype='application/json')
 
 def generate_token(user_id, session_id):
     """Generate JWT token for user"""
-    payload = {
-        'user_id': user_id,
-        'session_id': session_id,
-        'exp': datetime.utcnow() + timedelta(hours=24),  # Token expires in 24 hours
-        'iat': datetime.utcnow()
-    }
-    return jwt.encode(payload, app.secret_key, algorithm='HS256')
+    return auth.generate_token(user_id, session_id, app.secret_key)
+
+def token_required(view):
+    """Authenticate the bearer token, exposing g.user and g.session_id to the view
+    
+    OPTIONS preflight requests pass through unauthenticated.
+    """
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        if request.method != 'OPTIONS':
+            try:
+                g.user, g.session_id = auth.authenticate(
+                    request.headers.get('Authorization'), app.secret_key, user_service
+                )
+            except auth.AuthError as e:
+                return jsonify({'success': False, 'message': str(e)}), 401
+        return view(*args, **kwargs)
+    return decorated
 
 @app.before_request
 def before_request():
-    """Debug request information"""
-    print(f"\n=== REQUEST DEBUG ===")
-    print(f"Method: {request.method}")
-    print(f"URL: {request.url}")
-    print(f"Origin: {request.headers.get('Origin', 'None')}")
-    print(f"Authorization: {request.headers.get('Authorization', 'None')}")
+    """Start per-request timing"""
+    g.request_started = time.perf_counter()
+    timing.start_request()
+    logger.debug("%s %s (origin: %s)", request.method, request.url, request.headers.get('Origin'))
 
 @app.after_request
 def after_request(response):
-    """Add CORS headers"""
+    """Add CORS and Server-Timing headers, record request metrics"""
     origin = request.headers.get('Origin')
-    if origin in ['http://127.0.0.1:5500', 'http://localhost:5500', 'http://127.0.0.1:3000', 'http://localhost:3000']:
+    if origin in ALLOWED_ORIGINS:
         response.headers['Access-Control-Allow-Origin'] = origin
         response.headers['Access-Control-Allow-Credentials'] = 'true'
         response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,X-Requested-With'
         response.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
     
-    print(f"=== RESPONSE DEBUG ===")
-    print(f"Status: {response.status_code}")
-    print("=====================\n")
+    # Per-stage server time (db, llm, sql.*) for benchmarks and admins only
+    server_timing = timing.server_timing_header() if sees_diagnostics(request.headers) else None
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    
+    # Streamed responses are measured up to the first byte
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    timing.finish_request(request.method, endpoint, response.status_code, elapsed)
+    logger.debug("%s %s -> %s", request.method, request.path, response.status_code)
     
     return response
 
@@ -69,6 +211,11 @@ def after_request(response):
 def home():
     return jsonify({"message": "E-commerce Chatbot API is running!"})
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/register', methods=['POST', 'OPTIONS'])
 def register():
     """User registration endpoint"""
@@ -76,7 +223,6 @@ def register():
         return '', 200
         
     data = request.get_json()
-    print(f"Registration data: {data}")
     
     if not data or not all(k in data for k in ('username', 'email', 'password')):
         return jsonify({'success': False, 'message': 'Missing required fields'}), 400
@@ -88,14 +234,14 @@ def register():
     )
     
     if user_id:
-        print(f"User registered successfully with ID: {user_id}")
+        logger.info("User registered with ID %s", user_id)
         return jsonify({
             'success': True, 
             'message': 'User registered successfully',
             'user_id': user_id
         })
     else:
-        print("Registration failed - user already exists")
+        logger.info("Registration rejected: username or email already exists")
         return jsonify({
             'success': False, 
             'message': 'Username or email already exists'
@@ -108,27 +254,23 @@ def login():
         return '', 200
         
     data = request.get_json()
-    print(f"Login attempt with data: {data}")
     
     if not data or not all(k in data for k in ('username', 'password')):
         return jsonify({'success': False, 'message': 'Missing username or password'}), 400
     
     user = user_service.authenticate_user(data['username'], data['password'])
-    print(f"Authentication result: {user}")
     
     if user:
         # Generate session ID and token
         session_id = str(uuid.uuid4())
         token = generate_token(user['id'], session_id)
         
-        print(f"Generated token for user: {user['username']}, session: {session_id}")
-        
         # Create chat session
         try:
             chat_service.create_session(user['id'], session_id)
-            print(f"Chat session created: {session_id}")
-        except Exception as e:
-            print(f"Error creating chat session: {e}")
+            logger.info("User %s logged in, chat session %s", user['id'], session_id)
+        except Exception:
+            logger.exception("Error creating chat session")
         
         return jsonify({
             'success': True,
@@ -138,7 +280,7 @@ def login():
             'session_id': session_id
         })
     else:
-        print("Authentication failed")
+        logger.info("Login failed for %r", data['username'])
         return jsonify({
             'success': False,
             'message': 'Invalid username or password'
@@ -150,59 +292,29 @@ def logout():
     if request.method == 'OPTIONS':
         return '', 200
         
-    print(f"Logout request")
     return jsonify({'success': True, 'message': 'Logged out successfully'})
 
 @app.route('/api/chat', methods=['POST', 'OPTIONS'])
+@token_required
 def chat():
     """Chat endpoint for processing user messages"""
-    # Handle OPTIONS request FIRST, before token validation
     if request.method == 'OPTIONS':
-        print("✅ OPTIONS request for /api/chat - returning 200")
         return '', 200
     
-    # Apply token validation only for non-OPTIONS requests
-    token = None
-    if 'Authorization' in request.headers:
-        auth_header = request.headers['Authorization']
-        if auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-    
-    if not token:
-        print("❌ No token provided")
-        return jsonify({'success': False, 'message': 'Token is missing!'}), 401
-    
+    session_id = g.session_id
     try:
-        # Decode the token
-        data = jwt.decode(token, app.secret_key, algorithms=['HS256'])
-        user_id = data['user_id']
-        session_id = data['session_id']
-        
-        print(f"✅ Token authenticated for user_id: {user_id}")
-        
-        # Verify user exists
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, username, email FROM users WHERE id = ?', (user_id,))
-        user = cursor.fetchone()
-        conn.close()
-        
-        if not user:
-            return jsonify({'success': False, 'message': 'Invalid token!'}), 401
-        
         # Process chat message
         request_data = request.get_json()
         if not request_data or 'message' not in request_data:
             return jsonify({'success': False, 'message': 'Message is required'}), 400
         
         user_message = request_data['message']
-        print(f"✅ Processing message: '{user_message}'")
         
         # Save user message
         chat_service.save_message(session_id, 'user', user_message)
         
         # Get chat history
-        chat_history = chat_service.get_chat_history(session_id)
+        chat_history = load_chat_history(session_id)
         
         # Process with chatbot service
         result = chatbot_service.process_user_message(user_message, chat_history)
@@ -212,8 +324,14 @@ def chat():
             return jsonify({
                 'success': True,
                 'response': result['response'],
-                'products': result['products']
+                'products': chat_products(result['products'])
             })
+        elif result.get('overloaded'):
+            return jsonify({
+                'success': False,
+                'message': result['response'],
+                'error': result['error']
+            }), 503, {'Retry-After': '2'}
         else:
             return jsonify({
                 'success': False,
@@ -221,12 +339,123 @@ def chat():
                 'error': result.get('error', 'Unknown error')
             }), 500
             
-    except jwt.ExpiredSignatureError:
-        return jsonify({'success': False, 'message': 'Token has expired!'}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({'success': False, 'message': 'Token is invalid!'}), 401
     except Exception as e:
-        print(f"❌ Chat endpoint error: {e}")
+        logger.exception("Chat endpoint error")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+
+# Largest /api/chat/batch request; bigger jobs are split by the client
+CHAT_BATCH_MAX_ITEMS = 1000
+
+def load_chat_history(session_id):
+    """Prompt history of a session: its rolling summary and recent turns, or just the last messages"""
+    if conversation_memory:
+        return conversation_memory.history(session_id)
+    return chat_service.get_recent_messages(session_id, CHAT_CONTEXT_MESSAGES)
+
+def chat_products(products):
+    """Chat product cards in the same shape as the catalog endpoints"""
+    return [product_payload(product) for product in products]
+
+def sse_event(event, data):
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST', 'OPTIONS'])
+@token_required
+def chat_stream():
+    """Chat endpoint that streams the response as Server-Sent Events"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    session_id = g.session_id
+    try:
+        request_data = request.get_json()
+        if not request_data or 'message' not in request_data:
+            return jsonify({'success': False, 'message': 'Message is required'}), 400
+        
+        user_message = request_data['message']
+        chat_service.save_message(session_id, 'user', user_message)
+        chat_history = load_chat_history(session_id)
+    except Exception as e:
+        logger.exception("Chat stream error")
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }), 500
+    
+    def generate():
+        for event, payload in chatbot_service.stream_user_message(user_message, chat_history):
+            if event == 'done':
+                # Persist the bot reply once the stream has completed
+                chat_service.save_message(session_id, 'bot', payload['response'])
+                # The prompt report and cache flags stay server-side
+                payload = {'success': True, 'response': payload['response']}
+            elif event == 'products':
+                payload = chat_products(payload)
+            yield sse_event(event, payload)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/chat/batch', methods=['POST', 'OPTIONS'])
+def chat_batch():
+    """Answer many chat messages in one call (requires X-Admin-Key)
+    
+    Body: {"items": [{"message": "...", "session_id": "...", "user_id": 1}]}.
+    session_id is optional and adds that session's history as context; it
+    must come with the user_id that owns the session. Nothing is saved to
+    the sessions. Results come back in item order, each with its own
+    success flag.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    if not has_admin_key(request.headers):
+        return jsonify({'success': False, 'message': 'Admin key is missing or invalid'}), 403
+    
+    request_data = request.get_json(silent=True) or {}
+    items = request_data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': 'A non-empty items list is required'}), 400
+    if len(items) > CHAT_BATCH_MAX_ITEMS:
+        return jsonify({'success': False, 'message': f'At most {CHAT_BATCH_MAX_ITEMS} items per batch'}), 400
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('message'), str) or not item['message'].strip():
+            return jsonify({'success': False, 'message': f'Item {position} needs a message'}), 400
+        # Loading history can schedule a summary, so only for sessions of the stated user
+        session_id = item.get('session_id')
+        if session_id and (item.get('user_id') is None
+                           or chat_service.get_session_owner(session_id) != item['user_id']):
+            return jsonify({
+                'success': False, 'message': f'Item {position}: session does not belong to user_id'
+            }), 403
+    
+    try:
+        batch = [{
+            'message': item['message'],
+            'history': load_chat_history(item['session_id']) if item.get('session_id') else None
+        } for item in items]
+        results = chatbot_service.process_batch(batch)
+        
+        return jsonify({
+            'success': True,
+            'results': [{
+                'success': result['success'],
+                'response': result['response'],
+                'products': chat_products(result['products']),
+                **({} if result['success'] else {'error': result['error']})
+            } for result in results]
+        })
+    except Exception as e:
+        logger.exception("Chat batch error")
         return jsonify({
             'success': False,
             'message': 'Internal server error',
@@ -234,6 +463,7 @@ def chat():
         }), 500
 
 @app.route('/api/products/search', methods=['GET', 'OPTIONS'])
+@catalog_cacheable
 def search_products():
     """Search products endpoint (public)"""
     if request.method == 'OPTIONS':
@@ -243,27 +473,59 @@ def search_products():
     category = request.args.get('category')
     min_price = request.args.get('min_price', type=float)
     max_price = request.args.get('max_price', type=float)
-    limit = request.args.get('limit', 20, type=int)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    brand = request.args.get('brand')
+    min_rating = request.args.get('min_rating', type=float)
+    
+    cursor = request.args.get('cursor')
     
     try:
-        products = product_service.search_products(
-            query, category, min_price, max_price, limit
+        page = product_service.search_products_page(
+            query, category, min_price, max_price, limit,
+            brand=brand, min_rating=min_rating, cursor=cursor
         )
         
-        return jsonify({
-            'success': True,
-            'products': products,
-            'count': len(products)
-        })
+        return json_text_response(product_json.document(
+            {'success': True, 'count': len(page['products']), 'next_cursor': page['next_cursor']},
+            raw={'products': product_json.array(page['products'], g.catalog_version)}
+        ))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
-        print(f"Product search error: {e}")
+        logger.exception("Product search error")
         return jsonify({
             'success': False,
             'message': 'Error searching products',
             'error': str(e)
         }), 500
 
+@app.route('/api/products/facets', methods=['GET', 'OPTIONS'])
+@catalog_cacheable
+def get_product_facets():
+    """Category, brand, price and rating counts for a search (public)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        result = product_service.get_facets(
+            request.args.get('q', ''),
+            category=request.args.get('category'),
+            brand=request.args.get('brand'),
+            min_price=request.args.get('min_price', type=float),
+            max_price=request.args.get('max_price', type=float),
+            min_rating=request.args.get('min_rating', type=float)
+        )
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        logger.exception("Product facets error")
+        return jsonify({
+            'success': False,
+            'message': 'Error computing facets',
+            'error': str(e)
+        }), 500
+
 @app.route('/api/products/<int:product_id>', methods=['GET', 'OPTIONS'])
+@catalog_cacheable
 def get_product(product_id):
     """Get single product by ID (public)"""
     if request.method == 'OPTIONS':
@@ -273,11 +535,13 @@ def get_product(product_id):
         product = product_service.get_product_by_id(product_id)
         
         if product:
-            return jsonify({'success': True, 'product': product})
+            return json_text_response(product_json.document(
+                {'success': True}, raw={'product': product_json.fragment(product, g.catalog_version)}
+            ))
         else:
             return jsonify({'success': False, 'message': 'Product not found'}), 404
     except Exception as e:
-        print(f"Get product error: {e}")
+        logger.exception("Get product error")
         return jsonify({
             'success': False,
             'message': 'Error retrieving product',
@@ -285,6 +549,7 @@ def get_product(product_id):
         }), 500
 
 @app.route('/api/categories', methods=['GET', 'OPTIONS'])
+@catalog_cacheable
 def get_categories():
     """Get all product categories (public)"""
     if request.method == 'OPTIONS':
@@ -294,37 +559,88 @@ def get_categories():
         categories = product_service.get_categories()
         return jsonify({'success': True, 'categories': categories})
     except Exception as e:
-        print(f"Get categories error: {e}")
+        logger.exception("Get categories error")
         return jsonify({
             'success': False,
             'message': 'Error retrieving categories',
             'error': str(e)
         }), 500
 
+@app.route('/api/cache/stats', methods=['GET', 'OPTIONS'])
+def get_cache_stats():
+    """Catalog query and LLM response cache hit/miss counters (X-Admin-Key or EXPOSE_DIAGNOSTICS)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    if not sees_diagnostics(request.headers):
+        return jsonify({'success': False, 'message': 'Admin key is missing or invalid'}), 403
+    
+    return jsonify({
+        'success': True,
+        'catalog': product_service.cache_stats(),
+        'snapshot': catalog_engine.stats() if catalog_engine else None,
+        'llm': chatbot_service.response_cache.stats()
+    })
+
+@app.route('/api/admin/catalog/import', methods=['POST', 'OPTIONS'])
+def import_catalog():
+    """Import a CSV/JSONL product feed (requires X-Admin-Key)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    if not has_admin_key(request.headers):
+        return jsonify({'success': False, 'message': 'Admin key is missing or invalid'}), 403
+    
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'success': False, 'message': 'A feed file is required'}), 400
+    
+    try:
+        fmt = request.args.get('format') or detect_format(upload.filename or '')
+        importer = CatalogImporter(
+            db,
+            batch_size=request.args.get('batch_size', 5000, type=int),
+            upsert=request.args.get('upsert', '1') != '0'
+        )
+        stats = importer.import_stream(
+            text_stream(upload.stream, upload.filename or ''), fmt, bulk=request.args.get('bulk') == '1'
+        )
+        return jsonify({'success': True, 'stats': stats})
+    except (ValueError, EOFError, gzip.BadGzipFile) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        logger.exception("Catalog import error")
+        return jsonify({
+            'success': False,
+            'message': 'Error importing catalog',
+            'error': str(e)
+        }), 500
+
 @app.route('/api/chat/history', methods=['GET', 'OPTIONS'])
+@token_required
 def get_chat_history():
-    """Get chat history for current session"""
+    """Get chat history for current session, newest page first (?before_id=&limit=)"""
     if request.method == 'OPTIONS':
         return '', 200
-        
-    # Token validation for protected endpoint
-    token = None
-    if 'Authorization' in request.headers:
-        auth_header = request.headers['Authorization']
-        if auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-    
-    if not token:
-        return jsonify({'success': False, 'message': 'Token is missing!'}), 401
     
     try:
-        data = jwt.decode(token, app.secret_key, algorithms=['HS256'])
-        session_id = data['session_id']
-        history = chat_service.get_chat_history(session_id)
+        session_id = g.session_id
+        before_id = request.args.get('before_id', type=int)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
         
-        return jsonify({'success': True, 'history': history})
+        # Read one extra message to know whether an older page exists
+        history = chat_service.get_chat_history(session_id, before_id=before_id, limit=limit + 1)
+        has_more = len(history) > limit
+        if has_more:
+            history = history[1:]
+        
+        return jsonify({
+            'success': True,
+            'history': history,
+            'next_before_id': history[0]['id'] if has_more else None
+        })
     except Exception as e:
-        print(f"Get chat history error: {e}")
+        logger.exception("Get chat history error")
         return jsonify({
             'success': False,
             'message': 'Error retrieving chat history',
@@ -332,34 +648,24 @@ def get_chat_history():
         }), 500
 
 @app.route('/api/chat/reset', methods=['POST', 'OPTIONS'])
+@token_required
 def reset_chat():
     """Reset chat session"""
     if request.method == 'OPTIONS':
         return '', 200
-        
-    # Token validation for protected endpoint
-    token = None
-    if 'Authorization' in request.headers:
-        auth_header = request.headers['Authorization']
-        if auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-    
-    if not token:
-        return jsonify({'success': False, 'message': 'Token is missing!'}), 401
     
     try:
-        data = jwt.decode(token, app.secret_key, algorithms=['HS256'])
-        user_id = data['user_id']
+        user_id = g.user['id']
         
         # Create new session
         new_session_id = str(uuid.uuid4())
         chat_service.create_session(user_id, new_session_id)
         
-        print(f"Chat session reset to: {new_session_id}")
+        logger.info("Chat session reset to %s", new_session_id)
         
         return jsonify({'success': True, 'message': 'Chat session reset'})
     except Exception as e:
-        print(f"Reset chat error: {e}")
+        logger.exception("Reset chat error")
         return jsonify({
             'success': False,
             'message': 'Error resetting chat',
@@ -368,27 +674,58 @@ def reset_chat():
 
 @app.route('/api/recommendations', methods=['GET', 'OPTIONS'])
 def get_recommendations():
-    """Get product recommendations (public)"""
+    """Get product recommendations (public; ?session_id= needs the session's owner)
+    
+    ?product_id= returns products similar to that product and ?session_id=
+    products related to what the session talked about, both read from the
+    precomputed neighbor tables. Otherwise top-rated products (?category=).
+    """
     if request.method == 'OPTIONS':
         return '', 200
-        
-    category = request.args.get('category')
-    limit = request.args.get('limit', 8, type=int)
+    if request.args.get('session_id'):
+        return get_session_recommendations(request.args['session_id'])
+    if request.args.get('product_id'):
+        product_id = request.args.get('product_id', type=int)
+        if product_id is None:
+            return jsonify({'success': False, 'message': 'product_id must be an integer'}), 400
+        return recommendations_response(product_id=product_id)
+    return get_catalog_recommendations()
+
+@catalog_cacheable
+def get_catalog_recommendations():
+    return recommendations_response(category=request.args.get('category'), version=g.catalog_version)
+
+def get_session_recommendations(session_id):
+    """Recommendations for a chat session, only for the user who owns it"""
+    try:
+        user, _ = auth.authenticate(request.headers.get('Authorization'), app.secret_key, user_service)
+    except auth.AuthError as e:
+        return jsonify({'success': False, 'message': str(e)}), 401
+    if chat_service.get_session_owner(session_id) != user['id']:
+        return jsonify({'success': False, 'message': 'Chat session not found'}), 404
+    response = recommendations_response(session_id=session_id)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def recommendations_response(version=None, **params):
+    """Product and session modes change with chat activity, so they carry no catalog ETag"""
+    if version is None:
+        version = db.catalog_version
+    limit = min(max(request.args.get('limit', 8, type=int), 1), 100)
     
     try:
-        products = chatbot_service.get_product_recommendations(category, limit)
+        products = chatbot_service.get_product_recommendations(limit=limit, **params)
         
-        return jsonify({
-            'success': True,
-            'products': products
-        })
+        return json_text_response(product_json.document(
+            {'success': True}, raw={'products': product_json.array(products, version)}
+        ))
     except Exception as e:
-        print(f"Get recommendations error: {e}")
-        return jsonify({
+        logger.exception("Get recommendations error")
+        return make_response(jsonify({
             'success': False,
             'message': 'Error getting recommendations',
             'error': str(e)
-        }), 500
+        }), 500)
 
 def create_sample_users():
     """Create sample users if they don't exist"""
@@ -402,37 +739,38 @@ def create_sample_users():
                 ('testuser', 'test@example.com', 'test123')
             ]
             
-            print("Creating sample users...")
+            logger.info("Creating sample users...")
             for username, email, password in users_to_add:
                 user_id = user_service.create_user(username, email, password)
                 if user_id:
-                    print(f"✅ Created user: {username}")
+                    logger.info("Created user: %s", username)
                 else:
-                    print(f"❌ Failed to create user: {username}")
-    except Exception as e:
-        print(f"Error creating sample users: {e}")
+                    logger.warning("Failed to create user: %s", username)
+    except Exception:
+        logger.exception("Error creating sample users")
 
 if __name__ == '__main__':
-    print("🚀 Starting E-commerce Chatbot API...")
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+    logger.info("Starting E-commerce Chatbot API...")
     
     # Populate database if it's empty
     try:
         from database import populate_sample_data
         test_products = product_service.search_products("", limit=1)
         if not test_products:
-            print("📦 Populating database with sample data...")
-            populate_sample_data()
+            logger.info("Populating database with sample data...")
+            populate_sample_data(db)
         else:
-            print(f"📦 Database already contains products")
+            logger.info("Database already contains products")
         
         create_sample_users()
             
-    except Exception as e:
-        print(f"❌ Error during startup: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Error during startup")
     
-    print("🎯 API ready at http://localhost:5000")
-    print("🔧 Debug mode enabled - check console for detailed logs")
+    logger.info("API ready at http://localhost:5000")
     
     app.run(debug=True, host='0.0.0.0', port=5000)
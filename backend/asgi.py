@@ -0,0 +1,198 @@
+"""ASGI serving mode
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The chat routes are served natively async: the Groq round-trip is awaited
+on AsyncGroq and SQLite work is pushed to worker threads, so one process can
+hold thousands of open conversations. All other routes are the Flask app
+itself, mounted through a WSGI adapter, so paths, auth and JSON shapes are
+identical in both modes.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import auth
+import timing
+from app import (
+    app as flask_app, ALLOWED_ORIGINS,
+    user_service, chat_service, chatbot_service, conversation_memory, recommendation_engine,
+    load_chat_history, chat_products, sees_diagnostics, sse_event
+)
+
+logger = logging.getLogger(__name__)
+
+def cors_headers(request):
+    """Same CORS headers the Flask after_request hook adds"""
+    origin = request.headers.get('origin')
+    if origin not in ALLOWED_ORIGINS:
+        return {}
+    return {
+        'Access-Control-Allow-Origin': origin,
+        'Access-Control-Allow-Credentials': 'true',
+        'Access-Control-Allow-Headers': 'Content-Type,Authorization,X-Requested-With',
+        'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS'
+    }
+
+def json_response(request, data, status_code=200):
+    headers = cors_headers(request)
+    with timing.timed('json_serialize'):
+        response = JSONResponse(data, status_code=status_code)
+    server_timing = timing.server_timing_header() if sees_diagnostics(request.headers) else None
+    if server_timing:
+        headers['Server-Timing'] = server_timing
+    response.headers.update(headers)
+    return response
+
+def timed_route(endpoint):
+    """Start request timing and record request metrics for a native route"""
+    def decorator(handler):
+        async def wrapper(request):
+            if request.method == 'OPTIONS':
+                return await handler(request)
+            started = time.perf_counter()
+            timing.start_request()
+            response = await handler(request)
+            # Streamed responses are measured up to the first byte
+            timing.finish_request(request.method, endpoint, response.status_code,
+                                  time.perf_counter() - started)
+            return response
+        wrapper.__doc__ = handler.__doc__
+        return wrapper
+    return decorator
+
+async def authenticate(request):
+    """Resolve (user_id, session_id) from the bearer token, or an error response"""
+    try:
+        claims = auth.verify_token(request.headers.get('authorization'), flask_app.secret_key)
+    except auth.AuthError as e:
+        return None, json_response(request, {'success': False, 'message': str(e)}, 401)
+
+    # Only leave the event loop when the principal cache misses
+    with timing.timed('user_lookup'):
+        user = user_service.get_cached_user(claims['user_id'])
+        if not user:
+            user = await asyncio.to_thread(user_service.get_user_by_id, claims['user_id'])
+    if not user:
+        return None, json_response(request, {'success': False, 'message': 'Invalid token!'}, 401)
+    return (user['id'], claims['session_id']), None
+
+async def read_message(request):
+    """Return the chat message from the JSON body, or None"""
+    try:
+        request_data = await request.json()
+    except ValueError:
+        return None
+    if not isinstance(request_data, dict) or 'message' not in request_data:
+        return None
+    return request_data['message']
+
+@timed_route('/api/chat')
+async def chat(request):
+    """Async /api/chat"""
+    if request.method == 'OPTIONS':
+        return Response(status_code=200, headers=cors_headers(request))
+
+    identity, error = await authenticate(request)
+    if error:
+        return error
+    _, session_id = identity
+
+    try:
+        user_message = await read_message(request)
+        if user_message is None:
+            return json_response(request, {'success': False, 'message': 'Message is required'}, 400)
+
+        await asyncio.to_thread(chat_service.save_message, session_id, 'user', user_message)
+        chat_history = await asyncio.to_thread(load_chat_history, session_id)
+
+        result = await chatbot_service.aprocess_user_message(user_message, chat_history)
+
+        if result['success']:
+            await asyncio.to_thread(chat_service.save_message, session_id, 'bot', result['response'])
+            return json_response(request, {
+                'success': True,
+                'response': result['response'],
+                'products': chat_products(result['products'])
+            })
+        if result.get('overloaded'):
+            response = json_response(request, {
+                'success': False,
+                'message': result['response'],
+                'error': result['error']
+            }, 503)
+            response.headers['Retry-After'] = '2'
+            return response
+        return json_response(request, {
+            'success': False,
+            'message': 'Error processing message',
+            'error': result.get('error', 'Unknown error')
+        }, 500)
+
+    except Exception as e:
+        logger.exception("Chat endpoint error")
+        return json_response(request, {
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }, 500)
+
+@timed_route('/api/chat/stream')
+async def chat_stream(request):
+    """Async /api/chat/stream (Server-Sent Events)"""
+    if request.method == 'OPTIONS':
+        return Response(status_code=200, headers=cors_headers(request))
+
+    identity, error = await authenticate(request)
+    if error:
+        return error
+    _, session_id = identity
+
+    try:
+        user_message = await read_message(request)
+        if user_message is None:
+            return json_response(request, {'success': False, 'message': 'Message is required'}, 400)
+
+        await asyncio.to_thread(chat_service.save_message, session_id, 'user', user_message)
+        chat_history = await asyncio.to_thread(load_chat_history, session_id)
+    except Exception as e:
+        logger.exception("Chat stream error")
+        return json_response(request, {
+            'success': False,
+            'message': 'Internal server error',
+            'error': str(e)
+        }, 500)
+
+    async def generate():
+        async for event, payload in chatbot_service.astream_user_message(user_message, chat_history):
+            if event == 'done':
+                await asyncio.to_thread(chat_service.save_message, session_id, 'bot', payload['response'])
+                payload = {'success': True, 'response': payload['response']}
+            elif event == 'products':
+                payload = chat_products(payload)
+            yield sse_event(event, payload)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', **cors_headers(request)}
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=headers)
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Commit queued chat messages and summaries before the server exits
+    if conversation_memory:
+        await asyncio.to_thread(conversation_memory.close)
+    await asyncio.to_thread(chat_service.close)
+    if recommendation_engine:
+        await asyncio.to_thread(recommendation_engine.close)
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/api/chat', chat, methods=['POST', 'OPTIONS']),
+    Route('/api/chat/stream', chat_stream, methods=['POST', 'OPTIONS']),
+    Mount('/', app=WSGIMiddleware(flask_app)),
+])
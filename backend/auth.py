@@ -0,0 +1,57 @@
+"""Bearer-token authentication shared by the Flask and ASGI apps
+
+The JWT is verified once per request and the user it names is resolved
+through the principal cache (see User.get_user_by_id), so a chat turn only
+touches the users table when the cache misses.
+"""
+from datetime import datetime, timedelta
+
+import jwt  # Make sure PyJWT is installed: pip install PyJWT
+
+import timing
+
+TOKEN_LIFETIME = timedelta(hours=24)
+
+class AuthError(Exception):
+    """The request is not authenticated; str(error) is the client-facing message"""
+
+def generate_token(user_id, session_id, secret):
+    """Generate JWT token for user"""
+    payload = {
+        'user_id': user_id,
+        'session_id': session_id,
+        'exp': datetime.utcnow() + TOKEN_LIFETIME,
+        'iat': datetime.utcnow()
+    }
+    return jwt.encode(payload, secret, algorithm='HS256')
+
+def bearer_token(authorization):
+    """Token from an 'Authorization: Bearer <token>' header value, or None"""
+    if authorization and authorization.startswith('Bearer '):
+        return authorization.split(' ')[1] or None
+    return None
+
+def verify_token(authorization, secret):
+    """Decode the bearer token's claims, raising AuthError if it is missing or invalid"""
+    token = bearer_token(authorization)
+    if not token:
+        raise AuthError('Token is missing!')
+    try:
+        with timing.timed('jwt_decode'):
+            claims = jwt.decode(token, secret, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        raise AuthError('Token has expired!')
+    except jwt.InvalidTokenError:
+        raise AuthError('Token is invalid!')
+    if 'user_id' not in claims or 'session_id' not in claims:
+        raise AuthError('Token is invalid!')
+    return claims
+
+def authenticate(authorization, secret, user_service):
+    """Return (user, session_id) for an Authorization header value, or raise AuthError"""
+    claims = verify_token(authorization, secret)
+    with timing.timed('user_lookup'):
+        user = user_service.get_user_by_id(claims['user_id'])
+    if not user:
+        raise AuthError('Invalid token!')
+    return user, claims['session_id']
@@ -0,0 +1,219 @@
+"""Streaming catalog importer for CSV and JSONL product feeds
+
+Usage: python catalog_import.py products.jsonl [--batch-size 5000] [--no-upsert]
+
+Rows are read, validated and written one batch at a time, so memory use
+stays flat no matter how large the feed is. Rows carrying a `sku` are
+upserted on it; rows without one are inserted. With --no-upsert, rows whose
+`sku` is already in the catalog are skipped and counted instead.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from models import Database, PRODUCT_FIELDS
+
+# Feeds at least this large drop secondary indexes and rebuild them at the end
+BULK_LOAD_BYTES = 50 * 1024 * 1024
+
+REQUIRED_FIELDS = ('name', 'category', 'price')
+
+class ImportRowError(ValueError):
+    """A feed row that cannot be imported"""
+
+def detect_format(filename):
+    """'csv' or 'jsonl' from a file name"""
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    raise ValueError(f'Cannot tell the feed format of {filename!r}; pass csv or jsonl')
+
+def open_feed(path):
+    """Open a feed file as text, transparently un-gzipping"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+def read_rows(stream, fmt):
+    """Yield (line_number, raw dict) from a text stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, ImportRowError(f'invalid JSON: {e}')
+    else:
+        raise ValueError(f'Unsupported feed format: {fmt}')
+
+def normalize_specifications(value):
+    """Store specifications as a compact JSON object string"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            # "key: value; key: value" or free text
+            pairs = [part.split(':', 1) for part in value.split(';') if ':' in part]
+            value = {key.strip(): val.strip() for key, val in pairs} if pairs else {'details': value.strip()}
+    if not isinstance(value, dict):
+        raise ImportRowError('specifications must be an object')
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+def normalize_row(raw):
+    """Validate one raw feed row and return the column values in PRODUCT_FIELDS order"""
+    if isinstance(raw, ImportRowError):
+        raise raw
+    if not isinstance(raw, dict):
+        raise ImportRowError('row is not an object')
+
+    row = {key.strip().lower(): (value.strip() if isinstance(value, str) else value)
+           for key, value in raw.items() if key}
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ImportRowError(f"missing {', '.join(missing)}")
+
+    try:
+        price = float(str(row['price']).replace('$', '').replace(',', ''))
+        stock = int(float(row.get('stock_quantity') or 0))
+        rating = float(row.get('rating') or 0.0)
+    except ValueError as e:
+        raise ImportRowError(f'bad number: {e}')
+    if price < 0 or stock < 0 or not 0 <= rating <= 5:
+        raise ImportRowError('price/stock must be >= 0 and rating within 0-5')
+
+    values = {
+        'name': str(row['name']),
+        'category': str(row['category']),
+        'price': round(price, 2),
+        'description': row.get('description') or None,
+        'stock_quantity': stock,
+        'brand': row.get('brand') or None,
+        'rating': round(rating, 1),
+        'image_url': row.get('image_url') or None,
+        'specifications': normalize_specifications(row.get('specifications')),
+        'sku': str(row['sku']) if row.get('sku') not in (None, '') else None,
+    }
+    return tuple(values[field] for field in PRODUCT_FIELDS)
+
+def batched(iterable, size):
+    """Yield lists of up to size items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class CatalogImporter:
+    def __init__(self, db, batch_size=5000, upsert=True, max_errors=100):
+        self.db = db
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.max_errors = max_errors
+
+    def import_file(self, path, fmt=None, bulk=None):
+        """Import a feed file; bulk=None decides from the file size"""
+        fmt = fmt or detect_format(path)
+        if bulk is None:
+            bulk = os.path.getsize(path) >= BULK_LOAD_BYTES
+        with open_feed(path) as stream:
+            return self.import_stream(stream, fmt, bulk=bulk)
+
+    def import_stream(self, stream, fmt, bulk=False):
+        """Import from an open text stream, return a stats dict"""
+        stats = {'rows_read': 0, 'imported': 0, 'skipped': 0, 'rejected': 0, 'batches': 0,
+                 'errors': [], 'bulk': bulk}
+        started = time.perf_counter()
+
+        if bulk:
+            with self.db.connection() as conn:
+                self.db.drop_bulk_load_indexes(conn.cursor())
+        try:
+            for batch in batched(self._valid_rows(read_rows(stream, fmt), stats), self.batch_size):
+                with self.db.connection() as conn:
+                    written = conn.executemany(self._insert_sql(), batch).rowcount
+                # Without upsert, rows hitting a known SKU are ignored rather than failing the batch
+                stats['imported'] += written
+                stats['skipped'] += len(batch) - written
+                stats['batches'] += 1
+        finally:
+            if bulk:
+                with self.db.connection() as conn:
+                    self.db.rebuild_bulk_load_indexes(conn.cursor())
+            if stats['imported']:
+                # Per-row tracking is not worth it here: derived data rebuilds
+                self.db.catalog_changed()
+
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        return stats
+
+    def _valid_rows(self, rows, stats):
+        """Normalize rows, counting and sampling the ones that fail"""
+        for line_number, raw in rows:
+            stats['rows_read'] += 1
+            try:
+                yield normalize_row(raw)
+            except ImportRowError as e:
+                stats['rejected'] += 1
+                if len(stats['errors']) < self.max_errors:
+                    stats['errors'].append({'line': line_number, 'error': str(e)})
+
+    def _insert_sql(self):
+        columns = ', '.join(PRODUCT_FIELDS)
+        placeholders = ', '.join('?' * len(PRODUCT_FIELDS))
+        if not self.upsert:
+            return f'INSERT OR IGNORE INTO products ({columns}) VALUES ({placeholders})'
+        updates = ', '.join(f'{field} = excluded.{field}' for field in PRODUCT_FIELDS if field != 'sku')
+        return (f'INSERT INTO products ({columns}) VALUES ({placeholders}) '
+                f'ON CONFLICT(sku) WHERE sku IS NOT NULL DO UPDATE SET {updates}')
+
+def text_stream(binary_stream, filename=''):
+    """Wrap an uploaded binary stream for read_rows, un-gzipping it like open_feed for .gz names"""
+    if filename.lower().endswith('.gz'):
+        return gzip.open(binary_stream, 'rt', encoding='utf-8', newline='')
+    return io.TextIOWrapper(binary_stream, encoding='utf-8', newline='')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import a CSV or JSONL product feed')
+    parser.add_argument('path', help='Feed file (.csv, .jsonl, optionally .gz)')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='Override format detection')
+    parser.add_argument('--db', default='ecommerce.db', help='SQLite database path')
+    parser.add_argument('--batch-size', type=int, default=5000, help='Rows per transaction')
+    parser.add_argument('--no-upsert', action='store_true', help='Only insert new products; skip rows whose SKU is already in the catalog')
+    bulk = parser.add_mutually_exclusive_group()
+    bulk.add_argument('--rebuild-indexes', dest='bulk', action='store_true', default=None,
+                      help='Drop and rebuild secondary/full-text indexes around the load')
+    bulk.add_argument('--keep-indexes', dest='bulk', action='store_false',
+                      help='Maintain indexes row by row')
+    args = parser.parse_args(argv)
+
+    importer = CatalogImporter(Database(args.db), batch_size=args.batch_size, upsert=not args.no_upsert)
+    stats = importer.import_file(args.path, fmt=args.format, bulk=args.bulk)
+
+    print(f"Imported {stats['imported']} of {stats['rows_read']} rows "
+          f"in {stats['batches']} batches ({stats['seconds']}s), "
+          f"{stats['skipped']} skipped (known SKU), {stats['rejected']} rejected")
+    for error in stats['errors']:
+        print(f"  line {error['line']}: {error['error']}")
+    return 0 if stats['imported'] or stats['skipped'] or not stats['rows_read'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
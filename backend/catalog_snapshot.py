@@ -0,0 +1,205 @@
+"""In-memory columnar snapshot of the product catalog
+
+Enable with CATALOG_SNAPSHOT=1. Product reads (by ID, filtered listings and
+top-N by rating) are then answered from NumPy columns instead of SQLite:
+
+- price, rating and stock are NumPy arrays, category and brand are codes
+  into interned value lists, and IDs map to row offsets through a sorted
+  ID array.
+- Rows are stored in listing order (rating DESC, name, id), so the first N
+  offsets of a filter mask are already the top N.
+
+A snapshot is immutable and tagged with the catalog_version it was loaded
+at. Catalog writes make it stale: reads fall back to SQLite while a
+replacement loads in the background, which is then swapped in with a
+single reference assignment.
+"""
+import logging
+import sys
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SQL = '''
+    SELECT id, name, category, price, description, stock_quantity,
+           brand, rating, image_url, specifications
+    FROM products ORDER BY rating_rank, name, id
+'''
+
+# First block scanned by CatalogSnapshot.filter; each following block is 4x larger
+FILTER_BLOCK_ROWS = 2048
+
+class CatalogSnapshot:
+    def __init__(self, rows, version):
+        self.version = version
+        self.loaded_at = time.time()
+        columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in range(10)]
+        (ids, names, categories, prices, descriptions, stock,
+         brands, ratings, image_urls, specifications) = columns
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.ratings = np.asarray([rating or 0.0 for rating in ratings], dtype=np.float64)
+        self.stock = np.asarray([quantity or 0 for quantity in stock], dtype=np.int64)
+        self.category_values, self.category_codes = self._encode(categories)
+        self.brand_values, self.brand_codes = self._encode(brands)
+        self.names = [sys.intern(name) for name in names]
+        self.descriptions = descriptions
+        self.image_urls = image_urls
+        self.specifications = specifications
+
+        # Sorted IDs for id -> offset lookups
+        self._id_order = np.argsort(self.ids, kind='stable')
+        self._sorted_ids = self.ids[self._id_order]
+
+    @classmethod
+    def load(cls, db):
+        """Read the whole catalog in listing order"""
+        version = db.catalog_version
+        with db.connection('catalog_snapshot') as conn:
+            rows = conn.execute(SNAPSHOT_SQL).fetchall()
+        return cls(rows, version)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def offset(self, product_id):
+        """Row offset of a product ID, or None"""
+        position = np.searchsorted(self._sorted_ids, product_id)
+        if position < len(self._sorted_ids) and self._sorted_ids[position] == product_id:
+            return int(self._id_order[position])
+        return None
+
+    def product(self, offset):
+        """A product dict shaped like Product._format_product"""
+        category = self.category_codes[offset]
+        brand = self.brand_codes[offset]
+        return {
+            'id': int(self.ids[offset]),
+            'name': self.names[offset],
+            'category': self.category_values[category],
+            'price': float(self.prices[offset]),
+            'description': self.descriptions[offset],
+            'stock_quantity': int(self.stock[offset]),
+            'brand': self.brand_values[brand] if brand >= 0 else None,
+            'rating': float(self.ratings[offset]),
+            'image_url': self.image_urls[offset],
+            'specifications': self.specifications[offset]
+        }
+
+    def sort_key(self, offset):
+        """(rating_rank, name, id) of a row, as used by listing cursors"""
+        return [-float(self.ratings[offset]), self.names[offset], int(self.ids[offset])]
+
+    def filter(self, category=None, brand=None, min_price=None, max_price=None, min_rating=None,
+               after_offset=None, limit=20):
+        """Offsets of the first `limit` matching rows in listing order, and whether more match
+
+        Filters follow Product._filter_sql: falsy values are ignored. Masks are
+        evaluated over growing blocks from the start position, so a shallow
+        page stops as soon as it has limit + 1 hits instead of scanning every row.
+        """
+        conditions = []
+        for values, codes, wanted in ((self.category_values, self.category_codes, category),
+                                      (self.brand_values, self.brand_codes, brand)):
+            if wanted:
+                code = self._code(values, wanted)
+                if code is None:
+                    return [], False
+                conditions.append(lambda rows, codes=codes, code=code: codes[rows] == code)
+        if min_price:
+            conditions.append(lambda rows: self.prices[rows] >= min_price)
+        if max_price:
+            conditions.append(lambda rows: self.prices[rows] <= max_price)
+        if min_rating:
+            conditions.append(lambda rows: self.ratings[rows] >= min_rating)
+
+        found = []
+        start = 0 if after_offset is None else after_offset + 1
+        block = FILTER_BLOCK_ROWS
+        while start < len(self.ids) and len(found) <= limit:
+            rows = slice(start, start + block)
+            mask = np.ones(min(block, len(self.ids) - start), dtype=bool)
+            for condition in conditions:
+                mask &= condition(rows)
+            found.extend((np.flatnonzero(mask) + start)[:limit + 1 - len(found)].tolist())
+            start += block
+            block *= 4
+        return found[:limit], len(found) > limit
+
+    def _code(self, values, value):
+        position = np.searchsorted(values, value)
+        if position < len(values) and values[position] == value:
+            return int(position)
+        return None
+
+    def _encode(self, values):
+        """Sorted distinct values and an int32 code per row (-1 for None)"""
+        distinct = np.array(sorted({sys.intern(value) for value in values if value is not None}), dtype=object)
+        lookup = {value: code for code, value in enumerate(distinct)}
+        codes = np.fromiter((lookup.get(value, -1) for value in values), dtype=np.int32, count=len(values))
+        return distinct, codes
+
+class CatalogSnapshotEngine:
+    """Owns the current snapshot and reloads it in the background after catalog writes"""
+
+    def __init__(self, db):
+        self.db = db
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._loading = False
+        self._reload_requested = False
+        db.add_catalog_listener(self._on_catalog_changed)
+
+    def start(self):
+        """Load the first snapshot synchronously and start serving reads from it"""
+        self._snapshot = CatalogSnapshot.load(self.db)
+        self.db.catalog_engine = self
+        logger.info("Catalog snapshot loaded with %d products", len(self._snapshot))
+        return self
+
+    def current(self):
+        """The snapshot if it reflects the latest catalog, else None (and reload)"""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self.db.catalog_version:
+            return snapshot
+        self._schedule_reload(repeat=False)
+        return None
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'products': len(snapshot) if snapshot else 0,
+            'version': snapshot.version if snapshot else None,
+            'fresh': snapshot is not None and snapshot.version == self.db.catalog_version,
+            'age_seconds': round(time.time() - snapshot.loaded_at, 3) if snapshot else None
+        }
+
+    def _on_catalog_changed(self, product_ids):
+        self._schedule_reload()
+
+    def _schedule_reload(self, repeat=True):
+        """Start a background reload; with repeat, a running one goes again when done"""
+        with self._lock:
+            if self._loading:
+                self._reload_requested = self._reload_requested or repeat
+                return
+            self._loading = True
+        threading.Thread(target=self._reload, name='catalog-snapshot', daemon=True).start()
+
+    def _reload(self):
+        while True:
+            try:
+                snapshot = CatalogSnapshot.load(self.db)
+                # Atomic swap: readers see either the old or the new snapshot
+                self._snapshot = snapshot
+            except Exception:
+                logger.exception("Catalog snapshot reload failed")
+            with self._lock:
+                if not self._reload_requested:
+                    self._loading = False
+                    return
+                self._reload_requested = False
@@ -0,0 +1,197 @@
+"""Chat sessions and messages spread over several SQLite shard files
+
+Enable with CHAT_SHARDS=N. Each session lives entirely in one shard file,
+chosen by a jump consistent hash of its session_id, and each shard has its
+own connection pool and write-behind MessageWriter. Chat commits then
+proceed in parallel across shards and never hold the catalog database's
+write lock.
+
+Existing chat data is moved with:
+
+    python chat_shards.py migrate --shards 8                  # main database -> 8 shards
+    python chat_shards.py migrate --from-shards 8 --shards 16 # rebalance 8 -> 16
+
+Run migrations while the server is stopped. Jump hashing moves only the
+sessions whose shard changes: growing from 8 to 16 shards moves about half
+of them, and every move goes from an old shard to a new one.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+from message_writer import MessageWriter
+from models import Database, create_chat_tables
+
+# Sessions moved per transaction by the migration tool
+MIGRATE_BATCH_SESSIONS = 500
+
+def shard_key(session_id):
+    """Stable 64-bit key of a session ID (independent of PYTHONHASHSEED)"""
+    return int.from_bytes(hashlib.blake2b(session_id.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def jump_hash(key, buckets):
+    """Lamping & Veach jump consistent hash of a 64-bit key into [0, buckets)"""
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+def shard_index(session_id, count):
+    return jump_hash(shard_key(session_id), count)
+
+def shard_path(directory, index):
+    return os.path.join(directory, f'chat-{index:03d}.db')
+
+class ChatShardDatabase(Database):
+    """A pooled Database whose schema is only the chat tables"""
+
+    def init_database(self):
+        conn = self.get_connection()
+        try:
+            create_chat_tables(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+
+class ChatShards:
+    def __init__(self, directory, count, pool_size=4):
+        if count < 1:
+            raise ValueError('ChatShards needs at least one shard')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.databases = [ChatShardDatabase(shard_path(directory, index), pool_size=pool_size)
+                          for index in range(count)]
+        self.writers = [None] * count
+
+    def __len__(self):
+        return len(self.databases)
+
+    def index(self, session_id):
+        return shard_index(session_id, len(self.databases))
+
+    def route(self, session_id):
+        """(database, writer) of the shard holding a session"""
+        index = self.index(session_id)
+        return self.databases[index], self.writers[index]
+
+    def start_writers(self, **options):
+        """Give every shard its own write-behind MessageWriter"""
+        self.writers = [MessageWriter(db, **options).start() for db in self.databases]
+        return self
+
+    def close(self):
+        for writer in self.writers:
+            if writer:
+                writer.close()
+
+def migrate(source_dbs, target_dir, count, batch_sessions=MIGRATE_BATCH_SESSIONS):
+    """Move every session in source_dbs to its shard among `count` in target_dir
+
+    source_dbs are (database, shard index or None) pairs; a session already in
+    its target shard stays put. A session is copied and then deleted from its
+    source, so an interrupted run can simply be started again: the partial
+    copy left in the target shard is replaced on the next run.
+    """
+    targets = ChatShards(target_dir, count)
+    stats = {'sessions': 0, 'moved': 0, 'messages': 0}
+    for source, source_index in source_dbs:
+        with source.connection() as conn:
+            session_ids = [row[0] for row in conn.execute('SELECT session_id FROM chat_sessions')]
+            # Messages whose session row is missing still belong somewhere
+            session_ids += [row[0] for row in conn.execute('''
+                SELECT DISTINCT session_id FROM chat_messages
+                WHERE session_id NOT IN (SELECT session_id FROM chat_sessions)
+            ''')]
+        stats['sessions'] += len(session_ids)
+
+        by_target = {}
+        for session_id in session_ids:
+            index = targets.index(session_id)
+            if index != source_index:
+                by_target.setdefault(index, []).append(session_id)
+
+        for index, moving in by_target.items():
+            target = targets.databases[index]
+            for start in range(0, len(moving), batch_sessions):
+                batch = moving[start:start + batch_sessions]
+                stats['messages'] += _move_sessions(source, target, batch)
+                stats['moved'] += len(batch)
+    return stats
+
+def _move_sessions(source, target, session_ids):
+    placeholders = ','.join('?' * len(session_ids))
+    with source.connection() as conn:
+        sessions = conn.execute(f'''
+            SELECT user_id, session_id, created_at FROM chat_sessions
+            WHERE session_id IN ({placeholders})
+        ''', session_ids).fetchall()
+        # Inserted in ID order, so each session keeps its message order in the target
+        messages = conn.execute(f'''
+            SELECT session_id, message_type, content, timestamp FROM chat_messages
+            WHERE session_id IN ({placeholders}) ORDER BY id
+        ''', session_ids).fetchall()
+        # Message IDs differ per shard, so a summary's through_id travels as a message count
+        summaries = conn.execute(f'''
+            SELECT session_id, summary, (
+                SELECT COUNT(*) FROM chat_messages
+                WHERE chat_messages.session_id = chat_summaries.session_id AND id <= through_id
+            ) FROM chat_summaries WHERE session_id IN ({placeholders})
+        ''', session_ids).fetchall()
+
+    with target.connection() as conn:
+        _delete_sessions(conn, placeholders, session_ids)
+        conn.executemany(
+            'INSERT INTO chat_sessions (user_id, session_id, created_at) VALUES (?, ?, ?)', sessions
+        )
+        conn.executemany('''
+            INSERT INTO chat_messages (session_id, message_type, content, timestamp)
+            VALUES (?, ?, ?, ?)
+        ''', messages)
+        for session_id, summary, folded in summaries:
+            row = conn.execute('''
+                SELECT id FROM chat_messages WHERE session_id = ? ORDER BY id LIMIT 1 OFFSET ?
+            ''', (session_id, folded - 1)).fetchone() if folded else None
+            if row:
+                conn.execute(
+                    'INSERT INTO chat_summaries (session_id, summary, through_id) VALUES (?, ?, ?)',
+                    (session_id, summary, row[0])
+                )
+
+    with source.connection() as conn:
+        _delete_sessions(conn, placeholders, session_ids)
+    return len(messages)
+
+def _delete_sessions(conn, placeholders, session_ids):
+    for table in ('chat_summaries', 'chat_messages', 'chat_sessions'):
+        conn.execute(f'DELETE FROM {table} WHERE session_id IN ({placeholders})', session_ids)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move chat sessions into shard files or rebalance shards')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='Move sessions to their shard for --shards')
+    migrate_parser.add_argument('--db', default='ecommerce.db', help='Main SQLite database path')
+    migrate_parser.add_argument('--dir', default='chat_shards', help='Shard directory')
+    migrate_parser.add_argument('--shards', type=int, required=True, help='Shard count to migrate to')
+    migrate_parser.add_argument('--from-shards', type=int, default=0,
+                                help='Current shard count (0: chat data is in the main database)')
+    args = parser.parse_args(argv)
+
+    if args.from_shards:
+        sources = [(ChatShardDatabase(shard_path(args.dir, index)), index) for index in range(args.from_shards)]
+    else:
+        sources = [(Database(args.db), None)]
+
+    started = time.perf_counter()
+    stats = migrate(sources, args.dir, args.shards)
+    print(f"Moved {stats['moved']} of {stats['sessions']} sessions ({stats['messages']} messages) "
+          f"into {args.shards} shards in {time.perf_counter() - started:.2f}s")
+    if args.from_shards > args.shards:
+        print(f"Shard files {args.shards}..{args.from_shards - 1} in {args.dir} are now empty and can be removed")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,95 +1,577 @@
+import asyncio
 import os
-from groq import Groq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from groq import Groq, AsyncGroq
 import json
 from models import Product
+from retrieval import ProductRetriever
+from response_cache import ResponseCache
+from prompt_builder import PromptBuilder, RETRY_COMPLETION_TOKENS
+from intent_router import IntentRouter
+from llm_gate import (
+    AsyncConcurrencyLimiter, AsyncSingleFlight, ConcurrencyLimiter, LLMOverloaded, SingleFlight
+)
+import timing
 import re
+
+# Number of most recent chat messages considered for the LLM context
+CHAT_CONTEXT_MESSAGES = 10
+
+FALLBACK_RESPONSE = "I apologize, but I'm having trouble processing your request right now. Please try again or contact our support team."
+
+# Product context sent when retrieval finds nothing for a message
+NO_PRODUCTS_CONTEXT = "No specific products found for this query."
+
+OVERLOADED_RESPONSE = "We're getting a lot of questions right now. Please try again in a few seconds."
+
+class LLMTruncated(Exception):
+    """The completion budget ran out before the model produced any answer"""
+
+class ResponseStreamFilter:
+    """Incrementally strip <think> blocks and an "Answer:" preamble from streamed text
+    
+    Streaming counterpart of the cleanup in process_user_message. Only a few
+    characters are held back at a time (a possible partial tag), except for
+    the first preamble_window visible characters, which are held until we know
+    whether they end in an "Answer:" marker.
+    """
+    THINK_OPEN = '<think>'
+    THINK_CLOSE = '</think>'
+    ANSWER_MARKER = 'Answer:'
+    
+    def __init__(self, preamble_window=160):
+        self.preamble_window = preamble_window
+        self._buffer = ''
+        self._head = ''
+        self._in_think = False
+        self._preamble_done = False
+        self._started = False
+    
+    def feed(self, text):
+        """Add raw model output, return the text that is safe to emit"""
+        self._buffer += text
+        out = []
+        while self._buffer:
+            if self._in_think:
+                end = self._buffer.find(self.THINK_CLOSE)
+                if end == -1:
+                    # Drop reasoning, keep only what could be a split closing tag
+                    self._buffer = self._buffer[-(len(self.THINK_CLOSE) - 1):]
+                    break
+                self._buffer = self._buffer[end + len(self.THINK_CLOSE):]
+                self._in_think = False
+                continue
+            
+            start = self._buffer.find(self.THINK_OPEN)
+            if start != -1:
+                out.append(self._visible(self._buffer[:start]))
+                self._buffer = self._buffer[start + len(self.THINK_OPEN):]
+                self._in_think = True
+                continue
+            
+            keep = self._partial_suffix(self._buffer, self.THINK_OPEN)
+            out.append(self._visible(self._buffer[:len(self._buffer) - keep]))
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            break
+        return ''.join(out)
+    
+    def flush(self):
+        """Return whatever is still held back once the stream has ended"""
+        out = '' if self._in_think else self._visible(self._buffer)
+        self._buffer = ''
+        if not self._preamble_done:
+            self._preamble_done = True
+            out += self._start(self._head.split(self.ANSWER_MARKER)[-1])
+            self._head = ''
+        return out
+    
+    def _visible(self, text):
+        """Route text outside <think> through the "Answer:" preamble check"""
+        if not text:
+            return ''
+        if self._preamble_done:
+            return self._start(text)
+        
+        self._head += text
+        if self.ANSWER_MARKER in self._head:
+            self._preamble_done = True
+            text = self._head.split(self.ANSWER_MARKER)[-1]
+        elif len(self._head) >= self.preamble_window:
+            self._preamble_done = True
+            text = self._head
+        else:
+            return ''
+        self._head = ''
+        return self._start(text)
+    
+    def _start(self, text):
+        """Drop leading whitespace before the first emitted character"""
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+    
+    @staticmethod
+    def _partial_suffix(text, tag):
+        """Length of the longest suffix of text that is a proper prefix of tag"""
+        for size in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+
 class ChatbotService:
     def __init__(self, db):
         self.db = db
         self.product_service = Product(db)
-        # Initialize Groq client
+        # Local semantic index over the catalog for chat retrieval
+        self.retriever = ProductRetriever(db, self.product_service, os.getenv('PRODUCT_INDEX_PATH'))
+        # Answers to repeated questions over unchanged product context
+        self.response_cache = ResponseCache(
+            db,
+            maxsize=int(os.getenv('LLM_CACHE_SIZE', 4096)),
+            ttl=int(os.getenv('LLM_CACHE_TTL', 3600)),
+            persist=os.getenv('LLM_CACHE_PERSIST', '0') == '1',
+            history_messages=CHAT_CONTEXT_MESSAGES
+        )
+        # Optional RecommendationEngine serving precomputed neighbor lists
+        self.recommender = None
+        # Packs instructions, product context and history into a token budget
+        self.prompt_builder = PromptBuilder(
+            input_budget=int(os.getenv('PROMPT_INPUT_BUDGET', 3000)),
+            max_history_messages=CHAT_CONTEXT_MESSAGES
+        )
+        # Initialize Groq clients (the async one is only created by the ASGI server)
         self.client = Groq(api_key=os.getenv('GROQ_API_KEY'))
+        self._async_client = None
+        # Upstream admission: identical in-flight prompts share a call, the rest queue for a slot
+        self.llm_limits = {
+            'max_concurrent': int(os.getenv('LLM_MAX_CONCURRENCY', 16)),
+            'max_queue': int(os.getenv('LLM_MAX_QUEUE', 64)),
+            'queue_timeout': float(os.getenv('LLM_QUEUE_TIMEOUT', 10))
+        }
+        self.llm_limiter = ConcurrencyLimiter(**self.llm_limits)
+        self.llm_flight = SingleFlight()
+        self._async_llm_limiter = None
+        self.async_llm_flight = AsyncSingleFlight()
+        # Stock, price, category and product-detail questions answered from the catalog
+        self.intent_router = IntentRouter(self.product_service) if os.getenv('INTENT_ROUTER', '1') != '0' else None
+    
+    @property
+    def async_client(self):
+        """AsyncGroq client, created on first use inside the running event loop"""
+        if self._async_client is None:
+            self._async_client = AsyncGroq(api_key=os.getenv('GROQ_API_KEY'))
+        return self._async_client
+    
+    @property
+    def async_llm_limiter(self):
+        """Async concurrency limiter, created on first use inside the running event loop"""
+        if self._async_llm_limiter is None:
+            self._async_llm_limiter = AsyncConcurrencyLimiter(**self.llm_limits)
+        return self._async_llm_limiter
         
     def process_user_message(self, user_message, chat_history=None):
         """Process user message and return chatbot response with product recommendations"""
         try:
-            # Get product context for the AI
-            products_context = self._get_products_context(user_message)
-            
-            # Prepare system prompt
-            system_prompt = f"""
-            You are a helpful e-commerce sales assistant. Your role is to help customers find products, answer questions about products, and guide them through their shopping experience.
-            
-            Available product categories: Electronics, Books, Clothing, Home & Garden, Sports & Outdoors
-            
-            Current product context based on user query:
-            {products_context}
-            
-            Instructions:
-            1. Be friendly, helpful, and professional
-            2. When recommending products, mention specific product names, prices, and key features
-            3. Ask clarifying questions to better understand customer needs
-            4. Provide product comparisons when relevant
-            5. Guide users through the shopping process
-            6. If asked about products not in our inventory, politely explain we don't carry them but suggest alternatives
-            7. Keep responses concise but informative
-            8. Always try to be helpful and sales-oriented while being genuine
-            """
-            
-            # Prepare messages for Groq API
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            # Add chat history if available
-            if chat_history:
-                for msg in chat_history[-10:]:  # Last 10 messages for context
-                    if msg['type'] == 'user':
-                        messages.append({"role": "user", "content": msg['content']})
-                    elif msg['type'] == 'bot':
-                        messages.append({"role": "assistant", "content": msg['content']})
-            
-            # Add current user message
-            messages.append({"role": "user", "content": user_message})
-            
-            # Get response from Groq
-            completion = self.client.chat.completions.create(
-                model="deepseek-r1-distill-llama-70b",
-                messages=messages,
-                temperature=0.6,
-                max_completion_tokens=4096,
-                top_p=0.95,
-                stream=False,
-                stop=None,
-            )
+            routed = self._route_intent(user_message)
+            if routed is not None:
+                return routed
             
-            bot_response = completion.choices[0].message.content
-            bot_response = re.sub(r"<think>.*?</think>", "", bot_response, flags=re.DOTALL).strip()
-            if "Answer:" in bot_response:           
-                
-                bot_response = bot_response.split("Answer:")[-1].strip()
+            # Get product context for the AI (or a cached answer for it)
+            products_context, cache_key, cached_response = self._prepare(user_message, chat_history)
+            if cached_response is not None:
+                return self._cached_result(user_message, cached_response)
+            
+            messages, prompt_report = self.prompt_builder.build(user_message, products_context, chat_history)
+            bot_response = self._complete(messages, prompt_report, cache_key)
             # Get relevant products for the response
             relevant_products = self._extract_relevant_products(user_message)
             
             return {
                 'response': bot_response,
                 'products': relevant_products,
-                'success': True
+                'success': True,
+                'prompt': prompt_report
             }
             
         except Exception as e:
+            return self._error_result(e)
+    
+    def process_batch(self, items, max_workers=None):
+        """Answer many messages at once, returning one result per item in item order
+        
+        items are dicts with a 'message' and optionally a 'history' (chat
+        history as passed to process_user_message). Intent routing and
+        retrieval run over the whole batch first, then the LLM calls fan out
+        over at most max_workers threads (default: the LLM concurrency limit).
+        A failing item gets an error result without affecting the others.
+        """
+        results = [None] * len(items)
+        pending = []
+        for position, item in enumerate(items):
+            try:
+                results[position] = self._route_intent(item['message'])
+            except Exception as e:
+                results[position] = self._error_result(e)
+            if results[position] is None:
+                pending.append(position)
+        
+        try:
+            with timing.timed('retrieval'):
+                found = self.retriever.search_batch([items[position]['message'] for position in pending], limit=6)
+        except Exception as e:
+            for position in pending:
+                results[position] = self._error_result(e)
+            return results
+        
+        calls = []
+        for position, products in zip(pending, found):
+            user_message, chat_history = items[position]['message'], items[position].get('history')
+            try:
+                products_context = self._format_products_context(products[:5])
+                cache_key = self.response_cache.make_key(user_message, products_context, chat_history)
+                cached_response = self.response_cache.get(cache_key)
+                if cached_response is not None:
+                    results[position] = {
+                        'response': cached_response,
+                        'products': products,
+                        'success': True,
+                        'cached': True
+                    }
+                    continue
+                messages, prompt_report = self.prompt_builder.build(user_message, products_context, chat_history)
+                calls.append((position, products, messages, prompt_report, cache_key))
+            except Exception as e:
+                results[position] = self._error_result(e)
+        
+        def answer(call):
+            position, products, messages, prompt_report, cache_key = call
+            try:
+                return position, {
+                    'response': self._complete(messages, prompt_report, cache_key),
+                    'products': products,
+                    'success': True,
+                    'prompt': prompt_report
+                }
+            except Exception as e:
+                return position, self._error_result(e)
+        
+        if calls:
+            workers = min(max_workers or self.llm_limits['max_concurrent'], len(calls))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chat-batch') as pool:
+                for position, result in pool.map(answer, calls):
+                    results[position] = result
+        return results
+    
+    async def aprocess_user_message(self, user_message, chat_history=None):
+        """Async variant of process_user_message for the ASGI server
+        
+        The Groq call is awaited on the async client; retrieval and other
+        SQLite work runs in worker threads so the event loop never blocks.
+        """
+        try:
+            routed = await asyncio.to_thread(self._route_intent, user_message)
+            if routed is not None:
+                return routed
+            
+            products_context, cache_key, cached_response = await asyncio.to_thread(
+                self._prepare, user_message, chat_history
+            )
+            if cached_response is not None:
+                return await asyncio.to_thread(self._cached_result, user_message, cached_response)
+            
+            messages, prompt_report = self.prompt_builder.build(user_message, products_context, chat_history)
+            
+            completion = await self._acreate(messages, prompt_report, cache_key)
+            bot_response, truncated = self._completion_text(completion)
+            if truncated and not bot_response:
+                completion = await self._acreate(*self._retry_args(messages, prompt_report, cache_key))
+                bot_response, truncated = self._completion_text(completion)
+            bot_response = await asyncio.to_thread(self._finish, cache_key, bot_response, truncated)
+            relevant_products = await asyncio.to_thread(self._extract_relevant_products, user_message)
+            
             return {
-                'response': "I apologize, but I'm having trouble processing your request right now. Please try again or contact our support team.",
+                'response': bot_response,
+                'products': relevant_products,
+                'success': True,
+                'prompt': prompt_report
+            }
+            
+        except Exception as e:
+            return self._error_result(e)
+    
+    def stream_user_message(self, user_message, chat_history=None):
+        """Stream the chatbot response as (event, data) pairs
+        
+        Yields a 'products' event straight from the catalog before the LLM is
+        called, then 'token' events with cleaned answer text as it arrives,
+        and finally 'done' with the full response (or 'error').
+        """
+        try:
+            routed = self._route_intent(user_message)
+            if routed is not None:
+                yield from self._routed_events(routed)
+                return
+            
+            yield 'products', self._extract_relevant_products(user_message)
+            
+            products_context, cache_key, cached_response = self._prepare(user_message, chat_history)
+            if cached_response is not None:
+                yield 'token', cached_response
+                yield 'done', {'response': cached_response, 'success': True, 'cached': True}
+                return
+            
+            messages, prompt_report = self.prompt_builder.build(user_message, products_context, chat_history)
+            response_filter = ResponseStreamFilter()
+            parts = []
+            finish_reason = None
+            with self.llm_limiter.slot(), timing.timed('llm'):
+                started = time.perf_counter()
+                stream = self.client.chat.completions.create(
+                    **self._completion_args(messages, prompt_report, stream=True)
+                )
+                for chunk in stream:
+                    if started:
+                        timing.record('llm_ttft', time.perf_counter() - started)
+                        started = None
+                    finish_reason = self._finish_reason(chunk) or finish_reason
+                    text = self._filter_chunk(response_filter, chunk)
+                    if text:
+                        parts.append(text)
+                        yield 'token', text
+            
+            text = response_filter.flush()
+            if text:
+                parts.append(text)
+                yield 'token', text
+            
+            bot_response, truncated = ''.join(parts).strip(), finish_reason == 'length'
+            if truncated and not bot_response:
+                # Nothing was shown yet, so the retry can answer in one piece
+                completion = self._create(*self._retry_args(messages, prompt_report, cache_key))
+                bot_response, truncated = self._completion_text(completion)
+                if bot_response:
+                    yield 'token', bot_response
+            bot_response = self._finish(cache_key, bot_response, truncated)
+            yield 'done', {'response': bot_response, 'success': True, 'prompt': prompt_report}
+            
+        except Exception as e:
+            yield 'error', self._error_result(e)
+    
+    async def astream_user_message(self, user_message, chat_history=None):
+        """Async variant of stream_user_message, yielding the same events"""
+        try:
+            routed = await asyncio.to_thread(self._route_intent, user_message)
+            if routed is not None:
+                for event in self._routed_events(routed):
+                    yield event
+                return
+            
+            yield 'products', await asyncio.to_thread(self._extract_relevant_products, user_message)
+            
+            products_context, cache_key, cached_response = await asyncio.to_thread(
+                self._prepare, user_message, chat_history
+            )
+            if cached_response is not None:
+                yield 'token', cached_response
+                yield 'done', {'response': cached_response, 'success': True, 'cached': True}
+                return
+            
+            messages, prompt_report = self.prompt_builder.build(user_message, products_context, chat_history)
+            response_filter = ResponseStreamFilter()
+            parts = []
+            finish_reason = None
+            async with self.async_llm_limiter.slot():
+                with timing.timed('llm'):
+                    started = time.perf_counter()
+                    stream = await self.async_client.chat.completions.create(
+                        **self._completion_args(messages, prompt_report, stream=True)
+                    )
+                    async for chunk in stream:
+                        if started:
+                            timing.record('llm_ttft', time.perf_counter() - started)
+                            started = None
+                        finish_reason = self._finish_reason(chunk) or finish_reason
+                        text = self._filter_chunk(response_filter, chunk)
+                        if text:
+                            parts.append(text)
+                            yield 'token', text
+            
+            text = response_filter.flush()
+            if text:
+                parts.append(text)
+                yield 'token', text
+            
+            bot_response, truncated = ''.join(parts).strip(), finish_reason == 'length'
+            if truncated and not bot_response:
+                completion = await self._acreate(*self._retry_args(messages, prompt_report, cache_key))
+                bot_response, truncated = self._completion_text(completion)
+                if bot_response:
+                    yield 'token', bot_response
+            bot_response = await asyncio.to_thread(self._finish, cache_key, bot_response, truncated)
+            yield 'done', {'response': bot_response, 'success': True, 'prompt': prompt_report}
+            
+        except Exception as e:
+            yield 'error', self._error_result(e)
+    
+    def _route_intent(self, user_message):
+        """A locally answered result for simple catalog questions, or None"""
+        if self.intent_router is None:
+            return None
+        return self.intent_router.route(user_message)
+    
+    def _routed_events(self, routed):
+        """Stream events for a locally answered message"""
+        yield 'products', routed['products']
+        yield 'token', routed['response']
+        yield 'done', {'response': routed['response'], 'success': True, 'intent': routed['intent']}
+    
+    def _prepare(self, user_message, chat_history=None):
+        """Build product context and look up a cached answer for it"""
+        products_context = self._get_products_context(user_message)
+        cache_key = self.response_cache.make_key(user_message, products_context, chat_history)
+        return products_context, cache_key, self.response_cache.get(cache_key)
+    
+    def _complete(self, messages, prompt_report, cache_key):
+        """Answer from Groq, sharing an identical call already in flight, and cache it"""
+        bot_response, truncated = self._completion_text(self._create(messages, prompt_report, cache_key))
+        if truncated and not bot_response:
+            completion = self._create(*self._retry_args(messages, prompt_report, cache_key))
+            bot_response, truncated = self._completion_text(completion)
+        return self._finish(cache_key, bot_response, truncated)
+    
+    def _create(self, messages, prompt_report, flight_key):
+        """One non-streamed Groq completion, shared with identical calls in flight"""
+        def complete():
+            with self.llm_limiter.slot():
+                return self.client.chat.completions.create(
+                    **self._completion_args(messages, prompt_report, stream=False)
+                )
+        
+        with timing.timed('llm'):
+            completion, shared = self.llm_flight.do(flight_key, complete)
+        if not shared:
+            self._observe_usage(prompt_report, completion)
+        return completion
+    
+    async def _acreate(self, messages, prompt_report, flight_key):
+        """Async variant of _create"""
+        async def complete():
+            async with self.async_llm_limiter.slot():
+                return await self.async_client.chat.completions.create(
+                    **self._completion_args(messages, prompt_report, stream=False)
+                )
+        
+        with timing.timed('llm'):
+            completion, shared = await self.async_llm_flight.do(flight_key, complete)
+        if not shared:
+            self._observe_usage(prompt_report, completion)
+        return completion
+    
+    def _retry_args(self, messages, prompt_report, cache_key):
+        """Arguments for the one retry after the reasoning used up the whole budget"""
+        prompt_report['retried'] = True
+        prompt_report['max_completion_tokens'] = RETRY_COMPLETION_TOKENS
+        return messages, prompt_report, f'{cache_key}:retry'
+    
+    def _completion_text(self, completion):
+        """(cleaned answer, whether the completion stopped at its token limit)"""
+        choice = completion.choices[0]
+        return self._clean_response(choice.message.content or ''), self._finish_reason(completion) == 'length'
+    
+    def _finish(self, cache_key, bot_response, truncated):
+        """Cache a complete answer; a cut-off one is returned but not cached
+        
+        Raises LLMTruncated when there is no answer at all, so the caller
+        shows the fallback message instead of an empty reply.
+        """
+        if not bot_response:
+            raise LLMTruncated('The model ran out of completion tokens before answering')
+        if not truncated:
+            self.response_cache.set(cache_key, bot_response)
+        return bot_response
+    
+    def _cached_result(self, user_message, cached_response):
+        return {
+            'response': cached_response,
+            'products': self._extract_relevant_products(user_message),
+            'success': True,
+            'cached': True
+        }
+    
+    def _error_result(self, error):
+        if isinstance(error, LLMOverloaded):
+            return {
+                'response': OVERLOADED_RESPONSE,
                 'products': [],
                 'success': False,
-                'error': str(e)
+                'overloaded': True,
+                'error': str(error)
             }
+        return {
+            'response': FALLBACK_RESPONSE,
+            'products': [],
+            'success': False,
+            'error': str(error)
+        }
+    
+    def _completion_args(self, messages, prompt_report, stream):
+        """Groq chat completion parameters shared by every call path"""
+        return {
+            'model': "deepseek-r1-distill-llama-70b",
+            'messages': messages,
+            'temperature': 0.6,
+            'max_completion_tokens': prompt_report['max_completion_tokens'],
+            'top_p': 0.95,
+            'stream': stream,
+            'stop': None,
+        }
+    
+    def _observe_usage(self, prompt_report, completion):
+        """Record provider token counts and recalibrate the prompt estimate"""
+        usage = getattr(completion, 'usage', None)
+        if usage is None:
+            return
+        prompt_report['actual_input_tokens'] = usage.prompt_tokens
+        prompt_report['completion_tokens'] = usage.completion_tokens
+        self.prompt_builder.observe_usage(prompt_report['input_tokens'], usage.prompt_tokens)
+    
+    def _clean_response(self, bot_response):
+        """Strip the reasoning block and any "Answer:" preamble
+        
+        A completion cut off inside <think> has no closing tag; the unfinished
+        reasoning is dropped too rather than shown as the answer.
+        """
+        bot_response = re.sub(r"<think>.*?(?:</think>|$)", "", bot_response, flags=re.DOTALL).strip()
+        if "Answer:" in bot_response:
+            bot_response = bot_response.split("Answer:")[-1].strip()
+        return bot_response
+    
+    @staticmethod
+    def _finish_reason(completion):
+        """finish_reason of a completion or streamed chunk ('length' = hit the token limit)"""
+        if not completion.choices:
+            return None
+        return getattr(completion.choices[0], 'finish_reason', None)
+    
+    def _filter_chunk(self, response_filter, chunk):
+        """Feed one streamed completion chunk through the response filter"""
+        if not chunk.choices:
+            return ''
+        return response_filter.feed(chunk.choices[0].delta.content or '')
     
     def _get_products_context(self, user_message):
         """Get relevant products context for the AI"""
-        # Search for products based on user message
-        products = self.product_service.search_products(user_message, limit=5)
-        
+        # Semantic retrieval over the local vector index (falls back to full-text search)
+        with timing.timed('retrieval'):
+            products = self.retriever.search(user_message, limit=5)
+        return self._format_products_context(products)
+    
+    def _format_products_context(self, products):
+        """Product context block for the prompt"""
         if not products:
-            return "No specific products found for this query."
+            return NO_PRODUCTS_CONTEXT
         
         context = "Relevant products in our inventory:\n"
         for product in products:
@@ -101,10 +583,30 @@ class ChatbotService:
     
     def _extract_relevant_products(self, user_message):
         """Extract and return relevant products for display"""
-        return self.product_service.search_products(user_message, limit=6)
+        with timing.timed('retrieval'):
+            return self.retriever.search(user_message, limit=6)
     
-    def get_product_recommendations(self, category=None, limit=8):
-        """Get product recommendations"""
+    def get_product_recommendations(self, category=None, limit=8, product_id=None, session_id=None):
+        """Get product recommendations
+        
+        With product_id or session_id (and a recommender), products similar to
+        that product or to what the session talked about. Without neighbors
+        yet, falls back to top-rated products (of the product's category).
+        """
+        if self.recommender and session_id:
+            products = self.product_service.get_products_by_ids(self.recommender.for_session(session_id, limit))
+            if products:
+                return products
+        elif product_id:
+            if self.recommender:
+                products = self.product_service.get_products_by_ids(self.recommender.for_product(product_id, limit))
+                if products:
+                    return products
+            product = self.product_service.get_product_by_id(product_id)
+            if product:
+                others = self.product_service.search_products("", category=product['category'], limit=limit + 1)
+                return [other for other in others if other['id'] != product_id][:limit]
+        
         if category:
             return self.product_service.search_products("", category=category, limit=limit)
         else:
@@ -0,0 +1,154 @@
+"""Rolling conversation summaries that keep long chat prompts short
+
+Every session keeps its newest messages verbatim and everything older as a
+short extractive summary in chat_summaries. Once more than compact_after
+messages are unsummarized, a background thread folds all but the newest
+keep_messages of them into the summary. Requests never wait for it: they
+read the stored summary plus the messages after it, and the prompt builder
+puts the summary into the system prompt ahead of the recent turns.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from models import FTS_STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+SUMMARIZED = metrics.Counter('chat_messages_summarized_total', 'Chat messages folded into rolling summaries')
+SUMMARY_DURATION = metrics.Histogram('chat_summary_seconds', 'Time to fold messages into a session summary')
+
+SPEAKERS = {'user': 'Customer', 'bot': 'Assistant'}
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+MARKDOWN = re.compile(r'[*_`#>]+|^\s*(?:[-•]|\d+\.)\s+', re.MULTILINE)
+FACT = re.compile(r'\$\s?\d|\d')
+
+class ExtractiveSummarizer:
+    """Local summarizer that keeps the most informative sentences
+
+    Sentences are scored by how often their content words occur across the
+    conversation (Luhn-style), with customer sentences, sentences carrying
+    prices or numbers and more recent sentences weighted up. The best ones
+    are kept in conversation order until max_chars is reached. The previous
+    summary's lines compete with the new sentences, so the summary rolls
+    forward instead of growing.
+    """
+
+    def __init__(self, max_chars=1200, max_sentence_chars=200):
+        self.max_chars = max_chars
+        self.max_sentence_chars = max_sentence_chars
+
+    def summarize(self, previous, messages):
+        candidates = []
+        for line in (previous or '').splitlines():
+            speaker, _, text = line.partition(': ')
+            if text:
+                candidates.append((speaker, text))
+        for msg in messages:
+            speaker = SPEAKERS.get(msg['type'])
+            if not speaker:
+                continue
+            for sentence in SENTENCE_SPLIT.split(MARKDOWN.sub('', msg['content'])):
+                sentence = ' '.join(sentence.split())
+                if len(sentence) > 3:
+                    candidates.append((speaker, self._clip(sentence)))
+        if not candidates:
+            return previous or ''
+
+        words = [self._content_words(text) for _, text in candidates]
+        frequency = Counter(word for sentence_words in words for word in set(sentence_words))
+        scored = []
+        for position, ((speaker, text), sentence_words) in enumerate(zip(candidates, words)):
+            score = sum(frequency[word] for word in set(sentence_words)) / (1 + len(sentence_words)) ** 0.5
+            if speaker == 'Customer':
+                score *= 1.5
+            if FACT.search(text):
+                score *= 1.3
+            score *= 1 + 0.5 * position / len(candidates)
+            scored.append((score, position))
+
+        kept, size = [], 0
+        for score, position in sorted(scored, reverse=True):
+            speaker, text = candidates[position]
+            cost = len(speaker) + len(text) + 3
+            if size + cost > self.max_chars:
+                continue
+            kept.append(position)
+            size += cost
+        return '\n'.join(f'{candidates[position][0]}: {candidates[position][1]}' for position in sorted(kept))
+
+    def _content_words(self, text):
+        return [word for word in re.findall(r'[a-z0-9$]+', text.lower())
+                if len(word) > 2 and word not in FTS_STOPWORDS]
+
+    def _clip(self, sentence):
+        if len(sentence) <= self.max_sentence_chars:
+            return sentence
+        return sentence[:self.max_sentence_chars].rsplit(' ', 1)[0] + ' …'
+
+class ConversationMemory:
+    def __init__(self, chat_service, summarizer=None, keep_messages=4, compact_after=8):
+        self.chat_service = chat_service
+        self.summarizer = summarizer or ExtractiveSummarizer()
+        self.keep_messages = keep_messages
+        self.compact_after = compact_after
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chat-summary')
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def history(self, session_id):
+        """Chat history for the prompt: a 'summary' message, then the unsummarized messages
+
+        Schedules a background compaction when too many messages are unsummarized.
+        """
+        stored = self.chat_service.get_summary(session_id)
+        summary, through_id = stored if stored else (None, None)
+        messages = self.chat_service.get_chat_history(
+            session_id, after_id=through_id, limit=self.compact_after + 1
+        )
+        if len(messages) > self.compact_after:
+            self.schedule(session_id)
+            messages = messages[1:]
+        if summary:
+            messages.insert(0, {'id': through_id, 'type': 'summary', 'content': summary, 'timestamp': None})
+        return messages
+
+    def schedule(self, session_id):
+        """Compact a session in the background unless that is already queued"""
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        self._executor.submit(self._compact_logged, session_id)
+
+    def compact(self, session_id):
+        """Fold all but the newest keep_messages unsummarized messages into the summary"""
+        stored = self.chat_service.get_summary(session_id)
+        summary, through_id = stored if stored else ('', None)
+        messages = self.chat_service.get_chat_history(session_id, after_id=through_id)
+        folding = messages[:-self.keep_messages] if self.keep_messages else messages
+        if not folding:
+            return False
+        started = time.perf_counter()
+        summary = self.summarizer.summarize(summary, folding)
+        self.chat_service.save_summary(session_id, summary, folding[-1]['id'])
+        SUMMARY_DURATION.observe(time.perf_counter() - started)
+        SUMMARIZED.inc(amount=len(folding))
+        return True
+
+    def close(self):
+        """Finish queued compactions"""
+        self._executor.shutdown(wait=True)
+
+    def _compact_logged(self, session_id):
+        with self._lock:
+            self._pending.discard(session_id)
+        try:
+            self.compact(session_id)
+        except Exception:
+            logger.exception("Summarizing chat session %s failed", session_id)
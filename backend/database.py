@@ -27,11 +27,9 @@ def add_sample_users():
     print("Username: user1, Password: password1")
     print("Username: user2, Password: password2")
     print("Username: testuser, Password: test123")
-def populate_sample_data():
+def populate_sample_data(db=None):
     """Populate database with 100+ sample products"""
-    db = Database()
-    conn = db.get_connection()
-    cursor = conn.cursor()
+    db = db or Database()
     
     # Sample electronics products
     electronics_products = [
@@ -233,26 +231,27 @@ def populate_sample_data():
     
     all_products.extend(sports_items)
     
-    # Insert all products
-    for product in all_products:
-        cursor.execute('''
-            INSERT INTO products (name, category, price, description, stock_quantity,
-                                brand, rating, image_url, specifications)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            product['name'],
-            product['category'],
-            product['price'],
-            product['description'],
-            product['stock_quantity'],
-            product['brand'],
-            product['rating'],
-            product['image_url'],
-            product['specifications']
-        ))
+    # Insert all products in a single transaction
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        for product in all_products:
+            cursor.execute('''
+                INSERT INTO products (name, category, price, description, stock_quantity,
+                                    brand, rating, image_url, specifications)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                product['name'],
+                product['category'],
+                product['price'],
+                product['description'],
+                product['stock_quantity'],
+                product['brand'],
+                product['rating'],
+                product['image_url'],
+                product['specifications']
+            ))
     
-    conn.commit()
-    conn.close()
+    db.catalog_changed()
     print(f"Successfully populated database with {len(all_products)} products")
 
 if __name__ == "__main__":
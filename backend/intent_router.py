@@ -0,0 +1,230 @@
+"""Local intent router that answers simple catalog questions without the LLM
+
+Stock ("is the iPhone 15 Pro in stock"), price ("how much is Atomic Habits"),
+category-list ("what categories do you have") and product-detail ("tell me
+about the Dell XPS 13") questions are single lookups. The router classifies
+a message with high-precision rules backed by a small naive Bayes model
+trained at startup on the examples below, resolves the product it names from
+the catalog, and answers from a template. Anything it is not confident
+about returns None and goes to the LLM as before.
+"""
+import math
+import re
+from collections import Counter
+
+import metrics
+import timing
+from models import FTS_STOPWORDS
+
+ROUTED = metrics.Counter('chat_intents_total', 'Chat messages by routed intent (llm = not handled locally)', ('intent',))
+
+RULES = {
+    'categories': re.compile(
+        r"\b(what|which)\b.*\b(categor(y|ies)|departments?|kinds? of (products|things|items))\b"
+        r"|\bwhat do you (sell|carry|have)\s*\??$|\blist (your|the|all) categories\b"
+    ),
+    'stock': re.compile(
+        r"\bin stock\b|\bout of stock\b|\bsold out\b|\bavailab(le|ility)\b|\bhow many\b.*\b(left|available)\b"
+        r"|\bdo you (still )?have\b.*\b(left|in stock)\b"
+    ),
+    'price': re.compile(r"\bhow much\b|\bprice\b|\bcosts?\b|\bpriced\b"),
+    'product_detail': re.compile(
+        r"\btell me (more )?about\b|\bdetails? (of|on|about|for)\b|\bspecs\b|\bspecifications\b"
+        r"|\bdescribe\b|\bwhat is the\b.*\blike\b"
+    ),
+}
+
+# Questions that need reasoning across products always go to the LLM
+LLM_ONLY = re.compile(
+    r"\b(compare|comparison|vs\.?|versus|better|best|recommend|suggest|difference|cheaper|alternative|"
+    r"similar|gift|should i|under|below|over|between|cheapest|top)\b"
+)
+
+TRAINING_EXAMPLES = {
+    'stock': [
+        'is the iphone in stock', 'do you have the galaxy in stock', 'is this available',
+        'how many are left', 'is it sold out', 'are the headphones available',
+        'do you still have any left', 'can i buy it now is it available', 'availability of the laptop',
+        'any units left', 'is the book in stock right now', 'is it out of stock',
+    ],
+    'price': [
+        'how much is the iphone', 'what is the price of the laptop', 'how much does it cost',
+        'price of atomic habits', 'what does the book cost', 'how much are the headphones',
+        'what is the cost', 'tell me the price', 'how much for the macbook', 'what is it priced at',
+        'how expensive is it', 'price please',
+    ],
+    'categories': [
+        'what categories do you have', 'which categories are there', 'what do you sell',
+        'list your categories', 'what kind of products do you carry', 'what departments do you have',
+        'show me all categories', 'what types of items do you sell', 'which product categories exist',
+        'what can i shop for here',
+    ],
+    'product_detail': [
+        'tell me about the dell xps', 'what are the specs of the iphone', 'give me details on the macbook',
+        'describe the sony headphones', 'more information about atomic habits', 'details of the galaxy',
+        'what are the specifications', 'tell me more about it', 'what is the screen size of the laptop',
+        'what features does it have', 'info on the psychology of money',
+    ],
+    'other': [
+        'recommend a good laptop', 'what is the best phone under 1000', 'compare iphone and galaxy',
+        'i need a gift for my dad', 'which headphones are better', 'hello', 'thanks',
+        'what should i buy for running', 'suggest some books', 'show me cheap shoes',
+        'i want something for my garden', 'can you help me choose', 'what is your return policy',
+        'how long does shipping take', 'hi there how are you',
+    ],
+}
+
+# Words that express the intent rather than name the product
+INTENT_WORDS = {
+    'stock', 'available', 'availability', 'left', 'sold', 'out', 'units', 'many', 'much', 'price',
+    'priced', 'cost', 'costs', 'expensive', 'tell', 'more', 'details', 'detail', 'information', 'info',
+    'specs', 'specifications', 'describe', 'features', 'still', 'now', 'right', 'currently', 'is', 'are',
+    'the', 'a', 'an', 'it', 'does', 'do', 'what', 'how', 'please', 'of', 'on', 'about', 'for', 'at',
+    'any', 'there', 'we', 'us', 'yours', 'give', 'know', 'like', 'whats', 's',
+}
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+class NaiveBayesIntentModel:
+    """Multinomial naive Bayes over unigrams and bigrams with Laplace smoothing"""
+
+    def __init__(self, examples):
+        self.word_counts = {label: Counter() for label in examples}
+        self.totals = {}
+        self.priors = {}
+        vocabulary = set()
+        example_count = sum(len(texts) for texts in examples.values())
+        for label, texts in examples.items():
+            for text in texts:
+                features = self.features(text)
+                self.word_counts[label].update(features)
+                vocabulary.update(features)
+            self.totals[label] = sum(self.word_counts[label].values())
+            self.priors[label] = math.log(len(texts) / example_count)
+        self.vocabulary_size = len(vocabulary)
+
+    @staticmethod
+    def features(text):
+        tokens = tokenize(text)
+        return tokens + [f'{first}_{second}' for first, second in zip(tokens, tokens[1:])]
+
+    def predict(self, text):
+        """(label, posterior probability) of the most likely label"""
+        features = self.features(text)
+        scores = {}
+        for label, counts in self.word_counts.items():
+            denominator = self.totals[label] + self.vocabulary_size
+            scores[label] = self.priors[label] + sum(
+                math.log((counts[feature] + 1) / denominator) for feature in features
+            )
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / normalizer
+
+class IntentRouter:
+    def __init__(self, product_service, min_confidence=0.75, min_name_coverage=0.6):
+        self.product_service = product_service
+        self.min_confidence = min_confidence
+        self.min_name_coverage = min_name_coverage
+        self.model = NaiveBayesIntentModel(TRAINING_EXAMPLES)
+
+    def classify(self, message):
+        """The intent of a message, or None when it should go to the LLM"""
+        text = ' '.join(tokenize(message))
+        if not text or LLM_ONLY.search(text):
+            return None
+        matched = [intent for intent, pattern in RULES.items() if pattern.search(text)]
+        if len(matched) == 1:
+            return matched[0]
+        if len(matched) > 1:
+            # "price and availability of X": the detail answer covers both
+            return 'categories' if 'categories' in matched else 'product_detail'
+        label, confidence = self.model.predict(text)
+        if label != 'other' and confidence >= self.min_confidence:
+            return label
+        return None
+
+    def route(self, message):
+        """A chat result answered locally, or None to fall through to the LLM"""
+        with timing.timed('intent_router'):
+            intent = self.classify(message)
+            result = None
+            if intent == 'categories':
+                result = self._answer_categories()
+            elif intent:
+                product = self.resolve_product(message)
+                if product:
+                    result = self._answer(intent, product)
+        ROUTED.inc(intent if result else 'llm')
+        return result
+
+    def resolve_product(self, message):
+        """The single catalog product a message names, if it clearly names one"""
+        tokens = tokenize(message)
+        content = [token for token in tokens if token not in INTENT_WORDS and token not in FTS_STOPWORDS]
+        if not content:
+            return None
+
+        candidates = self.product_service.search_products(' '.join(content), limit=10)
+        message_tokens = set(tokens)
+        scored = []
+        for product in candidates:
+            name_tokens = set(tokenize(product['name']))
+            if not name_tokens:
+                continue
+            # The name must be mostly present in the message, and the message's
+            # product words mostly present in the name (no "iPhone case" -> iPhone)
+            name_coverage = len(name_tokens & message_tokens) / len(name_tokens)
+            content_coverage = len(name_tokens & set(content)) / len(set(content))
+            if name_coverage >= self.min_name_coverage and content_coverage >= 0.75:
+                scored.append((name_coverage + content_coverage, product))
+
+        if not scored:
+            return None
+        # Stable sort keeps search order (best rated first) among equal scores
+        scored.sort(key=lambda item: item[0], reverse=True)
+        best_score, best = scored[0]
+        tied_names = {product['name'].lower() for score, product in scored if score == best_score}
+        if len(tied_names) > 1:
+            return None
+        return best
+
+    def _answer_categories(self):
+        categories = self.product_service.get_categories()
+        if not categories:
+            return None
+        listed = ', '.join(categories[:-1]) + f' and {categories[-1]}' if len(categories) > 1 else categories[0]
+        return self._result(
+            'categories', f"We carry {listed}. Which category would you like to explore?", []
+        )
+
+    def _answer(self, intent, product):
+        name = product['name']
+        brand = f" by {product['brand']}" if product.get('brand') else ''
+        price = f"${product['price']:,.2f}"
+        stock = product.get('stock_quantity') or 0
+
+        if intent == 'stock':
+            if stock > 0:
+                response = f"Yes, the **{name}** is in stock with {stock} available, priced at {price}."
+            else:
+                response = f"Sorry, the **{name}** is currently out of stock."
+        elif intent == 'price':
+            response = f"The **{name}**{brand} is {price}."
+            if stock <= 0:
+                response += " It's currently out of stock."
+        else:
+            response = f"**{name}**{brand}: {price}, rated {product['rating']}/5."
+            if product.get('description'):
+                response += f" {product['description'].rstrip('.')}."
+            response += f" {stock} in stock." if stock > 0 else " Currently out of stock."
+        return self._result(intent, response, [product])
+
+    def _result(self, intent, response, products):
+        return {
+            'response': response,
+            'products': products,
+            'success': True,
+            'intent': intent
+        }
@@ -0,0 +1,202 @@
+"""Admission control for upstream LLM calls
+
+- Single-flight: identical prompts that are already in flight wait for that
+  call's result instead of issuing their own.
+- Concurrency limiting: at most max_concurrent calls run at once, at most
+  max_queue more wait for a slot, and anything beyond that is rejected
+  immediately with LLMOverloaded instead of piling onto the provider's
+  rate limit.
+
+Each class has a thread-based variant for the Flask server and an asyncio
+variant for the ASGI server.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import metrics
+import timing
+
+QUEUE_WAIT = metrics.Histogram('llm_queue_wait_seconds', 'Time LLM calls waited for a concurrency slot', ('mode',))
+REJECTED = metrics.Counter('llm_rejected_total', 'LLM calls rejected by the concurrency limiter', ('mode', 'reason'))
+COALESCED = metrics.Counter('llm_coalesced_total', 'Requests answered by an identical in-flight LLM call', ('mode',))
+
+# Limiters by mode, read by the gauges at scrape time
+_LIMITERS = {}
+
+metrics.CallbackGauge(
+    'llm_in_flight', 'LLM calls holding a concurrency slot',
+    lambda: {(mode,): limiter.active for mode, limiter in _LIMITERS.items()}, ('mode',)
+)
+metrics.CallbackGauge(
+    'llm_queued', 'LLM calls waiting for a concurrency slot',
+    lambda: {(mode,): limiter.waiting for mode, limiter in _LIMITERS.items()}, ('mode',)
+)
+
+class LLMOverloaded(Exception):
+    """Too many LLM calls are running and queued; the caller should retry later"""
+
+class _LimiterBase:
+    mode = None
+
+    def __init__(self, max_concurrent=16, max_queue=64, queue_timeout=10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        _LIMITERS[self.mode] = self
+
+    def _reject(self, reason):
+        REJECTED.inc(self.mode, reason)
+        if reason == 'queue_full':
+            return LLMOverloaded(f'LLM queue is full ({self.max_queue} waiting)')
+        return LLMOverloaded(f'No LLM slot became free within {self.queue_timeout:g}s')
+
+    def _admitted(self, started):
+        waited = time.perf_counter() - started
+        QUEUE_WAIT.observe(waited, self.mode)
+        timing.record('llm_queue', waited)
+
+class ConcurrencyLimiter(_LimiterBase):
+    mode = 'sync'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the concurrency slots for the enclosed call"""
+        started = time.perf_counter()
+        with self._cond:
+            if self.active >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    raise self._reject('queue_full')
+                self.waiting += 1
+                try:
+                    admitted = self._cond.wait_for(lambda: self.active < self.max_concurrent, self.queue_timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    raise self._reject('timeout')
+            self.active += 1
+        self._admitted(started)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify()
+
+class AsyncConcurrencyLimiter(_LimiterBase):
+    mode = 'async'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the concurrency slots for the enclosed call"""
+        started = time.perf_counter()
+        async with self._cond:
+            if self.active >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    raise self._reject('queue_full')
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(
+                        self._cond.wait_for(lambda: self.active < self.max_concurrent), self.queue_timeout
+                    )
+                except asyncio.TimeoutError:
+                    raise self._reject('timeout')
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+        self._admitted(started)
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.active -= 1
+                self._cond.notify()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Share one execution of fn among concurrent callers with the same key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared); shared is True when another caller's call was reused"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            COALESCED.inc('sync')
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+class _LeaderCancelled(Exception):
+    """Handed to followers when the caller running a shared call was cancelled"""
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight; fn is a coroutine function
+    
+    If the leader's task is cancelled, its followers are not: the first of
+    them to wake up runs fn itself and the rest share that call.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        while (future := self._calls.get(key)) is not None:
+            COALESCED.inc('async')
+            try:
+                # Shielded so one follower giving up does not cancel the shared call
+                return await asyncio.shield(future), True
+            except _LeaderCancelled:
+                continue
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved: there may be no followers to observe it
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
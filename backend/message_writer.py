@@ -0,0 +1,192 @@
+"""Write-behind persistence for chat messages
+
+save_message() used to commit one row per call, so concurrent chatters
+queued on SQLite's write lock. MessageWriter collects messages from every
+session on a bounded queue and a single background thread inserts them in
+one transaction per batch (every max_delay seconds or max_batch rows).
+
+Readers call flush(session_id) before reading a session's history; it cuts
+the current batch short and waits until that session's messages are
+committed, so a session always reads its own writes.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INSERT_MESSAGE_SQL = '''
+    INSERT INTO chat_messages (session_id, message_type, content, timestamp)
+    VALUES (?, ?, ?, ?)
+'''
+
+# Queue markers
+_FLUSH = object()
+_STOP = object()
+
+BATCH_SIZE = metrics.Histogram(
+    'chat_message_batch_size', 'Chat messages committed per write-behind transaction',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+class MessageWriter:
+    def __init__(self, db, max_batch=256, max_delay=0.005, queue_size=10000, flush_timeout=10.0):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.flush_timeout = flush_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        # Messages per session that are queued but not yet committed
+        self._pending = {}
+        self._pending_total = 0
+        self._cond = threading.Condition()
+        # Held by save() from the running check through the enqueue and by
+        # close() to stop intake, so nothing is queued after the final drain.
+        # The writer thread never takes it, so a save() blocked on a full
+        # queue cannot stall a commit.
+        self._intake_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._closed
+
+    def start(self):
+        """Start the writer thread; it is drained and stopped at interpreter exit"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def save(self, session_id, message_type, content):
+        """Queue a message for insertion (blocks while the queue is full)
+
+        Falls back to a direct insert once the writer is closed.
+        """
+        row = (session_id, message_type, content, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'))
+        with self._intake_lock:
+            if self.running:
+                with self._cond:
+                    self._pending[session_id] = self._pending.get(session_id, 0) + 1
+                    self._pending_total += 1
+                self._queue.put(row)
+                return
+        self._write_rows([row])
+
+    def flush(self, session_id=None, timeout=None):
+        """Wait until the session's queued messages (all, if None) are committed
+
+        Returns False if they were not committed within the timeout.
+        """
+        if session_id is None:
+            is_done = lambda: self._pending_total == 0
+        else:
+            is_done = lambda: not self._pending.get(session_id)
+        with self._cond:
+            if is_done():
+                return True
+        # Cut the batch being collected short instead of waiting out max_delay
+        self._queue.put(_FLUSH)
+        with self._cond:
+            flushed = self._cond.wait_for(is_done, timeout or self.flush_timeout)
+        if not flushed:
+            logger.warning("Timed out flushing chat messages for session %s", session_id)
+        return flushed
+
+    def close(self, timeout=None):
+        """Commit everything still queued and stop the writer thread"""
+        with self._intake_lock:
+            if self._closed or self._thread is None:
+                self._closed = True
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout or self.flush_timeout)
+        # Messages still queued if the thread did not finish in time
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _FLUSH and item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            self._commit(leftovers)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            if item is _STOP:
+                stopping = True
+            elif item is not _FLUSH:
+                batch.append(item)
+                stopping = self._collect(batch)
+            # Group whatever else is already waiting into the same transaction
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                elif item is not _FLUSH:
+                    batch.append(item)
+            if batch:
+                self._commit(batch)
+
+    def _collect(self, batch):
+        """Add rows to batch until it is full, max_delay passes or a flush arrives
+
+        Returns True if a stop marker was read.
+        """
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return False
+            if item is _STOP:
+                return True
+            if item is _FLUSH:
+                return False
+            batch.append(item)
+        return False
+
+    def _commit(self, batch):
+        try:
+            self._write_rows(batch)
+        except Exception:
+            logger.exception("Batched insert of %d chat messages failed, retrying row by row", len(batch))
+            for row in batch:
+                try:
+                    self._write_rows([row])
+                except Exception:
+                    logger.exception("Dropping chat message for session %s", row[0])
+        finally:
+            BATCH_SIZE.observe(len(batch))
+            with self._cond:
+                for row in batch:
+                    remaining = self._pending.get(row[0], 0) - 1
+                    if remaining > 0:
+                        self._pending[row[0]] = remaining
+                    else:
+                        self._pending.pop(row[0], None)
+                self._pending_total -= len(batch)
+                self._cond.notify_all()
+
+    def _write_rows(self, rows):
+        with self.db.connection('save_message') as conn:
+            conn.executemany(INSERT_MESSAGE_SQL, rows)
@@ -1,14 +1,330 @@
+import base64
+import json
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import hashlib
+import os
+import queue
+import re
+from cache import TTLCache, MISSING
+import timing
+
+# Words that carry no product meaning in conversational queries
+FTS_STOPWORDS = {
+    'a', 'an', 'and', 'any', 'are', 'can', 'do', 'does', 'for', 'from', 'have',
+    'hi', 'hello', 'how', 'i', 'in', 'is', 'it', 'looking', 'me', 'my', 'need',
+    'of', 'on', 'or', 'please', 'show', 'some', 'that', 'the', 'there', 'this',
+    'to', 'want', 'what', 'which', 'with', 'you', 'your', 'find', 'get', 'buy',
+    'recommend', 'good', 'best', 'under', 'below', 'over', 'about'
+}
+
+# BM25 column weights: name, description, brand, category, specifications
+FTS_RANK = 'bm25(products_fts, 10.0, 1.0, 5.0, 3.0, 1.0)'
+
+# Columns a caller may set through Product.add_product / update_product
+PRODUCT_FIELDS = (
+    'name', 'category', 'price', 'description', 'stock_quantity',
+    'brand', 'rating', 'image_url', 'specifications', 'sku'
+)
+
+# Secondary product indexes; bulk loads drop them and build them once at the end.
+# Listings sort on (rating_rank, name, id) = rating DESC, name, id, so each
+# filter's index ends in that key and a page is one seek into it.
+PRODUCT_INDEXES = {
+    'idx_products_rating': 'CREATE INDEX IF NOT EXISTS idx_products_rating ON products (rating_rank, name, id)',
+    'idx_products_category_rating':
+        'CREATE INDEX IF NOT EXISTS idx_products_category_rating ON products (category, rating_rank, name, id)',
+    'idx_products_brand_rating':
+        'CREATE INDEX IF NOT EXISTS idx_products_brand_rating ON products (brand, rating_rank, name, id)',
+    'idx_products_price': 'CREATE INDEX IF NOT EXISTS idx_products_price ON products (price)',
+}
+
+# Indexes replaced by PRODUCT_INDEXES entries that lead with the same columns
+SUPERSEDED_INDEXES = ('idx_products_category',)
+
+CURSOR_KINDS = ('listing', 'text')
+
+def encode_cursor(kind, sort_values):
+    """Opaque page cursor from the sort key of the last row on a page"""
+    payload = json.dumps([kind, *sort_values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, kind):
+    """Sort key values of a cursor made by encode_cursor for the same kind of search"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(payload, list) or len(payload) != 4 or payload[0] != kind:
+        raise ValueError('Invalid cursor')
+    return payload[1:]
+
+FTS_TRIGGERS = ('products_fts_insert', 'products_fts_delete', 'products_fts_update')
+
+# Facet buckets as ascending lower bounds; the last price bucket is open-ended
+PRICE_FACET_BOUNDS = (0, 25, 50, 100, 250, 500, 1000, 2500)
+RATING_FACET_BOUNDS = (0, 1, 2, 3, 4)
+FACET_NAMES = ('category', 'brand', 'price', 'rating')
+FACET_TRIGGERS = ('product_facets_insert', 'product_facets_delete', 'product_facets_update')
+CATALOG_STATE_TRIGGERS = ('catalog_state_insert', 'catalog_state_delete', 'catalog_state_update')
+
+def bucket_labels(bounds, upper=None):
+    """Labels such as '25-50' for consecutive bounds; the last is 'N+' or 'N-upper'"""
+    labels = [f'{low:g}-{high:g}' for low, high in zip(bounds, bounds[1:])]
+    labels.append(f'{bounds[-1]:g}-{upper:g}' if upper is not None else f'{bounds[-1]:g}+')
+    return labels
+
+PRICE_FACET_LABELS = bucket_labels(PRICE_FACET_BOUNDS)
+RATING_FACET_LABELS = bucket_labels(RATING_FACET_BOUNDS, upper=5)
+
+def _bucket_sql(column, bounds, labels):
+    whens = ' '.join(f"WHEN {column} < {high} THEN '{label}'" for high, label in zip(bounds[1:], labels))
+    return f"CASE {whens} ELSE '{labels[-1]}' END"
+
+def _facet_value_sql(facet, row):
+    if facet == 'price':
+        return _bucket_sql(f'{row}.price', PRICE_FACET_BOUNDS, PRICE_FACET_LABELS)
+    if facet == 'rating':
+        return _bucket_sql(f'{row}.rating', RATING_FACET_BOUNDS, RATING_FACET_LABELS)
+    return f'{row}.{facet}'
+
+def facet_values_sql(row):
+    """SELECT of the (facet, value) pairs of a trigger row (new or old)"""
+    return ' UNION ALL '.join(
+        f"SELECT '{facet}' AS facet, {_facet_value_sql(facet, row)} AS value" for facet in FACET_NAMES
+    )
+
+def facet_counts_sql(rows_sql):
+    """SELECT of (facet, value, count) over a subquery of product rows"""
+    facet_keys = ' UNION ALL '.join(f"SELECT '{facet}' AS facet" for facet in FACET_NAMES)
+    value = ' '.join(f"WHEN '{facet}' THEN {_facet_value_sql(facet, 'p')}" for facet in FACET_NAMES)
+    return f'''
+        SELECT facet, value, COUNT(*) FROM (
+            SELECT facet_keys.facet AS facet, CASE facet_keys.facet {value} END AS value
+            FROM ({rows_sql}) AS p CROSS JOIN ({facet_keys}) AS facet_keys
+        )
+        WHERE value IS NOT NULL
+        GROUP BY facet, value
+    '''
+
+# Per-connection tuning applied to every connection the pool hands out
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+)
+
+def create_chat_tables(cursor):
+    """Create the chat session and message tables (main database or a chat shard)"""
+    # Chat sessions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            session_id TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Chat messages table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            message_type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
+        )
+    ''')
+    
+    # Per-session history reads walk this index instead of the whole table
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_session
+        ON chat_messages (session_id, id)
+    ''')
+    
+    # Rolling summary of each session's messages up to and including through_id
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_summaries (
+            session_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            through_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
 
 class Database:
-    def __init__(self, db_path='ecommerce.db'):
+    def __init__(self, db_path='ecommerce.db', pool_size=8, pool_timeout=10.0,
+                 cache_size=2048, cache_ttl=60, principal_cache_size=4096, principal_cache_ttl=300,
+                 read_only=False):
         self.db_path = db_path
-        self.init_database()
+        # Open an existing database without creating schema or writing to it
+        self.read_only = read_only
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._pool_lock = threading.Lock()
+        self._open_connections = 0
+        # Catalog read results shared by every Product bound to this database
+        self.query_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.catalog_version = 0
+        self._catalog_listeners = []
+        # (revision, catalog_version, read_at) behind current_catalog_revision()
+        self._revision_snapshot = None
+        self.revision_ttl = cache_ttl
+        # Optional CatalogSnapshotEngine serving product reads from memory
+        self.catalog_engine = None
+        # Authenticated users by ID, so chat turns skip the users lookup
+        self.principal_cache = TTLCache(maxsize=principal_cache_size, ttl=principal_cache_ttl)
+        self.users_version = 0
+        if not read_only:
+            self.init_database()
+    
+    def add_catalog_listener(self, callback):
+        """Register callback(product_ids) to run after product rows change
+        
+        product_ids is the list of written IDs, or None when the change is
+        not tracked per product (bulk loads) and derived data should rebuild.
+        """
+        self._catalog_listeners.append(callback)
+    
+    def catalog_changed(self, product_ids=None):
+        """Invalidate cached catalog reads after product rows were written"""
+        self.catalog_version += 1
+        self.query_cache.clear()
+        for callback in self._catalog_listeners:
+            callback(product_ids)
+    
+    def cache_result(self, key, value, version):
+        """Cache a catalog read unless the catalog changed while it ran"""
+        if version == self.catalog_version:
+            self.query_cache.set(key, value)
+    
+    def catalog_revision(self):
+        """Persistent catalog revision ('<epoch>-<version>'), shared by every process
+        
+        Triggers bump the stored version on every product write, so unlike
+        catalog_version it survives restarts and agrees across workers.
+        """
+        with self.connection('catalog_revision') as conn:
+            epoch, version = conn.execute('SELECT epoch, version FROM catalog_state WHERE id = 0').fetchone()
+        return f'{epoch}-{version}'
+    
+    def current_catalog_revision(self):
+        """catalog_revision() kept in memory for per-request use
+        
+        The stored copy is dropped as soon as this process changes the
+        catalog (catalog_version moves on) and otherwise re-read after
+        revision_ttl seconds, so writes by other workers show up no later
+        than they do through query_cache.
+        """
+        snapshot = self._revision_snapshot
+        if (snapshot is not None and snapshot[1] == self.catalog_version
+                and time.monotonic() - snapshot[2] < self.revision_ttl):
+            return snapshot[0]
+        version = self.catalog_version
+        revision = self.catalog_revision()
+        self._revision_snapshot = (revision, version, time.monotonic())
+        return revision
+    
+    def user_changed(self, user_id):
+        """Drop a user's cached principal after their row was updated or deleted"""
+        self.users_version += 1
+        self.principal_cache.delete(user_id)
     
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """Open a new, unpooled connection with the standard pragmas applied"""
+        if self.read_only:
+            conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True,
+                                   timeout=self.pool_timeout, check_same_thread=False)
+            # Switching the journal mode is a write
+            pragmas = [pragma for pragma in CONNECTION_PRAGMAS if 'journal_mode' not in pragma]
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.pool_timeout, check_same_thread=False)
+            pragmas = CONNECTION_PRAGMAS
+        for pragma in pragmas:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def connection(self, span=None):
+        """Borrow a pooled connection for one unit of work
+        
+        Commits on success, rolls back on error and always returns the
+        connection to the pool, so callers never commit or close themselves.
+        The time spent is recorded as 'db' and, when named, as 'sql.<span>'.
+        """
+        started = time.perf_counter()
+        conn = self._acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+            elapsed = time.perf_counter() - started
+            timing.record('db', elapsed)
+            if span:
+                timing.record(f'sql.{span}', elapsed)
+    
+    def _acquire(self):
+        """Take an idle connection, open a new one below pool_size, or wait"""
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._pool_lock:
+            if self._open_connections < self.pool_size:
+                self._open_connections += 1
+                create = True
+            else:
+                create = False
+        
+        if create:
+            try:
+                return self.get_connection()
+            except Exception:
+                with self._pool_lock:
+                    self._open_connections -= 1
+                raise
+        
+        try:
+            return self._pool.get(timeout=self.pool_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError('Timed out waiting for a database connection')
+    
+    def _release(self, conn):
+        """Return a connection to the pool"""
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+            with self._pool_lock:
+                self._open_connections -= 1
+    
+    def close_all(self):
+        """Close every idle pooled connection"""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._pool_lock:
+                self._open_connections -= 1
     
     def init_database(self):
         """Initialize database with required tables"""
@@ -43,31 +359,167 @@ class Database:
             )
         ''')
         
-        # Chat sessions table
+        # Catalogs created before SKUs existed get the column added in place
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(products)')]
+        if 'sku' not in columns:
+            cursor.execute('ALTER TABLE products ADD COLUMN sku TEXT')
+        # Listing sort key (rating DESC as an ascending column), computed, never stored
+        columns = [row[1] for row in cursor.execute('PRAGMA table_xinfo(products)')]
+        if 'rating_rank' not in columns:
+            cursor.execute('ALTER TABLE products ADD COLUMN rating_rank REAL GENERATED ALWAYS AS (-rating) VIRTUAL')
+        for name in SUPERSEDED_INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chat_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                session_id TEXT UNIQUE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku
+            ON products (sku) WHERE sku IS NOT NULL
+        ''')
+        self.create_product_indexes(cursor)
+        
+        # Global facet counts, maintained row by row by the product_facets_* triggers
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS product_facets (
+                facet TEXT NOT NULL,
+                value TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (facet, value)
+            ) WITHOUT ROWID
+        ''')
+        self.create_facet_triggers(cursor)
+        cursor.execute("SELECT COALESCE(SUM(count), 0) FROM product_facets WHERE facet = 'category'")
+        counted = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM products')
+        if cursor.fetchone()[0] != counted:
+            self.rebuild_facets(cursor)
+        
+        # Persistent catalog revision, bumped by the catalog_state_* triggers
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_state (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                epoch TEXT NOT NULL,
+                version INTEGER NOT NULL
             )
         ''')
+        cursor.execute(
+            "INSERT OR IGNORE INTO catalog_state (id, epoch, version) VALUES (0, lower(hex(randomblob(6))), 0)"
+        )
+        self.create_catalog_state_triggers(cursor)
         
-        # Chat messages table
+        create_chat_tables(cursor)
+        
+        # Full-text index over the searchable product columns
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chat_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                message_type TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name, description, brand, category, specifications,
+                content='products', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
             )
         ''')
+        self.create_fts_triggers(cursor)
+        
+        # Backfill the index for catalogs created before it existed
+        cursor.execute('SELECT COUNT(*) FROM products_fts_docsize')
+        indexed = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM products')
+        if cursor.fetchone()[0] != indexed:
+            cursor.execute("INSERT INTO products_fts(products_fts) VALUES('rebuild')")
         
         conn.commit()
         conn.close()
+    
+    def create_product_indexes(self, cursor):
+        """Create the secondary product indexes"""
+        for ddl in PRODUCT_INDEXES.values():
+            cursor.execute(ddl)
+    
+    def drop_bulk_load_indexes(self, cursor):
+        """Drop secondary indexes and the per-row product triggers ahead of a large load"""
+        for name in PRODUCT_INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+        for name in FTS_TRIGGERS + FACET_TRIGGERS + CATALOG_STATE_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    
+    def rebuild_bulk_load_indexes(self, cursor):
+        """Recreate what drop_bulk_load_indexes removed, re-index the text, recount facets and bump the revision"""
+        self.create_product_indexes(cursor)
+        self.create_fts_triggers(cursor)
+        cursor.execute("INSERT INTO products_fts(products_fts) VALUES('rebuild')")
+        self.create_facet_triggers(cursor)
+        self.rebuild_facets(cursor)
+        self.create_catalog_state_triggers(cursor)
+        cursor.execute('UPDATE catalog_state SET version = version + 1 WHERE id = 0')
+    
+    def rebuild_facets(self, cursor):
+        """Recount product_facets from scratch (backfill and bulk loads only)"""
+        cursor.execute('DELETE FROM product_facets')
+        cursor.execute(
+            'INSERT INTO product_facets (facet, value, count) '
+            + facet_counts_sql('SELECT category, brand, price, rating FROM products')
+        )
+    
+    def create_facet_triggers(self, cursor):
+        """Adjust product_facets counts as products are inserted, updated and deleted"""
+        add_new = f'''
+            INSERT INTO product_facets (facet, value, count)
+            SELECT facet, value, 1 FROM ({facet_values_sql('new')}) WHERE value IS NOT NULL
+            ON CONFLICT (facet, value) DO UPDATE SET count = count + 1;
+        '''
+        remove_old = f'''
+            UPDATE product_facets SET count = count - 1
+            WHERE (facet, value) IN ({facet_values_sql('old')});
+            DELETE FROM product_facets
+            WHERE count <= 0 AND (facet, value) IN ({facet_values_sql('old')});
+        '''
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS product_facets_insert AFTER INSERT ON products BEGIN
+                {add_new}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS product_facets_delete AFTER DELETE ON products BEGIN
+                {remove_old}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS product_facets_update AFTER UPDATE OF
+                category, brand, price, rating ON products BEGIN
+                {remove_old}
+                {add_new}
+            END
+        ''')
+    
+    def create_catalog_state_triggers(self, cursor):
+        """Bump the stored catalog version whenever a product row changes"""
+        for name, event in zip(CATALOG_STATE_TRIGGERS, ('INSERT', 'DELETE', 'UPDATE')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON products BEGIN
+                    UPDATE catalog_state SET version = version + 1 WHERE id = 0;
+                END
+            ''')
+    
+    def create_fts_triggers(self, cursor):
+        """Keep products_fts in sync with the products table"""
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts(rowid, name, description, brand, category, specifications)
+                VALUES (new.id, new.name, new.description, new.brand, new.category, new.specifications);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, name, description, brand, category, specifications)
+                VALUES ('delete', old.id, old.name, old.description, old.brand, old.category, old.specifications);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF
+                name, description, brand, category, specifications ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, name, description, brand, category, specifications)
+                VALUES ('delete', old.id, old.name, old.description, old.brand, old.category, old.specifications);
+                INSERT INTO products_fts(rowid, name, description, brand, category, specifications)
+                VALUES (new.id, new.name, new.description, new.brand, new.category, new.specifications);
+            END
+        ''')
 
 class User:
     def __init__(self, db):
@@ -76,112 +528,411 @@ class User:
     def create_user(self, username, email, password):
         """Create a new user"""
         password_hash = hashlib.sha256(password.encode()).hexdigest()
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                INSERT INTO users (username, email, password_hash)
-                VALUES (?, ?, ?)
-            ''', (username, email, password_hash))
-            conn.commit()
-            return cursor.lastrowid
+            with self.db.connection('create_user') as conn:
+                cursor = conn.execute('''
+                    INSERT INTO users (username, email, password_hash)
+                    VALUES (?, ?, ?)
+                ''', (username, email, password_hash))
+                return cursor.lastrowid
         except sqlite3.IntegrityError:
             return None
-        finally:
-            conn.close()
     
     def authenticate_user(self, username, password):
         """Authenticate user login"""
         password_hash = hashlib.sha256(password.encode()).hexdigest()
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, username, email FROM users 
-            WHERE username = ? AND password_hash = ?
-        ''', (username, password_hash))
+        with self.db.connection('authenticate_user') as conn:
+            user = conn.execute('''
+                SELECT id, username, email FROM users 
+                WHERE username = ? AND password_hash = ?
+            ''', (username, password_hash)).fetchone()
         
-        user = cursor.fetchone()
-        conn.close()
+        return self._format_user(user) if user else None
+    
+    def get_user_by_id(self, user_id):
+        """Get user by ID (served from the principal cache when possible)"""
+        cached = self.get_cached_user(user_id)
+        if cached:
+            return cached
+        version = self.db.users_version
+        
+        with self.db.connection('get_user_by_id') as conn:
+            user = conn.execute(
+                'SELECT id, username, email FROM users WHERE id = ?', (user_id,)
+            ).fetchone()
+        
+        if not user:
+            return None
+        user = self._format_user(user)
+        # Skip caching if the user was changed while the query ran
+        if version == self.db.users_version:
+            self.db.principal_cache.set(user_id, user)
+        return dict(user)
+    
+    def get_cached_user(self, user_id):
+        """Get a user from the principal cache only, or None"""
+        cached = self.db.principal_cache.get(user_id)
+        return dict(cached) if cached is not MISSING else None
+    
+    def update_user(self, user_id, username=None, email=None, password=None):
+        """Update a user's details; False if the user does not exist or the name/email is taken"""
+        fields = {}
+        if username is not None:
+            fields['username'] = username
+        if email is not None:
+            fields['email'] = email
+        if password is not None:
+            fields['password_hash'] = hashlib.sha256(password.encode()).hexdigest()
+        if not fields:
+            return self.get_user_by_id(user_id) is not None
         
-        if user:
-            return {
-                'id': user[0],
-                'username': user[1],
-                'email': user[2]
-            }
-        return None
+        assignments = ', '.join(f'{field} = ?' for field in fields)
+        try:
+            with self.db.connection('update_user') as conn:
+                cursor = conn.execute(
+                    f'UPDATE users SET {assignments} WHERE id = ?', (*fields.values(), user_id)
+                )
+                updated = cursor.rowcount > 0
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            self.db.user_changed(user_id)
+        return updated
+    
+    def delete_user(self, user_id):
+        """Delete a user; their tokens stop authenticating immediately"""
+        try:
+            with self.db.connection('delete_user') as conn:
+                cursor = conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+                return cursor.rowcount > 0
+        finally:
+            self.db.user_changed(user_id)
+    
+    def _format_user(self, user):
+        """Format user data"""
+        return {
+            'id': user[0],
+            'username': user[1],
+            'email': user[2]
+        }
 
 class Product:
     def __init__(self, db):
         self.db = db
     
-    def search_products(self, query, category=None, min_price=None, max_price=None, limit=20):
-        """Search products based on query and filters"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+    def search_products(self, query, category=None, min_price=None, max_price=None, limit=20,
+                        match_any=False, brand=None, min_rating=None):
+        """Search products based on query and filters
         
-        sql = '''
-            SELECT id, name, category, price, description, stock_quantity, 
-                   brand, rating, image_url, specifications
-            FROM products WHERE 1=1
+        Text queries go through the products_fts index and are ranked by BM25.
+        Every term is matched as a prefix; by default all terms must match,
+        with match_any=True (conversational queries) any term may match.
+        """
+        return self.search_products_page(
+            query, category, min_price, max_price, limit,
+            match_any=match_any, brand=brand, min_rating=min_rating
+        )['products']
+    
+    def search_products_page(self, query, category=None, min_price=None, max_price=None, limit=20,
+                             match_any=False, brand=None, min_rating=None, cursor=None, use_snapshot=True):
+        """One page of search_products results plus the cursor of the next page
+        
+        Pages are keyed on the sort order itself, (rating DESC, name, id) for
+        listings and (BM25 rank, rating DESC, id) for text queries, so every
+        page is an index seek however deep the client pages. The cursor is
+        opaque to clients; a malformed one raises ValueError.
+        """
+        cache_key = (
+            'search', ' '.join((query or '').lower().split()), category or None,
+            min_price or None, max_price or None, limit, bool(match_any), brand or None, min_rating or None,
+            cursor or None
+        )
+        cached = self.db.query_cache.get(cache_key)
+        if cached is not MISSING:
+            return {'products': list(cached[0]), 'next_cursor': cached[1]}
+        version = self.db.catalog_version
+        
+        match_query = self._build_match_query(query, match_any) if query else None
+        if query and not match_query:
+            return {'products': [], 'next_cursor': None}
+        
+        kind = 'text' if match_query else 'listing'
+        snapshot = self._snapshot() if use_snapshot and not match_query else None
+        if snapshot:
+            return self._snapshot_page(snapshot, category, brand, min_price, max_price, min_rating,
+                                       limit, cursor)
+        
+        where_sql, params = self._filter_sql(match_query, category, brand, min_price, max_price, min_rating)
+        if match_query:
+            sort_key = f'{FTS_RANK}, p.rating_rank, p.id'
+        else:
+            sort_key = 'p.rating_rank, p.name, p.id'
+        if cursor:
+            where_sql += f' AND ({sort_key}) > (?, ?, ?)'
+            params.extend(decode_cursor(cursor, kind))
+        
+        sql = f'''
+            SELECT p.id, p.name, p.category, p.price, p.description, p.stock_quantity,
+                   p.brand, p.rating, p.image_url, p.specifications, {sort_key}
+            {where_sql}
+            ORDER BY {sort_key} LIMIT ?
         '''
-        params = []
+        # One extra row tells whether another page exists
+        params.append(limit + 1)
         
-        if query:
-            sql += ' AND (name LIKE ? OR description LIKE ? OR brand LIKE ?)'
-            search_term = f'%{query}%'
-            params.extend([search_term, search_term, search_term])
+        with self.db.connection('search_products') as conn:
+            rows = conn.execute(sql, params).fetchall()
+        
+        next_cursor = encode_cursor(kind, rows[limit - 1][10:]) if len(rows) > limit else None
+        results = [self._format_product(row) for row in rows[:limit]]
+        self.db.cache_result(cache_key, (tuple(results), next_cursor), version)
+        return {'products': results, 'next_cursor': next_cursor}
+    
+    def _snapshot(self):
+        """The in-memory catalog snapshot, when enabled and current"""
+        engine = self.db.catalog_engine
+        return engine.current() if engine else None
+    
+    def _snapshot_page(self, snapshot, category, brand, min_price, max_price, min_rating, limit, cursor):
+        """search_products_page for listings, answered from the catalog snapshot"""
+        after_offset = None
+        if cursor:
+            sort_key = decode_cursor(cursor, 'listing')
+            after_offset = snapshot.offset(sort_key[2])
+            if after_offset is None or snapshot.sort_key(after_offset) != sort_key:
+                # The cursor row changed or is gone; only SQL can seek past its old key
+                snapshot = None
+        if snapshot is None:
+            return self.search_products_page('', category, min_price, max_price, limit, brand=brand,
+                                             min_rating=min_rating, cursor=cursor, use_snapshot=False)
+        
+        offsets, has_more = snapshot.filter(category, brand, min_price, max_price, min_rating,
+                                            after_offset=after_offset, limit=limit)
+        next_cursor = encode_cursor('listing', snapshot.sort_key(offsets[-1])) if has_more else None
+        return {'products': [snapshot.product(offset) for offset in offsets], 'next_cursor': next_cursor}
+    
+    def _filter_sql(self, match_query, category=None, brand=None, min_price=None, max_price=None,
+                    min_rating=None):
+        """FROM/WHERE clause over products aliased p, with its parameters"""
+        if match_query:
+            sql = '''
+                FROM products_fts
+                JOIN products p ON p.id = products_fts.rowid
+                WHERE products_fts MATCH ?
+            '''
+            params = [match_query]
+        else:
+            sql = 'FROM products p WHERE 1=1'
+            params = []
         
         if category:
-            sql += ' AND category = ?'
+            sql += ' AND p.category = ?'
             params.append(category)
         
+        if brand:
+            sql += ' AND p.brand = ?'
+            params.append(brand)
+        
         if min_price:
-            sql += ' AND price >= ?'
+            sql += ' AND p.price >= ?'
             params.append(min_price)
         
         if max_price:
-            sql += ' AND price <= ?'
+            sql += ' AND p.price <= ?'
             params.append(max_price)
         
-        sql += ' ORDER BY rating DESC, name ASC LIMIT ?'
-        params.append(limit)
+        if min_rating:
+            sql += ' AND p.rating >= ?'
+            params.append(min_rating)
         
-        cursor.execute(sql, params)
-        products = cursor.fetchall()
-        conn.close()
+        return sql, params
+    
+    def get_facets(self, query='', category=None, brand=None, min_price=None, max_price=None,
+                   min_rating=None):
+        """Counts per category, brand, price bucket and rating band
+        
+        Without a query or filters the counts come straight from the
+        product_facets summary table; otherwise the matching rows are
+        aggregated in a single pass.
+        """
+        filters = (category, brand, min_price, max_price, min_rating)
+        cache_key = ('facets', ' '.join((query or '').lower().split())) + tuple(f or None for f in filters)
+        cached = self.db.query_cache.get(cache_key)
+        if cached is not MISSING:
+            return cached
+        version = self.db.catalog_version
+        
+        match_query = self._build_match_query(query) if query else None
+        if query and not match_query:
+            counts = []
+        elif not match_query and not any(filters):
+            with self.db.connection('get_facets_summary') as conn:
+                counts = conn.execute('SELECT facet, value, count FROM product_facets').fetchall()
+        else:
+            where_sql, params = self._filter_sql(match_query, *filters)
+            rows_sql = f'SELECT p.category, p.brand, p.price, p.rating {where_sql}'
+            with self.db.connection('get_facets') as conn:
+                counts = conn.execute(facet_counts_sql(rows_sql), params).fetchall()
+        
+        result = self._format_facets(counts)
+        self.db.cache_result(cache_key, result, version)
+        return result
+    
+    def _format_facets(self, counts):
+        """Group (facet, value, count) rows into ordered facet lists"""
+        grouped = {facet: {} for facet in FACET_NAMES}
+        for facet, value, count in counts:
+            grouped[facet][value] = count
+        
+        # Buckets keep their numeric order, the rest are most common first
+        bucket_order = {'price': PRICE_FACET_LABELS, 'rating': RATING_FACET_LABELS}
+        facets = {}
+        for facet, values in grouped.items():
+            if facet in bucket_order:
+                ordered = [label for label in bucket_order[facet] if label in values]
+            else:
+                ordered = sorted(values, key=lambda value: (-values[value], value))
+            facets[facet] = [{'value': value, 'count': values[value]} for value in ordered]
+        
+        return {'total': sum(grouped['category'].values()), 'facets': facets}
+    
+    def _build_match_query(self, query, match_any=False):
+        """Turn free text into a safe FTS5 MATCH expression of prefix terms"""
+        terms = re.findall(r'\w+', query.lower())
+        if match_any:
+            terms = [term for term in terms if term not in FTS_STOPWORDS and len(term) > 1]
+        if not terms:
+            return None
         
-        return [self._format_product(product) for product in products]
+        # Quote every term so FTS5 operators in user input are taken literally
+        unique_terms = list(dict.fromkeys(terms))
+        joiner = ' OR ' if match_any else ' '
+        return joiner.join(f'"{term}"*' for term in unique_terms)
     
     def get_product_by_id(self, product_id):
         """Get single product by ID"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        snapshot = self._snapshot()
+        if snapshot:
+            offset = snapshot.offset(product_id)
+            return snapshot.product(offset) if offset is not None else None
         
-        cursor.execute('''
-            SELECT id, name, category, price, description, stock_quantity,
-                   brand, rating, image_url, specifications
-            FROM products WHERE id = ?
-        ''', (product_id,))
+        cache_key = ('product', product_id)
+        cached = self.db.query_cache.get(cache_key)
+        if cached is not MISSING:
+            return cached
+        version = self.db.catalog_version
         
-        product = cursor.fetchone()
-        conn.close()
+        with self.db.connection('get_product_by_id') as conn:
+            product = conn.execute('''
+                SELECT id, name, category, price, description, stock_quantity,
+                       brand, rating, image_url, specifications
+                FROM products WHERE id = ?
+            ''', (product_id,)).fetchone()
+        
+        result = self._format_product(product) if product else None
+        self.db.cache_result(cache_key, result, version)
+        return result
+    
+    def get_products_by_ids(self, product_ids):
+        """Get several products by ID, in the order the IDs were given"""
+        if not product_ids:
+            return []
         
-        return self._format_product(product) if product else None
+        snapshot = self._snapshot()
+        if snapshot:
+            offsets = (snapshot.offset(product_id) for product_id in product_ids)
+            return [snapshot.product(offset) for offset in offsets if offset is not None]
+        
+        with self.db.connection('get_products_by_ids') as conn:
+            rows = conn.execute(f'''
+                SELECT id, name, category, price, description, stock_quantity,
+                       brand, rating, image_url, specifications
+                FROM products WHERE id IN ({', '.join('?' * len(product_ids))})
+            ''', list(product_ids)).fetchall()
+        
+        products = {row[0]: self._format_product(row) for row in rows}
+        return [products[product_id] for product_id in product_ids if product_id in products]
+    
+    def iter_products(self, batch_size=1000):
+        """Stream every product in ID order without loading the catalog at once"""
+        last_id = 0
+        while True:
+            with self.db.connection('iter_products') as conn:
+                rows = conn.execute('''
+                    SELECT id, name, category, price, description, stock_quantity,
+                           brand, rating, image_url, specifications
+                    FROM products WHERE id > ? ORDER BY id LIMIT ?
+                ''', (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._format_product(row)
+            last_id = rows[-1][0]
+    
+    def count_products(self):
+        """Number of products in the catalog"""
+        with self.db.connection('count_products') as conn:
+            return conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
     
     def get_categories(self):
         """Get all product categories"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        cached = self.db.query_cache.get(('categories',))
+        if cached is not MISSING:
+            return list(cached)
+        version = self.db.catalog_version
         
-        cursor.execute('SELECT DISTINCT category FROM products ORDER BY category')
-        categories = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        with self.db.connection('get_categories') as conn:
+            rows = conn.execute(
+                "SELECT value FROM product_facets WHERE facet = 'category' ORDER BY value"
+            ).fetchall()
+        categories = [row[0] for row in rows]
         
+        self.db.cache_result(('categories',), tuple(categories), version)
         return categories
     
+    def add_product(self, product):
+        """Insert a product from a dict of PRODUCT_FIELDS, return its ID"""
+        columns = [field for field in PRODUCT_FIELDS if field in product]
+        with self.db.connection('add_product') as conn:
+            cursor = conn.execute(
+                f"INSERT INTO products ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [product[field] for field in columns]
+            )
+            product_id = cursor.lastrowid
+        
+        self.db.catalog_changed([product_id])
+        return product_id
+    
+    def update_product(self, product_id, **fields):
+        """Update the given PRODUCT_FIELDS of a product, return True if it exists"""
+        columns = [field for field in PRODUCT_FIELDS if field in fields]
+        if not columns:
+            return False
+        
+        with self.db.connection('update_product') as conn:
+            cursor = conn.execute(
+                f"UPDATE products SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                [fields[column] for column in columns] + [product_id]
+            )
+            updated = cursor.rowcount > 0
+        
+        self.db.catalog_changed([product_id])
+        return updated
+    
+    def delete_product(self, product_id):
+        """Delete a product, return True if it existed"""
+        with self.db.connection('delete_product') as conn:
+            deleted = conn.execute('DELETE FROM products WHERE id = ?', (product_id,)).rowcount > 0
+        
+        self.db.catalog_changed([product_id])
+        return deleted
+    
+    def cache_stats(self):
+        """Hit/miss counters of the catalog query cache"""
+        return self.db.query_cache.stats()
+    
     def _format_product(self, product):
         """Format product data"""
         return {
@@ -198,55 +949,133 @@ class Product:
         }
 
 class ChatSession:
-    def __init__(self, db):
+    def __init__(self, db, writer=None, shards=None):
         self.db = db
+        # Optional MessageWriter that batches save_message inserts
+        self.writer = writer
+        # Optional ChatShards holding sessions and messages outside the catalog database
+        self.shards = shards
+    
+    def _route(self, session_id):
+        """(database, writer) that hold a session's rows"""
+        if self.shards is None:
+            return self.db, self.writer
+        return self.shards.route(session_id)
+    
+    def storages(self):
+        """(name, database) pairs that hold chat messages
+
+        A shard is named by its file, not its index, so the name keeps
+        meaning the same messages after a migration changes the shard count.
+        """
+        if self.shards is None:
+            return [('main', self.db)]
+        return [(os.path.realpath(database.db_path), database) for database in self.shards.databases]
+    
+    def get_session_owner(self, session_id):
+        """User ID a session belongs to, or None"""
+        db, _ = self._route(session_id)
+        with db.connection('get_session_owner') as conn:
+            row = conn.execute('SELECT user_id FROM chat_sessions WHERE session_id = ?', (session_id,)).fetchone()
+        return row[0] if row else None
+    
+    def close(self):
+        """Commit queued messages and stop the background writers"""
+        if self.writer:
+            self.writer.close()
+        if self.shards is not None:
+            self.shards.close()
     
     def create_session(self, user_id, session_id):
         """Create new chat session"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO chat_sessions (user_id, session_id)
-            VALUES (?, ?)
-        ''', (user_id, session_id))
-        
-        conn.commit()
-        conn.close()
+        db, _ = self._route(session_id)
+        with db.connection('create_session') as conn:
+            conn.execute('''
+                INSERT INTO chat_sessions (user_id, session_id)
+                VALUES (?, ?)
+            ''', (user_id, session_id))
     
     def save_message(self, session_id, message_type, content):
-        """Save chat message"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO chat_messages (session_id, message_type, content)
-            VALUES (?, ?, ?)
-        ''', (session_id, message_type, content))
-        
-        conn.commit()
-        conn.close()
+        """Save chat message (queued for a batched commit when a writer is attached)"""
+        db, writer = self._route(session_id)
+        if writer:
+            writer.save(session_id, message_type, content)
+            return
+        with db.connection('save_message') as conn:
+            conn.execute('''
+                INSERT INTO chat_messages (session_id, message_type, content)
+                VALUES (?, ?, ?)
+            ''', (session_id, message_type, content))
     
-    def get_chat_history(self, session_id):
-        """Get chat history for session"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+    def get_chat_history(self, session_id, before_id=None, limit=None, after_id=None):
+        """Get chat history for session, oldest first
         
-        cursor.execute('''
-            SELECT message_type, content, timestamp
+        With limit, returns only the newest `limit` messages older than
+        before_id (a message ID cursor), served from the (session_id, id) index.
+        after_id skips messages up to and including that ID.
+        """
+        sql = '''
+            SELECT id, message_type, content, timestamp
             FROM chat_messages
             WHERE session_id = ?
-            ORDER BY timestamp ASC
-        ''', (session_id,))
+        '''
+        params = [session_id]
+        if before_id is not None:
+            sql += ' AND id < ?'
+            params.append(before_id)
+        if after_id is not None:
+            sql += ' AND id > ?'
+            params.append(after_id)
         
-        messages = cursor.fetchall()
-        conn.close()
+        if limit is None:
+            sql += ' ORDER BY id ASC'
+        else:
+            sql += ' ORDER BY id DESC LIMIT ?'
+            params.append(limit)
         
-        return [
-            {
-                'type': msg[0],
-                'content': msg[1],
-                'timestamp': msg[2]
-            }
-            for msg in messages
-        ]
+        db, writer = self._route(session_id)
+        if writer:
+            # Read this session's own queued writes
+            with timing.timed('message_flush'):
+                writer.flush(session_id)
+        with db.connection('get_chat_history') as conn:
+            messages = conn.execute(sql, params).fetchall()
+        if limit is not None:
+            messages.reverse()
+        
+        return [self._format_message(msg) for msg in messages]
+    
+    def get_recent_messages(self, session_id, n=10):
+        """Get the last n messages of a session without reading the rest"""
+        return self.get_chat_history(session_id, limit=n)
+    
+    def get_summary(self, session_id):
+        """(summary, through_id) of a session's summarized messages, or None"""
+        db, _ = self._route(session_id)
+        with db.connection('get_summary') as conn:
+            return conn.execute(
+                'SELECT summary, through_id FROM chat_summaries WHERE session_id = ?', (session_id,)
+            ).fetchone()
+    
+    def save_summary(self, session_id, summary, through_id):
+        """Store a session's summary unless a newer one (higher through_id) is already saved"""
+        db, _ = self._route(session_id)
+        with db.connection('save_summary') as conn:
+            conn.execute('''
+                INSERT INTO chat_summaries (session_id, summary, through_id, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    summary = excluded.summary,
+                    through_id = excluded.through_id,
+                    updated_at = excluded.updated_at
+                WHERE excluded.through_id > chat_summaries.through_id
+            ''', (session_id, summary, through_id))
+    
+    def _format_message(self, msg):
+        """Format chat message data"""
+        return {
+            'id': msg[0],
+            'type': msg[1],
+            'content': msg[2],
+            'timestamp': msg[3]
+        }
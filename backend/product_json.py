@@ -0,0 +1,58 @@
+"""Pre-serialized product JSON for the catalog endpoints
+
+Each product is serialized once per catalog version into a compact JSON
+fragment, with `specifications` embedded as an object rather than a JSON
+string (chat responses send product_payload() too, so clients see one
+shape). List responses are assembled by joining fragments, so a repeated
+search or listing does no per-product serialization work.
+"""
+import json
+
+import timing
+from cache import TTLCache, MISSING
+
+def product_payload(product):
+    """Product dict as sent to clients, with specifications decoded"""
+    specifications = product.get('specifications')
+    if isinstance(specifications, str):
+        try:
+            specifications = json.loads(specifications)
+        except ValueError:
+            specifications = {'details': specifications}
+    return {**product, 'specifications': specifications or {}}
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+class ProductJSONCache:
+    def __init__(self, db, maxsize=100000):
+        self.db = db
+        # product_id -> (catalog_version, fragment)
+        self.fragments = TTLCache(maxsize=maxsize, ttl=3600)
+
+    def fragment(self, product, version):
+        """JSON text of one product as of catalog `version`
+
+        version is the catalog_version read before the product was loaded,
+        so a fragment built from a row that was changed meanwhile is never
+        served as current.
+        """
+        cached = self.fragments.get(product['id'])
+        if cached is not MISSING and cached[0] == version:
+            return cached[1]
+        text = dumps(product_payload(product))
+        if version == self.db.catalog_version:
+            self.fragments.set(product['id'], (version, text))
+        return text
+
+    def array(self, products, version):
+        """JSON array text of several products"""
+        with timing.timed('json_serialize'):
+            return '[' + ','.join(self.fragment(product, version) for product in products) + ']'
+
+    def document(self, fields, raw=None):
+        """JSON object text from plain fields plus already-serialized members"""
+        with timing.timed('json_serialize'):
+            members = [f'{dumps(key)}:{dumps(value)}' for key, value in fields.items()]
+            members += [f'{dumps(key)}:{text}' for key, text in (raw or {}).items()]
+            return '{' + ','.join(members) + '}'
@@ -0,0 +1,165 @@
+import math
+import re
+import threading
+
+SYSTEM_INSTRUCTIONS = """You are a helpful e-commerce sales assistant. Your role is to help customers find products, answer questions about products, and guide them through their shopping experience.
+
+Available product categories: Electronics, Books, Clothing, Home & Garden, Sports & Outdoors
+
+Instructions:
+1. Be friendly, helpful, and professional
+2. When recommending products, mention specific product names, prices, and key features
+3. Ask clarifying questions to better understand customer needs
+4. Provide product comparisons when relevant
+5. Guide users through the shopping process
+6. If asked about products not in our inventory, politely explain we don't carry them but suggest alternatives
+7. Keep responses concise but informative
+8. Always try to be helpful and sales-oriented while being genuine"""
+
+# Completion budgets per query type. The reasoning model often spends 1-2k
+# tokens inside <think> before answering, so every budget leaves room for that
+COMPLETION_BUDGETS = {
+    'lookup': 2048,
+    'general': 4096,
+    'comparison': 6144,
+}
+# Budget of the one retry made when a completion ran out inside <think>
+RETRY_COMPLETION_TOKENS = 8192
+
+LOOKUP_PATTERN = re.compile(r'\b(price|cost|how much|in stock|stock|available|availability)\b')
+COMPARISON_PATTERN = re.compile(r'\b(compare|comparison|versus|vs\.?|difference|better)\b')
+
+# Chat framing overhead per message (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def history_before(user_message, chat_history):
+    """History without the current message, which callers save before reading history"""
+    history = list(chat_history or [])
+    if history and history[-1]['type'] == 'user' and history[-1]['content'] == user_message:
+        history = history[:-1]
+    return history
+
+def compact_whitespace(text):
+    """Strip indentation and trailing spaces and collapse runs of blank lines"""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines))
+
+class PromptBuilder:
+    """Assemble Groq messages within an input token budget
+
+    Parts are packed in priority order: system instructions and the current
+    message always go in, then product context (whole product blocks, best
+    first), then the rolling summary of older turns (a 'summary' history
+    entry from ConversationMemory), then history from the newest message
+    backwards. Individual
+    history messages are clipped to max_history_message_tokens so one long
+    bot reply cannot crowd out the rest of the conversation.
+
+    Token counts are estimated from character length; the chars-per-token
+    ratio is recalibrated from the prompt_tokens Groq reports.
+    """
+
+    def __init__(self, input_budget=3000, max_history_messages=10, max_history_message_tokens=300,
+                 max_summary_tokens=400, chars_per_token=4.0):
+        self.input_budget = input_budget
+        self.max_history_messages = max_history_messages
+        self.max_history_message_tokens = max_history_message_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.chars_per_token = chars_per_token
+        self._lock = threading.Lock()
+
+    def estimate_tokens(self, text):
+        """Estimated token count of text"""
+        return math.ceil(len(text) / self.chars_per_token) if text else 0
+
+    def observe_usage(self, estimated_tokens, actual_tokens, weight=0.1):
+        """Nudge the chars-per-token ratio towards what the provider actually counted"""
+        if not estimated_tokens or not actual_tokens:
+            return
+        with self._lock:
+            observed = self.chars_per_token * estimated_tokens / actual_tokens
+            self.chars_per_token += weight * (observed - self.chars_per_token)
+
+    def classify_query(self, user_message):
+        """'lookup', 'comparison' or 'general'"""
+        text = user_message.lower()
+        if COMPARISON_PATTERN.search(text):
+            return 'comparison'
+        if LOOKUP_PATTERN.search(text) and len(text) < 120:
+            return 'lookup'
+        return 'general'
+
+    def build(self, user_message, products_context, chat_history=None):
+        """Return (messages, report) for one request"""
+        system_prompt = SYSTEM_INSTRUCTIONS
+        user_tokens = self.estimate_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+        remaining = self.input_budget - user_tokens - self.estimate_tokens(system_prompt) - MESSAGE_OVERHEAD_TOKENS
+
+        # Product context, dropping the lowest-ranked product blocks if needed
+        blocks = [compact_whitespace(block) for block in products_context.split('\n\n') if block.strip()]
+        context_parts = []
+        for block in blocks:
+            cost = self.estimate_tokens(block) + 1
+            if cost > remaining:
+                break
+            context_parts.append(block)
+            remaining -= cost
+        if context_parts:
+            system_prompt += '\n\nCurrent product context based on user query:\n' + '\n'.join(context_parts)
+
+        # Summary of the turns that are no longer sent verbatim
+        history = history_before(user_message, chat_history)
+        summary = next((msg['content'] for msg in history if msg['type'] == 'summary'), None)
+        summary_tokens = 0
+        if summary:
+            summary = self._clip(summary, self.max_summary_tokens)
+            cost = self.estimate_tokens(summary) + 1
+            if cost <= remaining:
+                system_prompt += '\n\nSummary of the earlier conversation:\n' + summary
+                summary_tokens = cost
+                remaining -= cost
+        
+        # History, newest first, until the budget runs out
+        history = [msg for msg in history if msg['type'] != 'summary'][-self.max_history_messages:]
+        history_messages = []
+        for msg in reversed(history):
+            role = {'user': 'user', 'bot': 'assistant'}.get(msg['type'])
+            if not role:
+                continue
+            content = self._clip(compact_whitespace(msg['content']), self.max_history_message_tokens)
+            cost = self.estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            if cost > remaining:
+                break
+            history_messages.append({"role": role, "content": content})
+            remaining -= cost
+        history_messages.reverse()
+
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(history_messages)
+        messages.append({"role": "user", "content": user_message})
+
+        query_type = self.classify_query(user_message)
+        system_tokens = self.estimate_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        history_tokens = sum(self.estimate_tokens(msg['content']) + MESSAGE_OVERHEAD_TOKENS for msg in history_messages)
+        report = {
+            'query_type': query_type,
+            'input_budget': self.input_budget,
+            'input_tokens': system_tokens + history_tokens + user_tokens,
+            'system_tokens': system_tokens,
+            'user_tokens': user_tokens,
+            'history_tokens': history_tokens,
+            'summary_tokens': summary_tokens,
+            'history_messages': len(history_messages),
+            'history_dropped': len(history) - len(history_messages),
+            'context_products': len(context_parts),
+            'context_dropped': len(blocks) - len(context_parts),
+            'max_completion_tokens': COMPLETION_BUDGETS[query_type]
+        }
+        return messages, report
+
+    def _clip(self, text, max_tokens):
+        """Cut text to about max_tokens, on a word boundary"""
+        max_chars = int(max_tokens * self.chars_per_token)
+        if len(text) <= max_chars:
+            return text
+        return text[:max_chars].rsplit(' ', 1)[0] + ' …'
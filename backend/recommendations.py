@@ -0,0 +1,530 @@
+"""Precomputed item-to-item and per-session product recommendations
+
+Every product keeps a top-K neighbor list in product_neighbors. Candidates
+come from the retrieval index (hashed TF-IDF over name, brand, category,
+description and specifications); a candidate's score is the overlap of the
+words the two products' documents actually share, which hash collisions
+cannot inflate, plus a bonus for being mentioned in the same chat sessions.
+Candidates below the retrieval relevance floor are dropped. Each session's
+recommendations are the sum of the neighbor lists of the products it
+mentioned, stored in session_recommendations.
+
+A background thread keeps both tables current. It reads chat messages added
+since the last run, recomputes the lists of products that changed or gained
+co-mentions, then re-ranks the sessions that mentioned something new. After
+a bulk catalog load it compares a digest of every product's document with
+the one its list was built from and only recomputes the products that
+differ, at most PRODUCTS_PER_REFRESH per run. A request reads at most
+`limit` rows by primary key and never scores anything.
+"""
+import logging
+import math
+import re
+import threading
+import time
+import zlib
+
+import metrics
+from retrieval import MIN_SIMILARITY, content_terms, product_document
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 20
+# Index candidates rescored per product before co-mentions are mixed in
+CANDIDATES = 4 * TOP_K
+# Weight of the co-mention bonus, which approaches it as sessions grow
+COMENTION_WEIGHT = 0.5
+# Products (or sessions) recomputed per transaction
+REFRESH_CHUNK = 512
+# Changed products recomputed per background run; the rest wait for the next one
+PRODUCTS_PER_REFRESH = 4096
+# Rows read per query (and IDs per IN list) when walking tables
+READ_PAGE = 900
+# Chat messages read per query when catching up
+MESSAGE_BATCH = 5000
+# Longest product name, in words, looked for in chat messages
+MAX_NAME_WORDS = 8
+
+REFRESH_DURATION = metrics.Histogram(
+    'recommendations_refresh_seconds', 'Time of one background recommendation refresh'
+)
+RECOMPUTED = metrics.Counter(
+    'recommendations_recomputed_total', 'Neighbor lists recomputed', ('kind',)
+)
+
+def name_key(text):
+    return ' '.join(re.findall(r'[a-z0-9]+', text.lower()))
+
+def document_digest(product):
+    """Fingerprint of the text a product's neighbor list was computed from"""
+    return zlib.crc32(product_document(product).encode())
+
+def word_overlap(terms, other_terms):
+    """Cosine similarity of two word sets"""
+    if not terms or not other_terms:
+        return 0.0
+    return len(terms & other_terms) / math.sqrt(len(terms) * len(other_terms))
+
+class ProductNameMatcher:
+    """Finds the catalog products named in free text, longest name first
+
+    Only names of two or more words are matched, so "Apple" or "Headphones"
+    on their own do not count as a mention. Products sharing a name resolve
+    to the best rated one.
+    """
+
+    def __init__(self, products):
+        best = {}
+        self.max_words = 2
+        for product in products:
+            key = name_key(product['name'] or '')
+            words = key.count(' ') + 1
+            if words < 2 or words > MAX_NAME_WORDS:
+                continue
+            current = best.get(key)
+            if current is None or (product['rating'] or 0) > current[1]:
+                best[key] = (product['id'], product['rating'] or 0)
+            self.max_words = max(self.max_words, words)
+        self.names = {key: product_id for key, (product_id, _) in best.items()}
+
+    def find(self, text):
+        """IDs of the products named in text, in order of mention"""
+        words = re.findall(r'[a-z0-9]+', text.lower())
+        found = []
+        position = 0
+        while position < len(words):
+            for length in range(min(self.max_words, len(words) - position), 1, -1):
+                product_id = self.names.get(' '.join(words[position:position + length]))
+                if product_id is not None:
+                    found.append(product_id)
+                    position += length
+                    break
+            else:
+                position += 1
+        return found
+
+class RecommendationEngine:
+    def __init__(self, db, product_service, chat_service, retriever, top_k=TOP_K, refresh_interval=30.0):
+        self.db = db
+        self.product_service = product_service
+        self.chat_service = chat_service
+        self.retriever = retriever
+        self.top_k = top_k
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._dirty_products = set()
+        self._full_rebuild = False
+        self._matcher = None
+        self._matcher_version = None
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._init_tables()
+        db.add_catalog_listener(self._on_catalog_changed)
+
+    def start(self):
+        """Start the background refresh, which first catches up with catalog changes"""
+        # Products without a list, or edited while the server was down, are found by digest
+        self._full_rebuild = True
+        self._thread = threading.Thread(target=self._run, name='recommendations', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Stop the background refresh after the current run"""
+        self._stopped = True
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+
+    def for_product(self, product_id, limit=8):
+        """IDs of the products most similar to a product, best first"""
+        with self.db.connection('product_neighbors') as conn:
+            rows = conn.execute('''
+                SELECT neighbor_id FROM product_neighbors
+                WHERE product_id = ? ORDER BY rank LIMIT ?
+            ''', (product_id, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def for_session(self, session_id, limit=8):
+        """IDs of the products recommended for a chat session, best first"""
+        with self.db.connection('session_recommendations') as conn:
+            rows = conn.execute('''
+                SELECT product_id FROM session_recommendations
+                WHERE session_id = ? ORDER BY rank LIMIT ?
+            ''', (session_id, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def refresh(self):
+        """Ingest new chat messages and recompute stale neighbor lists
+
+        Returns True when changed products are left for the next run.
+        """
+        started = time.perf_counter()
+        sessions, products = self._ingest_messages()
+        with self._lock:
+            full, self._full_rebuild = self._full_rebuild, False
+            if full and self.retriever.rebuilding:
+                # Lists scored against a half-built index would be recorded as current
+                full, self._full_rebuild = False, True
+            dirty, self._dirty_products = self._dirty_products, set()
+        if full:
+            dirty |= self._stale_products()
+        dirty |= products
+        batch = set(sorted(dirty)[:PRODUCTS_PER_REFRESH])
+        with self._lock:
+            self._dirty_products |= dirty - batch
+            backlog = bool(self._dirty_products)
+        self._update_products(batch)
+        if sessions:
+            self._update_sessions(sorted(sessions))
+        REFRESH_DURATION.observe(time.perf_counter() - started)
+        return backlog
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                backlog = self.refresh()
+            except Exception:
+                logger.exception("Recommendation refresh failed")
+                backlog = False
+            if not backlog:
+                self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def _on_catalog_changed(self, product_ids):
+        with self._lock:
+            if product_ids is None:
+                self._full_rebuild = True
+            else:
+                self._dirty_products.update(product_ids)
+
+    # Chat mentions
+
+    def _ingest_messages(self):
+        """Record product mentions of new messages; returns (sessions, products) to recompute"""
+        sessions, products = set(), set()
+        for source, chat_db in self.chat_service.storages():
+            last_id = self._watermark(source)
+            while True:
+                with chat_db.connection('recommendations.messages') as conn:
+                    rows = conn.execute('''
+                        SELECT id, session_id, content FROM chat_messages
+                        WHERE id > ? ORDER BY id LIMIT ?
+                    ''', (last_id, MESSAGE_BATCH)).fetchall()
+                if not rows:
+                    break
+                matcher = self._name_matcher()
+                mentions = {}
+                for _, session_id, content in rows:
+                    found = matcher.find(content or '')
+                    if found:
+                        mentions.setdefault(session_id, set()).update(found)
+                last_id = rows[-1][0]
+                sessions.update(self._record_mentions(mentions, source, last_id, products))
+                if len(rows) < MESSAGE_BATCH:
+                    break
+        return sessions, products
+
+    def _record_mentions(self, mentions, source, last_id, touched):
+        """Store new mentions and co-mention counts; returns the sessions that changed"""
+        changed = []
+        with self.db.connection('recommendations.mentions') as conn:
+            for session_id, product_ids in mentions.items():
+                known = {row[0] for row in conn.execute(
+                    'SELECT product_id FROM session_products WHERE session_id = ?', (session_id,)
+                )}
+                new = product_ids - known
+                if not new:
+                    continue
+                pairs = []
+                for product_id in sorted(new):
+                    pairs += [pair for other in known for pair in ((product_id, other), (other, product_id))]
+                    touched.update(known)
+                    known.add(product_id)
+                conn.executemany('''
+                    INSERT INTO product_comentions (product_id, other_id, sessions) VALUES (?, ?, 1)
+                    ON CONFLICT (product_id, other_id) DO UPDATE SET sessions = sessions + 1
+                ''', pairs)
+                conn.executemany(
+                    'INSERT INTO session_products (session_id, product_id) VALUES (?, ?)',
+                    [(session_id, product_id) for product_id in new]
+                )
+                touched.update(new)
+                changed.append(session_id)
+            conn.execute('''
+                INSERT INTO recommendation_sources (source, last_message_id) VALUES (?, ?)
+                ON CONFLICT (source) DO UPDATE SET last_message_id = excluded.last_message_id
+            ''', (source, last_id))
+        return changed
+
+    def _watermark(self, source):
+        with self.db.connection('recommendations.watermark') as conn:
+            row = conn.execute(
+                'SELECT last_message_id FROM recommendation_sources WHERE source = ?', (source,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def _name_matcher(self):
+        version = self.db.catalog_version
+        if self._matcher is None or self._matcher_version != version:
+            self._matcher = ProductNameMatcher(self.product_service.iter_products())
+            self._matcher_version = version
+        return self._matcher
+
+    # Neighbor lists
+
+    def _stale_products(self):
+        """Products whose document changed since their list was computed, or that are gone
+
+        Walks the catalog and the stored digests side by side in ID order;
+        nothing is scored here.
+        """
+        stale = set()
+        digests = self._iter_digests()
+        stored = next(digests, None)
+        for product in self.product_service.iter_products():
+            while stored is not None and stored[0] < product['id']:
+                stale.add(stored[0])
+                stored = next(digests, None)
+            if stored is not None and stored[0] == product['id']:
+                if stored[1] != document_digest(product):
+                    stale.add(product['id'])
+                stored = next(digests, None)
+            else:
+                stale.add(product['id'])
+        while stored is not None:
+            stale.add(stored[0])
+            stored = next(digests, None)
+
+        # Lists of deleted products that never had a digest
+        with self.db.connection('recommendations.prune') as conn:
+            conn.execute('DELETE FROM product_neighbors WHERE product_id NOT IN (SELECT id FROM products)')
+        return stale
+
+    def _iter_digests(self):
+        """(product_id, digest) rows in ID order, one page at a time"""
+        last_id = -1
+        while True:
+            with self.db.connection('recommendations.digests') as conn:
+                rows = conn.execute('''
+                    SELECT product_id, digest FROM product_digests
+                    WHERE product_id > ? ORDER BY product_id LIMIT ?
+                ''', (last_id, READ_PAGE)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def _update_products(self, product_ids):
+        """Recompute changed products and the lists they enter or leave"""
+        if not product_ids:
+            return
+        index = self.retriever.index
+        removed = [product_id for product_id in product_ids if product_id not in index]
+        present = sorted(product_id for product_id in product_ids if product_id in index)
+
+        # Lists that held a changed product may have to drop or re-rank it
+        affected = set()
+        with self.db.connection('recommendations.affected') as conn:
+            changed = sorted(product_ids)
+            for start in range(0, len(changed), REFRESH_CHUNK):
+                chunk = changed[start:start + REFRESH_CHUNK]
+                affected.update(row[0] for row in conn.execute(f'''
+                    SELECT DISTINCT product_id FROM product_neighbors
+                    WHERE neighbor_id IN ({','.join('?' * len(chunk))})
+                ''', chunk))
+            conn.executemany('DELETE FROM product_neighbors WHERE product_id = ?',
+                             [(product_id,) for product_id in removed])
+            conn.executemany('DELETE FROM product_digests WHERE product_id = ?',
+                             [(product_id,) for product_id in removed])
+
+        for start in range(0, len(present), REFRESH_CHUNK):
+            neighbors, digests = self._neighbors(present[start:start + REFRESH_CHUNK])
+            self._write_neighbors(neighbors, digests)
+            # A changed product may now belong in its new neighbors' lists too
+            affected.update(other for ranked in neighbors.values() for other, _ in ranked)
+
+        affected = sorted(affected.difference(product_ids))
+        for start in range(0, len(affected), REFRESH_CHUNK):
+            self._write_neighbors(*self._neighbors(affected[start:start + REFRESH_CHUNK]))
+        RECOMPUTED.inc('product', amount=len(present) + len(affected))
+
+    def _neighbors(self, product_ids):
+        """({product_id: [(neighbor_id, score)]} ranked by combined score, {product_id: digest})"""
+        index = self.retriever.index
+        similar = index.similar_batch(product_ids, k=CANDIDATES)
+        comentions = self._comentions(product_ids)
+        wanted = set(product_ids)
+        for candidates in similar:
+            wanted.update(other for other, _ in candidates)
+        for pairs in comentions.values():
+            wanted.update(other for other, _ in pairs)
+        products = self._products(wanted)
+        terms = {product_id: content_terms(product_document(product)) for product_id, product in products.items()}
+        names = {product_id: name_key(product['name'] or '') for product_id, product in products.items()}
+
+        scored = {}
+        for product_id, candidates in zip(product_ids, similar):
+            scores = {}
+            if product_id in products:
+                # Index scores only pick candidates; hash collisions make them unfit to rank
+                for other, _ in candidates:
+                    score = word_overlap(terms[product_id], terms.get(other))
+                    if score >= MIN_SIMILARITY:
+                        scores[other] = score
+                for other, sessions in comentions.get(product_id, ()):
+                    if other in index and other in products:
+                        scores[other] = scores.get(other, 0.0) + COMENTION_WEIGHT * sessions / (sessions + 1)
+            scored[product_id] = scores
+        neighbors = {
+            product_id: self._rank(scores, names, {names.get(product_id)})
+            for product_id, scores in scored.items()
+        }
+        digests = {
+            product_id: document_digest(products[product_id]) for product_id in product_ids if product_id in products
+        }
+        return neighbors, digests
+
+    def _products(self, product_ids):
+        """{product_id: product}, fetched a page of IDs at a time"""
+        product_ids = list(product_ids)
+        products = {}
+        for start in range(0, len(product_ids), READ_PAGE):
+            for product in self.product_service.get_products_by_ids(product_ids[start:start + READ_PAGE]):
+                products[product['id']] = product
+        return products
+
+    def _rank(self, scores, names, exclude_names):
+        """Top scores, one product per name (the catalog lists some products more than once)"""
+        ranked, seen = [], set(exclude_names)
+        for other, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            name = names.get(other)
+            if name in seen:
+                continue
+            seen.add(name)
+            ranked.append((other, score))
+            if len(ranked) == self.top_k:
+                break
+        return ranked
+
+    def _names(self, product_ids):
+        """{product_id: normalized name}"""
+        product_ids = list(product_ids)
+        names = {}
+        with self.db.connection('recommendations.names') as conn:
+            for start in range(0, len(product_ids), READ_PAGE):
+                chunk = product_ids[start:start + READ_PAGE]
+                rows = conn.execute(
+                    f"SELECT id, name FROM products WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                names.update((product_id, name_key(name or '')) for product_id, name in rows)
+        return names
+
+    def _comentions(self, product_ids):
+        result = {}
+        with self.db.connection('recommendations.comentions') as conn:
+            rows = conn.execute(f'''
+                SELECT product_id, other_id, sessions FROM product_comentions
+                WHERE product_id IN ({','.join('?' * len(product_ids))})
+            ''', list(product_ids)).fetchall()
+        for product_id, other, sessions in rows:
+            result.setdefault(product_id, []).append((other, sessions))
+        return result
+
+    def _write_neighbors(self, neighbors, digests):
+        if not neighbors:
+            return
+        with self.db.connection('recommendations.write') as conn:
+            conn.executemany('DELETE FROM product_neighbors WHERE product_id = ?',
+                             [(product_id,) for product_id in neighbors])
+            conn.executemany('''
+                INSERT INTO product_neighbors (product_id, rank, neighbor_id, score)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (product_id, rank, other, score)
+                for product_id, ranked in neighbors.items()
+                for rank, (other, score) in enumerate(ranked)
+            ])
+            conn.executemany('''
+                INSERT INTO product_digests (product_id, digest) VALUES (?, ?)
+                ON CONFLICT (product_id) DO UPDATE SET digest = excluded.digest
+            ''', list(digests.items()))
+
+    # Sessions
+
+    def _update_sessions(self, session_ids):
+        """Rank each session's candidates by their summed neighbor scores"""
+        for start in range(0, len(session_ids), REFRESH_CHUNK):
+            with self.db.connection('recommendations.sessions') as conn:
+                for session_id in session_ids[start:start + REFRESH_CHUNK]:
+                    mentioned = [row[0] for row in conn.execute(
+                        'SELECT product_id FROM session_products WHERE session_id = ?', (session_id,)
+                    )]
+                    scores = {}
+                    for product_id in mentioned:
+                        for other, score in conn.execute(
+                            'SELECT neighbor_id, score FROM product_neighbors WHERE product_id = ?',
+                            (product_id,)
+                        ):
+                            scores[other] = scores.get(other, 0.0) + score
+                    names = self._names(set(scores).union(mentioned))
+                    ranked = self._rank(scores, names, {names.get(product_id) for product_id in mentioned})
+                    conn.execute('DELETE FROM session_recommendations WHERE session_id = ?', (session_id,))
+                    conn.executemany('''
+                        INSERT INTO session_recommendations (session_id, rank, product_id, score)
+                        VALUES (?, ?, ?, ?)
+                    ''', [(session_id, rank, other, score) for rank, (other, score) in enumerate(ranked)])
+        RECOMPUTED.inc('session', amount=len(session_ids))
+
+    def _init_tables(self):
+        with self.db.connection('recommendations.init_tables') as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS product_neighbors (
+                    product_id INTEGER NOT NULL,
+                    rank INTEGER NOT NULL,
+                    neighbor_id INTEGER NOT NULL,
+                    score REAL NOT NULL,
+                    PRIMARY KEY (product_id, rank)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_product_neighbors_neighbor ON product_neighbors(neighbor_id)'
+            )
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS session_products (
+                    session_id TEXT NOT NULL,
+                    product_id INTEGER NOT NULL,
+                    PRIMARY KEY (session_id, product_id)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS product_comentions (
+                    product_id INTEGER NOT NULL,
+                    other_id INTEGER NOT NULL,
+                    sessions INTEGER NOT NULL,
+                    PRIMARY KEY (product_id, other_id)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS session_recommendations (
+                    session_id TEXT NOT NULL,
+                    rank INTEGER NOT NULL,
+                    product_id INTEGER NOT NULL,
+                    score REAL NOT NULL,
+                    PRIMARY KEY (session_id, rank)
+                ) WITHOUT ROWID
+            ''')
+            # Digest of the document each product's list was last computed from
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS product_digests (
+                    product_id INTEGER PRIMARY KEY,
+                    digest INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS recommendation_sources (
+                    source TEXT PRIMARY KEY,
+                    last_message_id INTEGER NOT NULL
+                )
+            ''')
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import re
+import time
+
+from cache import TTLCache, MISSING
+from prompt_builder import compact_whitespace, history_before
+
+class ResponseCache:
+    """Cache of LLM answers keyed on the question, its product context and history
+
+    The history part is the same window PromptBuilder sends: the rolling
+    summary plus the last history_messages messages. Two conversations share
+    an answer only when the model would have seen the same conversation.
+    The product context carries each product's price and stock, so any change
+    to them yields a different key and the stale answer is simply never hit.
+    With persist=True answers are also written to the llm_response_cache table
+    so they survive restarts and are shared between worker processes.
+    """
+
+    def __init__(self, db=None, maxsize=4096, ttl=3600, persist=False, history_messages=10):
+        self.db = db
+        self.ttl = ttl
+        self.persist = persist and db is not None
+        self.history_messages = history_messages
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk_hits = 0
+        if self.persist:
+            self._init_table()
+
+    def make_key(self, user_message, products_context, chat_history=None):
+        """Hash the normalized message, product context, summary and history window"""
+        history = history_before(user_message, chat_history)
+        summary = next((msg['content'] for msg in history if msg['type'] == 'summary'), '')
+        window = [msg for msg in history if msg['type'] != 'summary']
+        window = window[-self.history_messages:] if self.history_messages else []
+
+        payload = json.dumps([
+            self._normalize(user_message),
+            hashlib.sha256(products_context.encode()).hexdigest(),
+            hashlib.sha256(summary.encode()).hexdigest(),
+            [(msg['type'], compact_whitespace(msg['content'])) for msg in window]
+        ])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for key, or None"""
+        response = self.memory.get(key)
+        if response is not MISSING:
+            return response
+        if not self.persist:
+            return None
+
+        with self.db.connection('response_cache.get') as conn:
+            row = conn.execute(
+                'SELECT response, created_at FROM llm_response_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+        if not row:
+            return None
+
+        age = time.time() - row[1]
+        if age >= self.ttl:
+            return None
+        self.disk_hits += 1
+        self.memory.set(key, row[0], ttl=self.ttl - age)
+        return row[0]
+
+    def set(self, key, response):
+        """Store a successful response"""
+        self.memory.set(key, response)
+        if self.persist:
+            with self.db.connection('response_cache.set') as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO llm_response_cache (cache_key, response, created_at) VALUES (?, ?, ?)',
+                    (key, response, time.time())
+                )
+
+    def purge_expired(self):
+        """Delete expired rows from the persistent table"""
+        if self.persist:
+            with self.db.connection('response_cache.purge_expired') as conn:
+                conn.execute('DELETE FROM llm_response_cache WHERE created_at < ?', (time.time() - self.ttl,))
+
+    def stats(self):
+        """Memory cache counters plus hits served from disk"""
+        stats = self.memory.stats()
+        stats['disk_hits'] = self.disk_hits
+        stats['persist'] = self.persist
+        return stats
+
+    def _init_table(self):
+        with self.db.connection('response_cache.init_table') as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+
+    @staticmethod
+    def _normalize(text):
+        """Case-fold, collapse whitespace and drop trailing punctuation"""
+        return re.sub(r'\s+', ' ', text.lower()).strip().rstrip('?!. ')
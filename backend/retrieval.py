@@ -0,0 +1,451 @@
+import json
+import math
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from models import FTS_STOPWORDS
+
+# "under $1500", "below 200", "less than 50 dollars", "over 100", "between 20 and 50"
+PRICE_BETWEEN = re.compile(r'between\s*\$?\s*(\d+(?:\.\d+)?)\s*(?:and|-|to)\s*\$?\s*(\d+(?:\.\d+)?)')
+PRICE_MAX = re.compile(r'(?:under|below|less than|cheaper than|up to|max(?:imum)?|within)\s*\$?\s*(\d+(?:\.\d+)?)')
+PRICE_MIN = re.compile(r'(?:over|above|more than|at least|min(?:imum)?)\s*\$?\s*(\d+(?:\.\d+)?)')
+
+# Messages scored per matrix product by ProductRetriever.search_batch
+RETRIEVAL_BATCH_SIZE = 256
+
+# Score matrix size (floats) per chunk of ProductVectorIndex.similar_batch
+SIMILAR_BLOCK_CELLS = 1 << 24
+
+# Cosine below which a hit is hashing noise rather than a match; with 256
+# buckets unrelated products routinely score 0.05-0.2, so hits must also
+# share a real word with the message (see content_terms)
+MIN_SIMILARITY = 0.12
+
+# Words count as shared when their first STEM_LENGTH characters agree, so
+# "psychological" meets "psychology" and "cancelling" meets "canceling"
+STEM_LENGTH = 6
+
+def extract_price_filters(message):
+    """Pull a (min_price, max_price) range out of a conversational message"""
+    text = message.lower().replace(',', '')
+    between = PRICE_BETWEEN.search(text)
+    if between:
+        low, high = sorted((float(between.group(1)), float(between.group(2))))
+        return low, high
+
+    max_match = PRICE_MAX.search(text)
+    min_match = PRICE_MIN.search(text)
+    return (
+        float(min_match.group(1)) if min_match else None,
+        float(max_match.group(1)) if max_match else None
+    )
+
+def strip_price_phrases(message):
+    """The message without the price phrases extract_price_filters reads"""
+    text = message.lower().replace(',', '')
+    for pattern in (PRICE_BETWEEN, PRICE_MAX, PRICE_MIN):
+        text = pattern.sub(' ', text)
+    return text
+
+def product_document(product):
+    """Text that represents a product in the vector index"""
+    specifications = product.get('specifications') or ''
+    try:
+        specs = json.loads(specifications)
+        if isinstance(specs, dict):
+            specifications = ' '.join(f'{key} {value}' for key, value in specs.items())
+    except (TypeError, ValueError):
+        pass
+
+    # Name and description are repeated so they outweigh specification values
+    return ' '.join(filter(None, [
+        product.get('name'), product.get('name'), product.get('brand'), product.get('category'),
+        product.get('description'), product.get('description'), specifications
+    ]))
+
+def content_words(text):
+    """Lower-cased content words of text with a trailing plural 's' dropped"""
+    words = []
+    for word in re.findall(r'\w+', text.lower()):
+        if len(word) < 2 or word in FTS_STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+def content_terms(text):
+    """Truncated stems of the content words of text"""
+    return {word[:STEM_LENGTH] for word in content_words(text)}
+
+class HashingVectorizer:
+    """Signed feature hashing of words, word bigrams and character trigrams"""
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def features(self, text):
+        """Map text to {bucket: signed count}"""
+        words = content_words(text)
+        grams = list(words)
+        grams.extend(f'{a} {b}' for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f'#{word}#'
+            grams.extend(f'#3{padded[i:i + 3]}' for i in range(len(padded) - 2))
+
+        counts = {}
+        for gram in grams:
+            digest = zlib.crc32(gram.encode())
+            bucket = digest % self.dim
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            counts[bucket] = counts.get(bucket, 0.0) + sign
+        return counts
+
+class ProductVectorIndex:
+    """Dense TF-IDF matrix of hashed product features with batched top-k search
+
+    Rows are L2-normalised float32 vectors, so one matrix product against the
+    query matrix yields cosine scores for every product at once. The matrix
+    can be saved to disk and reopened memory-mapped (copy-on-write), and
+    grows in place as products are upserted.
+
+    Limits: every query batch reads the whole matrix, dim * 4 bytes per
+    product (1 KiB at dim=256, so about 1 GB per pass at a million products),
+    and with so few buckets unrelated products collide often. The cosine
+    ranks candidates; ProductRetriever's shared-stem check is what keeps
+    them relevant. A much larger catalog wants an inverted or ANN index.
+    """
+
+    def __init__(self, dim=256):
+        self.vectorizer = HashingVectorizer(dim)
+        self.dim = dim
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.row_ids = np.zeros(0, dtype=np.int64)
+        self.doc_freq = np.zeros(dim, dtype=np.float64)
+        self.doc_count = 0
+        self.size = 0
+        self._rows = {}
+        self._free_rows = []
+        self._lock = threading.Lock()
+        # Catalog revision of a loaded index file (None when unknown)
+        self.revision = None
+
+    def build(self, products):
+        """Rebuild the whole index from an iterable of product dicts"""
+        ids = []
+        features = []
+        doc_freq = np.zeros(self.dim, dtype=np.float64)
+        for product in products:
+            counts = self.vectorizer.features(product_document(product))
+            ids.append(product['id'])
+            features.append(counts)
+            for bucket, count in counts.items():
+                if count:
+                    doc_freq[bucket] += 1
+
+        matrix = np.zeros((len(ids), self.dim), dtype=np.float32)
+        idf = self._idf(doc_freq, len(ids))
+        for row, counts in enumerate(features):
+            matrix[row] = self._weigh(counts, idf)
+
+        with self._lock:
+            self.matrix = matrix
+            self.row_ids = np.array(ids, dtype=np.int64)
+            self.doc_freq = doc_freq
+            self.doc_count = len(ids)
+            self.size = len(ids)
+            self._rows = {product_id: row for row, product_id in enumerate(ids)}
+            self._free_rows = []
+
+    def upsert(self, product):
+        """Add or refresh one product using the current IDF weights"""
+        counts = self.vectorizer.features(product_document(product))
+        with self._lock:
+            row = self._rows.get(product['id'])
+            if row is None:
+                self.doc_count += 1
+                row = self._free_rows.pop() if self._free_rows else self._append_row()
+                self._rows[product['id']] = row
+                self.row_ids[row] = product['id']
+            else:
+                self._forget_terms(row)
+            for bucket, count in counts.items():
+                if count:
+                    self.doc_freq[bucket] += 1
+            self.matrix[row] = self._weigh(counts, self._idf(self.doc_freq, self.doc_count))
+
+    def remove(self, product_id):
+        """Drop a product; its row is zeroed and reused by the next insert"""
+        with self._lock:
+            row = self._rows.pop(product_id, None)
+            if row is None:
+                return
+            self._forget_terms(row)
+            self.matrix[row] = 0.0
+            self.row_ids[row] = -1
+            self.doc_count = max(self.doc_count - 1, 0)
+            self._free_rows.append(row)
+
+    def search(self, text, k=10, min_score=0.0):
+        """Return [(product_id, score)] for the k products most similar to text"""
+        return self.search_batch([text], k, min_score)[0]
+
+    def search_batch(self, texts, k=10, min_score=0.0):
+        """Score many queries with a single matrix product, keeping hits above min_score"""
+        with self._lock:
+            idf = self._idf(self.doc_freq, self.doc_count)
+            matrix = self.matrix[:self.size]
+            row_ids = self.row_ids[:self.size]
+        if not len(matrix):
+            return [[] for _ in texts]
+
+        queries = np.stack([
+            self._weigh(self.vectorizer.features(text), idf) for text in texts
+        ])
+        scores = queries @ matrix.T
+
+        results = []
+        k = min(k, scores.shape[1])
+        for query, row_scores in zip(queries, scores):
+            if not query.any():
+                results.append([])
+                continue
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            results.append([
+                (int(row_ids[row]), float(row_scores[row]))
+                for row in top if row_scores[row] > min_score and row_ids[row] >= 0
+            ])
+        return results
+
+    def similar_batch(self, product_ids, k=10, min_score=0.0):
+        """[(product_id, score)] of the k products most similar to each given product
+
+        Only scores above min_score count. The product itself is excluded;
+        unknown IDs get an empty list. Rows are
+        scored against the whole matrix in chunks that keep the score block
+        around SIMILAR_BLOCK_CELLS floats.
+        """
+        with self._lock:
+            matrix = self.matrix[:self.size]
+            row_ids = self.row_ids[:self.size]
+            rows = [self._rows.get(product_id) for product_id in product_ids]
+        results = [[] for _ in product_ids]
+        present = [(position, row) for position, row in enumerate(rows) if row is not None]
+        if not present or not len(matrix):
+            return results
+
+        k = min(k, len(matrix) - 1)
+        chunk = max(1, SIMILAR_BLOCK_CELLS // len(matrix))
+        for start in range(0, len(present), chunk):
+            block = present[start:start + chunk]
+            scores = matrix[[row for _, row in block]] @ matrix.T
+            for (position, row), row_scores in zip(block, scores):
+                row_scores[row] = -np.inf
+                if k <= 0:
+                    continue
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                top = top[np.argsort(-row_scores[top])]
+                results[position] = [
+                    (int(row_ids[other]), float(row_scores[other]))
+                    for other in top if row_scores[other] > min_score and row_ids[other] >= 0
+                ]
+        return results
+
+    def save(self, path, revision=None):
+        """Persist the index next to path (.npy matrix plus metadata)
+
+        revision is the catalog revision the index was built from; load()
+        callers compare it with the current one to detect a stale file.
+        """
+        with self._lock:
+            np.save(f'{path}.npy', self.matrix[:self.size])
+            np.save(f'{path}.ids.npy', self.row_ids[:self.size])
+            np.save(f'{path}.df.npy', self.doc_freq)
+            with open(f'{path}.json', 'w') as f:
+                json.dump({'revision': revision, 'dim': self.dim}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Open a saved index memory-mapped; writes stay private to this process"""
+        matrix = np.load(f'{path}.npy', mmap_mode='c')
+        index = cls(dim=matrix.shape[1])
+        index.matrix = matrix
+        index.row_ids = np.array(np.load(f'{path}.ids.npy'), dtype=np.int64)
+        index.doc_freq = np.load(f'{path}.df.npy')
+        index.size = len(index.row_ids)
+        index._rows = {int(product_id): row for row, product_id in enumerate(index.row_ids) if product_id >= 0}
+        index._free_rows = [row for row, product_id in enumerate(index.row_ids) if product_id < 0]
+        index.doc_count = len(index._rows)
+        try:
+            with open(f'{path}.json') as f:
+                index.revision = json.load(f).get('revision')
+        except (OSError, ValueError):
+            index.revision = None
+        return index
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, product_id):
+        return product_id in self._rows
+
+    def _append_row(self):
+        """Grow the matrix geometrically and return the next free row"""
+        if self.size == len(self.matrix):
+            capacity = max(16, len(self.matrix) * 2)
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            matrix[:self.size] = self.matrix[:self.size]
+            row_ids = np.full(capacity, -1, dtype=np.int64)
+            row_ids[:self.size] = self.row_ids[:self.size]
+            self.matrix, self.row_ids = matrix, row_ids
+        self.size += 1
+        return self.size - 1
+
+    def _forget_terms(self, row):
+        """Take a row's buckets out of doc_freq before it is rewritten or cleared
+
+        A row's non-zero buckets are exactly the buckets it added to doc_freq
+        (weights are never zero for a non-zero count), so the stored row is
+        its own term set.
+        """
+        self.doc_freq -= self.matrix[row] != 0
+        np.maximum(self.doc_freq, 0, out=self.doc_freq)
+
+    def _idf(self, doc_freq, doc_count):
+        return np.log((doc_count + 1) / (doc_freq + 1)) + 1.0
+
+    def _weigh(self, counts, idf):
+        """Sub-linear TF times IDF, L2-normalised"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for bucket, count in counts.items():
+            if count:
+                vector[bucket] = math.copysign(1.0 + math.log(abs(count)), count) * idf[bucket]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+class ProductRetriever:
+    """Semantic product lookup for chat messages, kept in sync with the catalog"""
+
+    def __init__(self, db, product_service, index_path=None, dim=256):
+        self.db = db
+        self.product_service = product_service
+        self.index_path = index_path
+        # Background rebuild started by a bulk catalog change; changes arriving
+        # while it runs set _rebuild_pending and make it go round once more
+        self._rebuild_thread = None
+        self._rebuild_pending = False
+        self._rebuild_lock = threading.Lock()
+        self.index = self._open_index(dim)
+        db.add_catalog_listener(self._on_catalog_changed)
+
+    @property
+    def rebuilding(self):
+        """True while a background rebuild has not replaced the index yet"""
+        return self._rebuild_thread is not None and self._rebuild_thread.is_alive()
+
+    def search(self, message, limit=5):
+        """Products relevant to a free-text message, honouring price phrases"""
+        return self.search_batch([message], limit)[0]
+
+    def search_batch(self, messages, limit=5):
+        """search() for many messages, with one index pass and one product fetch per chunk"""
+        results = []
+        for start in range(0, len(messages), RETRIEVAL_BATCH_SIZE):
+            results.extend(self._search_chunk(messages[start:start + RETRIEVAL_BATCH_SIZE], limit))
+        return results
+
+    def _search_chunk(self, messages, limit):
+        filters = [extract_price_filters(message) for message in messages]
+        results = []
+        for message, (min_price, max_price), products in zip(
+                messages, filters, self._index_matches(messages, filters, limit)):
+            if not products:
+                # Nothing semantically close: fall back to full-text search
+                products = self.product_service.search_products(
+                    message, min_price=min_price, max_price=max_price, limit=limit, match_any=True
+                )
+            results.append(products[:limit])
+        return results
+
+    def _index_matches(self, messages, filters, limit):
+        """Index hits per message that clear MIN_SIMILARITY, share a word with it and fit its prices"""
+        # Prices are filters, not words to match ("under 1500" is not about "iPhone 15")
+        queries = [strip_price_phrases(message) for message in messages]
+        # Over-fetch so the shared-word check and price filters still leave enough candidates
+        oversample = limit * 8 if any(low or high for low, high in filters) else limit * 4
+        hits = self.index.search_batch(queries, k=oversample, min_score=MIN_SIMILARITY)
+        wanted = list(dict.fromkeys(product_id for message_hits in hits for product_id, _ in message_hits))
+        by_id = {product['id']: product for product in self.product_service.get_products_by_ids(wanted)}
+        terms = {product_id: content_terms(product_document(product)) for product_id, product in by_id.items()}
+
+        matches = []
+        for query, (min_price, max_price), message_hits in zip(queries, filters, hits):
+            # A hit must share a real word with the message, not just hash buckets
+            message_terms = content_terms(query)
+            products = [
+                by_id[product_id] for product_id, _ in message_hits
+                if product_id in by_id and message_terms & terms[product_id]
+            ]
+            if min_price:
+                products = [product for product in products if product['price'] >= min_price]
+            if max_price:
+                products = [product for product in products if product['price'] <= max_price]
+            matches.append(products)
+        return matches
+
+    def rebuild(self):
+        """Re-index the full catalog and persist it if a path is configured"""
+        # Read first: writes during the build leave the saved file marked stale
+        revision = self.db.catalog_revision()
+        self.index.build(self.product_service.iter_products())
+        if self.index_path:
+            self.index.save(self.index_path, revision)
+
+    def _open_index(self, dim):
+        """Reuse a persisted index when it was built from the current catalog revision"""
+        if self.index_path and os.path.exists(f'{self.index_path}.npy'):
+            index = ProductVectorIndex.load(self.index_path)
+            if (index.dim == dim and index.revision == self.db.catalog_revision()
+                    and len(index) == self.product_service.count_products()):
+                return index
+
+        self.index = ProductVectorIndex(dim)
+        self.rebuild()
+        return self.index
+
+    def _on_catalog_changed(self, product_ids):
+        """Apply product writes to the index incrementally"""
+        if product_ids is None:
+            with self._rebuild_lock:
+                self._rebuild_pending = True
+                if self._rebuild_thread is None:
+                    self._rebuild_thread = threading.Thread(target=self._rebuild_until_current, daemon=True)
+                    self._rebuild_thread.start()
+            return
+
+        for product_id in product_ids:
+            product = self.product_service.get_product_by_id(product_id)
+            if product:
+                self.index.upsert(product)
+            else:
+                self.index.remove(product_id)
+
+    def _rebuild_until_current(self):
+        """Background rebuild loop: one thread, re-run while changes keep arriving"""
+        try:
+            while True:
+                with self._rebuild_lock:
+                    if not self._rebuild_pending:
+                        self._rebuild_thread = None
+                        return
+                    self._rebuild_pending = False
+                self.rebuild()
+        except Exception:
+            with self._rebuild_lock:
+                self._rebuild_thread = None
+            raise
@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Share of requests whose full span breakdown is logged
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+
+# Stage durations (seconds) accumulated for the request being served
+_stages = ContextVar('request_stages', default=None)
+
+def start_request():
+    """Begin collecting stage timings for the current request"""
+    _stages.set({})
+
+def record(stage, seconds):
+    """Add time spent in a stage to the current request and the span histogram"""
+    metrics.SPAN_DURATION.observe(seconds, stage)
+    stages = _stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block as part of stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+def request_stages():
+    """Stage durations recorded so far for the current request"""
+    return dict(_stages.get() or {})
+
+def server_timing_header():
+    """Format the current request's stages as a Server-Timing header value"""
+    return ', '.join(
+        f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in sorted(request_stages().items())
+    )
+
+def finish_request(method, endpoint, status, seconds):
+    """Count the request, observe its latency and log a sampled span breakdown"""
+    metrics.REQUESTS.inc(method, endpoint, status)
+    metrics.REQUEST_DURATION.observe(seconds, endpoint)
+    if TRACE_SAMPLE_RATE and random.random() < TRACE_SAMPLE_RATE:
+        logger.info(json.dumps({
+            'event': 'request_trace',
+            'method': method,
+            'endpoint': endpoint,
+            'status': status,
+            'duration_ms': round(seconds * 1000, 3),
+            'spans_ms': {stage: round(value * 1000, 3) for stage, value in request_stages().items()}
+        }))
@@ -0,0 +1,143 @@
+"""Local stand-in for the Groq chat completions API
+
+Serves POST /openai/v1/chat/completions (streaming and non-streaming) with a
+configurable time to first token and token rate, so the backend can be load
+tested without network access or API cost. Point the backend at it with
+GROQ_BASE_URL=http://127.0.0.1:<port>.
+
+Usage: python fake_groq.py --port 8081 --latency-ms 300 --tokens-per-second 250
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = (
+    "<think>The customer is asking about products. Let me look at the context "
+    "and pick the most relevant items.</think>\n"
+    "Answer: Based on what we have in stock, I'd recommend the top items listed above. "
+    "They have excellent ratings and are competitively priced. Would you like a "
+    "comparison or more details on any of them?"
+)
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Set by FakeGroqServer
+    latency = 0.3
+    tokens_per_second = 250.0
+    answer_tokens = ANSWER.split(' ')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        prompt_chars = sum(len(message.get('content') or '') for message in body.get('messages', []))
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        time.sleep(self.latency)
+
+        if body.get('stream'):
+            self._stream(completion_id, body.get('model', 'fake'))
+        else:
+            self._complete(completion_id, body.get('model', 'fake'), prompt_chars)
+
+    def _complete(self, completion_id, model, prompt_chars):
+        time.sleep(len(self.answer_tokens) / self.tokens_per_second)
+        payload = json.dumps({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ANSWER},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_chars // 4,
+                'completion_tokens': len(self.answer_tokens),
+                'total_tokens': prompt_chars // 4 + len(self.answer_tokens)
+            }
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, completion_id, model):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        delay = 1.0 / self.tokens_per_second
+        for position, token in enumerate(self.answer_tokens):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': token if position == 0 else ' ' + token},
+                    'finish_reason': None
+                }]
+            }
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+            time.sleep(delay)
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+        self.close_connection = True
+
+class FakeGroqServer:
+    """Run the fake API on a background thread"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=300, tokens_per_second=250.0):
+        handler = type('ConfiguredFakeGroqHandler', (FakeGroqHandler,), {
+            'latency': latency_ms / 1000.0,
+            'tokens_per_second': tokens_per_second,
+        })
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Groq chat completions server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=300, help='Delay before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=250, help='Generation speed')
+    args = parser.parse_args()
+
+    server = FakeGroqServer(args.host, args.port, args.latency_ms, args.tokens_per_second)
+    print(f'Fake Groq listening on {server.base_url} (set GROQ_BASE_URL to this)')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
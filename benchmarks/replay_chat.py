@@ -0,0 +1,408 @@
+"""Replay recorded chat sessions through ChatbotService offline
+
+Every user turn stored in chat_messages is re-run through
+ChatbotService.process_user_message with the history it had when it was
+recorded. The Groq client is replaced by a local stub, so runs need no
+network and are repeatable:
+
+- stub: a deterministic answer derived from the question (default)
+- recorded: the bot reply that followed the turn in the recording
+
+The report covers per-stage latency (from the same spans as Server-Timing),
+the share of turns where the vector index found products above the
+relevance floor (full-text fallbacks don't count), prompt token counts,
+locally routed intents and response/catalog cache hit rates.
+
+Sessions are read with keyset pagination and handed out in small chunks to
+worker processes, with a bounded number of chunks in flight, so memory stays
+flat for any number of recorded messages. Each worker has its own
+ChatbotService, so its caches only see the sessions it replays.
+
+Usage:
+    python benchmarks/replay_chat.py --db backend/ecommerce.db --processes 8 --output replay.json
+    python benchmarks/replay_chat.py --chat-shards backend/chat_shards --history summary
+    python benchmarks/replay_chat.py compare replay_before.json replay_after.json
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from run_benchmarks import BACKEND_DIR, git_revision, summarize
+
+# Stage latency samples kept per stage for percentiles (reservoir sampled beyond this)
+MAX_SAMPLES = 200000
+
+# Messages read per query while walking a session
+MESSAGE_PAGE = 500
+
+STUB_ANSWER = (
+    "<think>Stub reasoning.</think>\n"
+    "Answer: Here is what we have for \"{topic}\". The products listed above match your request; "
+    "let me know if you would like more details or a comparison."
+)
+
+class StubCompletions:
+    """Deterministic stand-in for client.chat.completions"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        # Set before each turn in recorded mode
+        self.recorded = None
+
+    def create(self, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        messages = kwargs['messages']
+        if self.recorded is not None:
+            answer = self.recorded
+        else:
+            question = ' '.join(messages[-1]['content'].split())
+            answer = STUB_ANSWER.format(topic=question[:80])
+        prompt_chars = sum(len(message['content']) for message in messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=answer))],
+            usage=SimpleNamespace(prompt_tokens=prompt_chars // 4, completion_tokens=len(answer.split()))
+        )
+
+class Reservoir:
+    """Bounded uniform sample of a stream of values"""
+
+    def __init__(self, size=MAX_SAMPLES, seed=7):
+        self.size = size
+        self.count = 0
+        self.values = []
+        self._rng = random.Random(seed)
+
+    def extend(self, values):
+        for value in values:
+            self.count += 1
+            if len(self.values) < self.size:
+                self.values.append(value)
+            else:
+                slot = self._rng.randrange(self.count)
+                if slot < self.size:
+                    self.values[slot] = value
+
+# Worker process state, set up by init_worker
+_worker = {}
+
+def init_worker(catalog_path, llm_mode, llm_latency, history_mode):
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('GROQ_API_KEY', 'replay')
+    import timing
+    from chatbot_service import ChatbotService, CHAT_CONTEXT_MESSAGES
+    from conversation_memory import ExtractiveSummarizer
+    from models import Database
+
+    # The catalog is an input: never create schema in it or write to it
+    service = ChatbotService(Database(catalog_path, read_only=True))
+    completions = StubCompletions(llm_latency)
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    # Count turns where the prompt's products came from the index, not the full-text fallback
+    retrieval = {'turns': 0, 'hits': 0}
+    matched = []
+    index_matches = service.retriever._index_matches
+    get_products_context = service._get_products_context
+
+    def tracked_index_matches(messages, filters, limit):
+        matched[:] = index_matches(messages, filters, limit)
+        return matched
+
+    def tracked_products_context(user_message):
+        matched.clear()
+        context = get_products_context(user_message)
+        retrieval['turns'] += 1
+        retrieval['hits'] += bool(matched and matched[0])
+        return context
+    service.retriever._index_matches = tracked_index_matches
+    service._get_products_context = tracked_products_context
+
+    _worker.update(
+        service=service, completions=completions, timing=timing, retrieval=retrieval,
+        llm_mode=llm_mode, history_mode=history_mode, window=CHAT_CONTEXT_MESSAGES,
+        summarizer=ExtractiveSummarizer(),
+        keep_messages=int(os.getenv('CHAT_SUMMARY_KEEP', 4)),
+        compact_after=int(os.getenv('CHAT_SUMMARY_AFTER', 8)),
+        connections={}
+    )
+
+def iter_session_messages(conn, session_id):
+    """A session's messages in order, one page at a time"""
+    last_id = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, message_type, content FROM chat_messages
+            WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?
+        ''', (session_id, last_id, MESSAGE_PAGE)).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield {'id': row[0], 'type': row[1], 'content': row[2], 'timestamp': None}
+        last_id = rows[-1][0]
+
+def replay_chunk(source_path, session_ids):
+    """Replay a chunk of sessions; returns the chunk's counters and samples"""
+    state = _worker
+    service = state['service']
+    conn = state['connections'].get(source_path)
+    if conn is None:
+        conn = state['connections'][source_path] = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True)
+
+    response_before = service.response_cache.stats()
+    catalog_before = service.product_service.cache_stats()
+    retrieval_before = dict(state['retrieval'])
+    result = {
+        'sessions': len(session_ids), 'turns': 0, 'errors': 0, 'cached': 0, 'routed': 0,
+        'stages': {}, 'prompt_tokens': [], 'history_tokens': [], 'summary_tokens': []
+    }
+
+    for session_id in session_ids:
+        history, summary = [], None
+        # One message of lookahead: the recorded reply to a user turn is the message after it
+        previous = None
+        for message in iter_session_messages(conn, session_id):
+            if previous is not None:
+                reply = message['content'] if message['type'] == 'bot' else None
+                history, summary = _advance(state, result, previous, reply, history, summary)
+            previous = message
+        if previous is not None:
+            _advance(state, result, previous, None, history, summary)
+
+    response_after = service.response_cache.stats()
+    catalog_after = service.product_service.cache_stats()
+    result['response_cache'] = {key: response_after[key] - response_before[key] for key in ('hits', 'misses')}
+    result['catalog_cache'] = {key: catalog_after[key] - catalog_before[key] for key in ('hits', 'misses')}
+    result['retrieval'] = {key: state['retrieval'][key] - retrieval_before[key] for key in ('turns', 'hits')}
+    return result
+
+def _advance(state, result, message, reply, history, summary):
+    """Replay message if it is a user turn, then add it to the session's history"""
+    if message['type'] == 'user':
+        _replay_turn(state, result, message, reply, history, summary)
+    return _trim_history(state, history + [message], summary)
+
+def _replay_turn(state, result, message, reply, history, summary):
+    service, timing = state['service'], state['timing']
+    chat_history = ([{'id': None, 'type': 'summary', 'content': summary, 'timestamp': None}] if summary else [])
+    chat_history += history + [message]
+    state['completions'].recorded = reply if state['llm_mode'] == 'recorded' else None
+
+    timing.start_request()
+    started = time.perf_counter()
+    outcome = service.process_user_message(message['content'], chat_history)
+    stages = timing.request_stages()
+    stages['total'] = time.perf_counter() - started
+
+    result['turns'] += 1
+    result['errors'] += not outcome['success']
+    result['cached'] += bool(outcome.get('cached'))
+    result['routed'] += bool(outcome.get('intent'))
+    for stage, seconds in stages.items():
+        result['stages'].setdefault(stage, []).append(seconds * 1000)
+    prompt = outcome.get('prompt')
+    if prompt:
+        result['prompt_tokens'].append(prompt['input_tokens'])
+        result['history_tokens'].append(prompt['history_tokens'])
+        result['summary_tokens'].append(prompt.get('summary_tokens', 0))
+
+def _trim_history(state, history, summary):
+    """Keep the history the server would send: a recent window, or summary + unsummarized turns"""
+    if state['history_mode'] == 'window':
+        # The server's window includes the current message
+        return history[-(state['window'] - 1):], None
+    if len(history) > state['compact_after']:
+        folding = history[:-state['keep_messages']]
+        summary = state['summarizer'].summarize(summary, folding)
+        history = history[-state['keep_messages']:]
+    return history, summary
+
+def chat_sources(args):
+    if args.chat_shards:
+        return sorted(glob.glob(os.path.join(args.chat_shards, 'chat-*.db')))
+    return [args.chat_db or args.db]
+
+def iter_session_chunks(sources, chunk_size, limit=None):
+    """(source_path, [session_id, ...]) chunks, read with keyset pagination"""
+    yielded = 0
+    for source in sources:
+        conn = sqlite3.connect(f'file:{source}?mode=ro', uri=True)
+        try:
+            last = ''
+            while True:
+                page = chunk_size if limit is None else min(chunk_size, limit - yielded)
+                if page <= 0:
+                    return
+                # Walks the (session_id, id) index, one entry per session
+                rows = conn.execute('''
+                    SELECT DISTINCT session_id FROM chat_messages
+                    WHERE session_id > ? ORDER BY session_id LIMIT ?
+                ''', (last, page)).fetchall()
+                if not rows:
+                    break
+                last = rows[-1][0]
+                yielded += len(rows)
+                yield source, [row[0] for row in rows]
+        finally:
+            conn.close()
+
+def merge(totals, chunk, reservoirs):
+    for key in ('sessions', 'turns', 'errors', 'cached', 'routed'):
+        totals[key] += chunk[key]
+    for group in ('response_cache', 'catalog_cache', 'retrieval'):
+        for key, value in chunk[group].items():
+            totals[group][key] += value
+    for stage, values in chunk['stages'].items():
+        reservoirs.setdefault(stage, Reservoir()).extend(values)
+    for key in ('prompt_tokens', 'history_tokens', 'summary_tokens'):
+        reservoirs.setdefault(key, Reservoir()).extend(chunk[key])
+
+def hit_rate(counters):
+    lookups = counters['hits'] + counters['misses']
+    return round(counters['hits'] / lookups, 4) if lookups else None
+
+def run(args):
+    sources = chat_sources(args)
+    totals = {
+        'sessions': 0, 'turns': 0, 'errors': 0, 'cached': 0, 'routed': 0,
+        'response_cache': {'hits': 0, 'misses': 0},
+        'catalog_cache': {'hits': 0, 'misses': 0},
+        'retrieval': {'turns': 0, 'hits': 0},
+    }
+    reservoirs = {}
+    started = time.perf_counter()
+    initargs = (os.path.abspath(args.db), args.llm, args.llm_latency_ms / 1000.0, args.history)
+
+    with ProcessPoolExecutor(max_workers=args.processes, initializer=init_worker, initargs=initargs) as pool:
+        in_flight = set()
+        chunks = iter_session_chunks(sources, args.sessions_per_task, args.limit_sessions)
+        for source, session_ids in chunks:
+            in_flight.add(pool.submit(replay_chunk, source, session_ids))
+            if len(in_flight) >= args.processes * 4:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge(totals, future.result(), reservoirs)
+            if args.progress and totals['turns']:
+                print(f"\r{totals['sessions']} sessions, {totals['turns']} turns", end='', file=sys.stderr)
+        for future in in_flight:
+            merge(totals, future.result(), reservoirs)
+    elapsed = time.perf_counter() - started
+    if args.progress:
+        print(file=sys.stderr)
+
+    stage_counts = {stage: reservoir.count for stage, reservoir in reservoirs.items()}
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_revision': git_revision(),
+            'sources': sources,
+            'catalog': args.db,
+            'llm': args.llm,
+            'llm_latency_ms': args.llm_latency_ms,
+            'history': args.history,
+            'processes': args.processes,
+            'python': sys.version.split()[0],
+            'cpu_count': os.cpu_count(),
+        },
+        'sessions': totals['sessions'],
+        'turns': totals['turns'],
+        'errors': totals['errors'],
+        'seconds': round(elapsed, 3),
+        'turns_per_second': round(totals['turns'] / elapsed, 2) if elapsed else None,
+        'routed_intent_rate': round(totals['routed'] / totals['turns'], 4) if totals['turns'] else None,
+        'retrieval_hit_rate': (
+            round(totals['retrieval']['hits'] / totals['retrieval']['turns'], 4)
+            if totals['retrieval']['turns'] else None
+        ),
+        'response_cache_hit_rate': hit_rate(totals['response_cache']),
+        'catalog_cache_hit_rate': hit_rate(totals['catalog_cache']),
+        'prompt_tokens': summarize(reservoirs.get('prompt_tokens', Reservoir()).values),
+        'history_tokens': summarize(reservoirs.get('history_tokens', Reservoir()).values),
+        'summary_tokens': summarize(reservoirs.get('summary_tokens', Reservoir()).values),
+        # Stages seen on at least 1% of turns, in milliseconds
+        'stages_ms': {
+            stage: dict(summarize(reservoirs[stage].values), turns=count)
+            for stage, count in sorted(stage_counts.items())
+            if stage not in ('prompt_tokens', 'history_tokens', 'summary_tokens')
+            and count >= max(1, totals['turns'] // 100)
+        },
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+        print(f'\nSaved report to {args.output}')
+    return report
+
+def print_report(report):
+    print(f"{report['sessions']} sessions, {report['turns']} turns in {report['seconds']}s "
+          f"({report['turns_per_second']} turns/s), {report['errors']} errors")
+    for key in ('retrieval_hit_rate', 'routed_intent_rate', 'response_cache_hit_rate', 'catalog_cache_hit_rate'):
+        print(f"{key:<24} {report[key]}")
+    for key in ('prompt_tokens', 'history_tokens', 'summary_tokens'):
+        values = report[key] or {}
+        print(f"{key:<24} p50 {values.get('p50')}  p95 {values.get('p95')}  mean {values.get('mean')}")
+    print(f"\n{'stage':<28} {'turns':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9}")
+    for stage, values in report['stages_ms'].items():
+        print(f"{stage:<28} {values['turns']:>8} {values['p50']:>9.3f} {values['p95']:>9.3f} "
+              f"{values['p99']:>9.3f} {values['mean']:>9.3f}")
+
+def compare(baseline_path, candidate_path):
+    """Print changes in rates, token counts and stage latency between two replays"""
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(candidate_path, encoding='utf-8') as candidate_file:
+        candidate = json.load(candidate_file)
+
+    def change(old, new):
+        if not old or new is None:
+            return '     n/a'
+        return f'{(new - old) / old * 100:+7.1f}%'
+
+    for key in ('turns_per_second', 'retrieval_hit_rate', 'routed_intent_rate', 'response_cache_hit_rate'):
+        print(f"{key:<28} {baseline.get(key)!s:>9} -> {candidate.get(key)!s:<9} {change(baseline.get(key), candidate.get(key))}")
+    for key in ('prompt_tokens', 'history_tokens'):
+        old, new = baseline.get(key) or {}, candidate.get(key) or {}
+        print(f"{key + ' p50':<28} {old.get('p50')!s:>9} -> {new.get('p50')!s:<9} {change(old.get('p50'), new.get('p50'))}")
+    print(f"\n{'stage':<28} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage, new in candidate['stages_ms'].items():
+        old = baseline['stages_ms'].get(stage)
+        if old:
+            print(f"{stage:<28} " + ' '.join(f"{change(old.get(p), new.get(p)):>9}" for p in ('p50', 'p95', 'p99')))
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'compare':
+        if len(argv) != 3:
+            print('usage: replay_chat.py compare BASELINE.json CANDIDATE.json')
+            return 2
+        compare(argv[1], argv[2])
+        return 0
+
+    parser = argparse.ArgumentParser(description='Replay recorded chat sessions through ChatbotService')
+    parser.add_argument('--db', default=str(BACKEND_DIR / 'ecommerce.db'), help='Catalog database')
+    parser.add_argument('--chat-db', help='Database holding chat_messages (default: --db)')
+    parser.add_argument('--chat-shards', help='Read chat_messages from the chat-*.db shard files in this directory')
+    parser.add_argument('--llm', choices=['stub', 'recorded'], default='stub',
+                        help='Answer with a deterministic stub or with the recorded bot reply')
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help='Simulated LLM latency per call')
+    parser.add_argument('--history', choices=['window', 'summary'], default='window',
+                        help='Send the last messages verbatim, or a rolling summary plus recent turns')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--sessions-per-task', type=int, default=20)
+    parser.add_argument('--limit-sessions', type=int, help='Replay at most this many sessions')
+    parser.add_argument('--progress', action='store_true', help='Print progress to stderr')
+    parser.add_argument('--output', help='Save the report as JSON')
+    run(parser.parse_args(argv))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
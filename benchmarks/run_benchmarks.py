@@ -0,0 +1,423 @@
+"""End-to-end load and latency benchmarks for the backend API
+
+For each catalog size a fresh SQLite catalog is generated and imported, the
+backend is started against it (WSGI or ASGI) with ChatbotService pointed at
+a local fake Groq server, and every endpoint is driven at each concurrency
+level. Results (throughput, p50/p95/p99 latency and the server-reported
+db/llm time from the Server-Timing header) are printed and saved as JSON.
+
+Chat messages are generated per request, and the LLM response cache and
+intent router are switched off unless --chat-shortcuts is given, so chat
+latency measures real LLM round trips. Chat rows also report how many
+requests the response cache and the intent router answered.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 1000 100000 1000000 --concurrency 1 8 32
+    python benchmarks/run_benchmarks.py compare baseline.json candidate.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+
+from fake_groq import FakeGroqServer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+ENDPOINTS = ('login', 'chat', 'search', 'product', 'categories', 'recommendations')
+
+CATEGORIES = ['Electronics', 'Books', 'Clothing', 'Home & Garden', 'Sports & Outdoors']
+BRANDS = ['Apple', 'Samsung', 'Sony', 'Nike', 'Adidas', 'Penguin', 'IKEA', 'Bosch', 'Dell', 'Lenovo']
+NOUNS = ['laptop', 'phone', 'headphones', 'novel', 'jacket', 'shoes', 'lamp', 'chair', 'tent', 'watch',
+         'camera', 'backpack', 'blender', 'monitor', 'keyboard', 'racket', 'hoodie', 'cookbook']
+ADJECTIVES = ['wireless', 'premium', 'lightweight', 'waterproof', 'classic', 'compact', 'ergonomic',
+              'professional', 'portable', 'organic', 'smart', 'vintage']
+CHAT_TEMPLATES = [
+    'Do you have a {adjective} {noun}?',
+    'I need a {adjective} {noun} under {price}',
+    'Which {noun} from {brand} would you recommend?',
+    'Compare your {adjective} {noun} options',
+    'Looking for a {noun} by {brand} around {price} dollars',
+]
+
+# Admin key the benchmark server is started with, for /api/cache/stats
+ADMIN_KEY = 'benchmark-admin'
+
+SERVER_SNIPPETS = {
+    'wsgi': (
+        "import sys; sys.path.insert(0, {backend!r})\n"
+        "from werkzeug.serving import make_server\n"
+        "import app\n"
+        "app.create_sample_users()\n"
+        "make_server('127.0.0.1', {port}, app.app, threaded=True).serve_forever()\n"
+    ),
+    'asgi': (
+        "import sys; sys.path.insert(0, {backend!r})\n"
+        "import uvicorn, app, asgi\n"
+        "app.create_sample_users()\n"
+        "uvicorn.run(asgi.app, host='127.0.0.1', port={port}, log_level='warning')\n"
+    ),
+}
+
+def generate_catalog(workdir, size, seed=7):
+    """Write a synthetic JSONL feed of size products and import it into workdir/ecommerce.db"""
+    from catalog_import import CatalogImporter
+    from models import Database
+
+    db_path = workdir / 'ecommerce.db'
+    if db_path.exists():
+        return db_path
+
+    rng = random.Random(seed)
+    feed_path = workdir / 'catalog.jsonl'
+    with open(feed_path, 'w', encoding='utf-8') as feed:
+        for i in range(size):
+            noun = rng.choice(NOUNS)
+            adjective = rng.choice(ADJECTIVES)
+            brand = rng.choice(BRANDS)
+            feed.write(json.dumps({
+                'sku': f'BENCH-{i:07d}',
+                'name': f'{brand} {adjective.title()} {noun.title()} {i}',
+                'category': rng.choice(CATEGORIES),
+                'price': round(rng.uniform(5, 2500), 2),
+                'description': f'A {adjective} {noun} from {brand}, great for everyday use.',
+                'stock_quantity': rng.randint(0, 200),
+                'brand': brand,
+                'rating': round(rng.uniform(2.5, 5.0), 1),
+                'specifications': {'material': rng.choice(['metal', 'plastic', 'cotton', 'wood']),
+                                   'warranty': f'{rng.randint(1, 3)} years'},
+            }) + '\n')
+
+    db = Database(str(db_path))
+    stats = CatalogImporter(db, batch_size=10000).import_file(str(feed_path), bulk=True)
+    db.close_all()
+    feed_path.unlink()
+    print(f"  generated {stats['imported']} products in {stats['seconds']}s")
+    return db_path
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(workdir, mode, groq_url, startup_timeout, chat_shortcuts=False):
+    """Launch the backend in workdir and wait until it answers"""
+    port = free_port()
+    env = dict(os.environ, GROQ_BASE_URL=groq_url, GROQ_API_KEY='benchmark', ADMIN_API_KEY=ADMIN_KEY,
+               EXPOSE_DIAGNOSTICS='1', PRODUCT_INDEX_PATH=str(workdir / 'product_index'))
+    if not chat_shortcuts:
+        # Every chat request goes to the (fake) LLM
+        env.update(LLM_CACHE_SIZE='0', LLM_CACHE_PERSIST='0', INTENT_ROUTER='0')
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVER_SNIPPETS[mode].format(backend=str(BACKEND_DIR), port=port)],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Backend exited during startup with code {process.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return process, port
+        except OSError:
+            time.sleep(0.25)
+    process.kill()
+    raise RuntimeError('Backend did not become ready in time')
+
+def chat_shortcut_counts(port):
+    """(response cache hits, intent-routed messages) served so far by the backend"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('GET', '/api/cache/stats', headers={'X-Admin-Key': ADMIN_KEY})
+        llm = json.loads(conn.getresponse().read())['llm']
+        conn.request('GET', '/metrics')
+        exposition = conn.getresponse().read().decode()
+    finally:
+        conn.close()
+    routed = sum(
+        float(line.rsplit(' ', 1)[1]) for line in exposition.splitlines()
+        if line.startswith('chat_intents_total{') and 'intent="llm"' not in line
+    )
+    return llm['hits'] + llm['disk_hits'], int(routed)
+
+def chat_message(rng):
+    """A chat message drawn from CHAT_TEMPLATES, different on almost every call"""
+    return rng.choice(CHAT_TEMPLATES).format(
+        adjective=rng.choice(ADJECTIVES), noun=rng.choice(NOUNS), brand=rng.choice(BRANDS),
+        price=rng.randrange(20, 2500, 5)
+    )
+
+def parse_server_timing(header):
+    """'db;dur=1.20, llm;dur=300.5' -> {'db': 1.2, 'llm': 300.5}"""
+    stages = {}
+    for part in (header or '').split(','):
+        name, _, duration = part.strip().partition(';dur=')
+        if name and duration:
+            stages[name] = float(duration)
+    return stages
+
+class Client:
+    """Keep-alive HTTP client for one load-generating worker"""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+        self.token = None
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        payload = json.dumps(body) if body is not None else None
+
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+            started = time.perf_counter()
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+                continue
+            elapsed = time.perf_counter() - started
+            if response.getheader('Connection', '').lower() == 'close':
+                self.conn.close()
+                self.conn = None
+            return response.status, data, elapsed, parse_server_timing(response.getheader('Server-Timing'))
+
+    def login(self):
+        status, data, _, _ = self.request('POST', '/api/login', {'username': 'admin', 'password': 'admin123'})
+        if status != 200:
+            raise RuntimeError(f'Benchmark login failed with {status}')
+        self.token = json.loads(data)['token']
+
+def endpoint_request(endpoint, rng, catalog_size):
+    """(method, path, body) for one request to endpoint"""
+    if endpoint == 'login':
+        return 'POST', '/api/login', {'username': 'admin', 'password': 'admin123'}
+    if endpoint == 'chat':
+        return 'POST', '/api/chat', {'message': chat_message(rng)}
+    if endpoint == 'search':
+        query = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}' if rng.random() < 0.5 else rng.choice(NOUNS)
+        return 'GET', '/api/products/search?' + urlencode({'q': query, 'limit': 20}), None
+    if endpoint == 'product':
+        return 'GET', f'/api/products/{rng.randint(1, catalog_size)}', None
+    if endpoint == 'categories':
+        return 'GET', '/api/categories', None
+    if endpoint == 'recommendations':
+        category = rng.choice(CATEGORIES + [None])
+        return 'GET', '/api/recommendations' + ('?' + urlencode({'category': category}) if category else ''), None
+    raise ValueError(endpoint)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return round(sorted_values[index], 3)
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'mean': round(sum(values) / len(values), 3),
+        'max': round(values[-1], 3),
+    }
+
+def run_endpoint(port, endpoint, concurrency, duration, catalog_size, seed):
+    """Drive one endpoint with concurrency workers for duration seconds"""
+    samples = []
+    errors = [0]
+    lock = threading.Lock()
+    clients = [Client(port) for _ in range(concurrency)]
+    for client in clients:
+        client.login()
+    start_barrier = threading.Barrier(concurrency + 1)
+    deadline = [0.0]
+    shortcuts_before = chat_shortcut_counts(port) if endpoint == 'chat' else None
+
+    def worker(index, client):
+        rng = random.Random(seed * 1000 + index)
+        local, local_errors = [], 0
+        start_barrier.wait()
+        while time.perf_counter() < deadline[0]:
+            method, path, body = endpoint_request(endpoint, rng, catalog_size)
+            try:
+                status, _, elapsed, stages = client.request(method, path, body)
+            except (http.client.HTTPException, OSError):
+                local_errors += 1
+                continue
+            if status >= 400 and not (endpoint == 'product' and status == 404):
+                local_errors += 1
+            local.append((elapsed * 1000, stages.get('db', 0.0), stages.get('llm', 0.0)))
+        with lock:
+            samples.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i, client)) for i, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + duration
+    started = time.perf_counter()
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    cached = routed = None
+    if shortcuts_before:
+        cached, routed = (after - before for after, before in zip(chat_shortcut_counts(port), shortcuts_before))
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': errors[0],
+        # Chat requests answered without an LLM call (None for other endpoints)
+        'cached': cached,
+        'routed': routed,
+        'throughput_rps': round(len(samples) / wall, 2) if wall else 0.0,
+        'latency_ms': summarize([sample[0] for sample in samples]),
+        'db_ms': summarize([sample[1] for sample in samples]),
+        'llm_ms': summarize([sample[2] for sample in samples]),
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(results):
+    print(f"{'size':>9} {'conc':>4} {'endpoint':<16} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9} "
+          f"{'db p50':>8} {'llm p50':>9} {'cached':>7} {'routed':>7} {'err':>5}")
+    for row in results:
+        latency = row['latency_ms'] or {}
+        print(f"{row['catalog_size']:>9} {row['concurrency']:>4} {row['endpoint']:<16} "
+              f"{row['throughput_rps']:>9.1f} {latency.get('p50') or 0:>9.2f} {latency.get('p95') or 0:>9.2f} "
+              f"{latency.get('p99') or 0:>9.2f} {(row['db_ms'] or {}).get('p50') or 0:>8.2f} "
+              f"{(row['llm_ms'] or {}).get('p50') or 0:>9.2f} {format_count(row.get('cached')):>7} "
+              f"{format_count(row.get('routed')):>7} {row['errors']:>5}")
+
+def format_count(value):
+    return '-' if value is None else str(value)
+
+def run(args):
+    workroot = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix='ecommerce-bench-'))
+    fake_groq = FakeGroqServer(latency_ms=args.llm_latency_ms, tokens_per_second=args.llm_tokens_per_second).start()
+    results = []
+    try:
+        for size in args.sizes:
+            workdir = workroot / f'catalog_{size}'
+            workdir.mkdir(parents=True, exist_ok=True)
+            print(f'Catalog of {size} products in {workdir}')
+            generate_catalog(workdir, size)
+
+            process, port = start_server(workdir, args.server, fake_groq.base_url, args.startup_timeout,
+                                         args.chat_shortcuts)
+            try:
+                for concurrency in args.concurrency:
+                    for endpoint in args.endpoints:
+                        row = run_endpoint(port, endpoint, concurrency, args.duration, size, args.seed)
+                        row['catalog_size'] = size
+                        results.append(row)
+                        print_table([row])
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        fake_groq.stop()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_revision': git_revision(),
+            'server': args.server,
+            'duration_s': args.duration,
+            'llm_latency_ms': args.llm_latency_ms,
+            'llm_tokens_per_second': args.llm_tokens_per_second,
+            'chat_shortcuts': args.chat_shortcuts,
+            'python': sys.version.split()[0],
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2)
+    print(f'\nSaved {len(results)} results to {args.output}')
+
+def compare(baseline_path, candidate_path):
+    """Print per-endpoint changes between two saved runs"""
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = {(r['catalog_size'], r['concurrency'], r['endpoint']): r for r in json.load(baseline_file)['results']}
+    with open(candidate_path, encoding='utf-8') as candidate_file:
+        candidate = json.load(candidate_file)['results']
+
+    def change(old, new):
+        if not old or new is None:
+            return '     n/a'
+        return f'{(new - old) / old * 100:+7.1f}%'
+
+    print(f"{'size':>9} {'conc':>4} {'endpoint':<16} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for row in candidate:
+        old = baseline.get((row['catalog_size'], row['concurrency'], row['endpoint']))
+        if not old:
+            continue
+        old_latency, new_latency = old['latency_ms'] or {}, row['latency_ms'] or {}
+        print(f"{row['catalog_size']:>9} {row['concurrency']:>4} {row['endpoint']:<16} "
+              f"{change(old['throughput_rps'], row['throughput_rps']):>9} "
+              + ' '.join(f"{change(old_latency.get(p), new_latency.get(p)):>9}" for p in ('p50', 'p95', 'p99')))
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'compare':
+        if len(argv) != 3:
+            print('usage: run_benchmarks.py compare BASELINE.json CANDIDATE.json')
+            return 2
+        compare(argv[1], argv[2])
+        return 0
+
+    parser = argparse.ArgumentParser(description='Benchmark the backend API end to end')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per endpoint and concurrency level')
+    parser.add_argument('--server', choices=sorted(SERVER_SNIPPETS), default='wsgi')
+    parser.add_argument('--llm-latency-ms', type=float, default=300.0, help='Fake Groq time to first token')
+    parser.add_argument('--llm-tokens-per-second', type=float, default=250.0, help='Fake Groq generation speed')
+    parser.add_argument('--chat-shortcuts', action='store_true',
+                        help='Keep the LLM response cache and intent router enabled')
+    parser.add_argument('--workdir', help='Keep generated catalogs here and reuse them across runs')
+    parser.add_argument('--startup-timeout', type=float, default=1800.0, help='Seconds to wait for the backend')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default='benchmark_results.json')
+    run(parser.parse_args(argv))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
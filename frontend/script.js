@@ -189,8 +189,18 @@ function initializeApp() {
     `;
     chatMessages.appendChild(div);
     chatMessages.scrollTop = chatMessages.scrollHeight;
+    return div.querySelector('.text-sm');
 }
 
+    // Helper: Re-render a bot bubble while its text is still streaming in
+    function updateStreamingMessage(element, text) {
+        if (!element) return;
+        element.innerHTML = window.showdown
+            ? new showdown.Converter().makeHtml(text)
+            : text.replace(/\n/g, '<br>');
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+    }
+
     // Helper: Render product card
     function renderProductCard(product) {
         return `
@@ -225,24 +235,67 @@ function initializeApp() {
         }
     }
 
-    // Chat Send
+    // Chat Send (Server-Sent Events stream from /api/chat/stream)
     async function sendMessage(message) {
         if (!message.trim()) return;
         displayMessage(message, 'user');
         if (chatInput) chatInput.value = '';
         toggleLoading(true);
+        let botElement = null;
+        let botText = '';
         try {
-            const data = await apiFetch(`${API_BASE_URL}/api/chat`, {
+            const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
                 method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Authorization': `Bearer ${getToken()}`,
+                },
                 body: JSON.stringify({ message }),
             });
-            if (data.success) {
-                displayMessage(data.response, 'bot');
-                if (data.products && data.products.length > 0) {
-                    displayProducts(data.products, productResultsContainer);
+            if (!response.ok) {
+                let errMsg = 'Unknown error';
+                try {
+                    const data = await response.json();
+                    errMsg = data.message || errMsg;
+                } catch {}
+                throw new Error(errMsg);
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const frames = buffer.split('\n\n');
+                buffer = frames.pop();
+                for (const frame of frames) {
+                    const eventLine = frame.match(/^event: (.*)$/m);
+                    const dataLine = frame.match(/^data: (.*)$/m);
+                    if (!eventLine || !dataLine) continue;
+                    const data = JSON.parse(dataLine[1]);
+                    switch (eventLine[1]) {
+                        case 'products':
+                            if (data.length > 0) displayProducts(data, productResultsContainer);
+                            break;
+                        case 'token':
+                            if (!botElement) {
+                                toggleLoading(false);
+                                botElement = displayMessage('', 'bot');
+                            }
+                            botText += data;
+                            updateStreamingMessage(botElement, botText);
+                            break;
+                        case 'done':
+                            if (!botElement) botElement = displayMessage('', 'bot');
+                            updateStreamingMessage(botElement, data.response);
+                            break;
+                        case 'error':
+                            displayMessage('Sorry, I encountered an error. Please try again.', 'bot');
+                            break;
+                    }
                 }
-            } else {
-                displayMessage('Sorry, I encountered an error. Please try again.', 'bot');
             }
         } catch (error) {
             displayMessage(`Error: ${error.message}`, 'bot');
@@ -311,7 +364,9 @@ function initializeApp() {
                 document.getElementById('modal-product-name').textContent = product.name;
                 let specsHtml = '';
                 try {
-                    const specs = JSON.parse(product.specifications);
+                    const specs = typeof product.specifications === 'string'
+                        ? JSON.parse(product.specifications)
+                        : (product.specifications || {});
                     specsHtml = Object.entries(specs).map(([key, value]) => `
                         <div class="flex justify-between py-2 border-b">
                             <span class="font-medium text-gray-600 capitalize">${key.replace(/_/g, ' ')}</span>
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other as top-level modules
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from database import populate_sample_data  # noqa: E402
+from models import Database  # noqa: E402
+
+@pytest.fixture
+def db(tmp_path):
+    """An empty database with the full schema"""
+    return Database(str(tmp_path / 'shop.db'))
+
+@pytest.fixture
+def catalog_db(db):
+    """A database holding the sample catalog"""
+    populate_sample_data(db)
+    return db
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The Flask app module, importing against a fresh sample database
+
+    app.py opens ecommerce.db relative to the working directory, so the
+    whole session runs from a temporary directory.
+    """
+    workdir = tmp_path_factory.mktemp('app')
+    previous = os.getcwd()
+    os.chdir(workdir)
+    os.environ.update({
+        'GROQ_API_KEY': 'test', 'ADMIN_API_KEY': 'test-admin-key',
+        'RECOMMENDATIONS_REFRESH_SECONDS': '3600'
+    })
+    import app as app_module
+    populate_sample_data(app_module.db)
+    app_module.create_sample_users()
+    yield app_module
+    if app_module.recommendation_engine:
+        app_module.recommendation_engine.close()
+    app_module.chat_service.close()
+    os.chdir(previous)
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+def login(client, username, password):
+    """Bearer headers and session id for a fresh login"""
+    data = client.post('/api/login', json={'username': username, 'password': password}).json
+    return {'Authorization': f"Bearer {data['token']}"}, data['session_id']
@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from conftest import login
+
+class SlowAsyncCompletions:
+    """Async fake Groq that records how many calls overlap"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def create(self, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.2)
+        self.active -= 1
+        message = SimpleNamespace(content='<think>hm</think>Async answer.')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason='stop')], usage=None)
+
+class NoSyncCalls:
+    def create(self, **kwargs):
+        raise AssertionError('the ASGI chat route used the blocking Groq client')
+
+@pytest.fixture
+def asgi(app_module, monkeypatch):
+    import asgi
+    service = app_module.chatbot_service
+    completions = SlowAsyncCompletions()
+    monkeypatch.setattr(service, '_async_client', SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(service, 'client', SimpleNamespace(chat=SimpleNamespace(completions=NoSyncCalls())))
+    # Async primitives belong to the event loop of each test
+    monkeypatch.setattr(service, '_async_llm_limiter', None)
+    monkeypatch.setattr(service, 'intent_router', None)
+    return asgi.app, completions
+
+def run(app, *requests):
+    """Send (method, path, kwargs) requests concurrently through the ASGI app"""
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            return await asyncio.gather(*(client.request(method, path, **kwargs) for method, path, kwargs in requests))
+    return asyncio.run(send())
+
+def test_chat_matches_the_flask_json_shape(client, asgi):
+    app, _ = asgi
+    headers, _ = login(client, 'user1', 'password1')
+    response, = run(app, ('POST', '/api/chat', {'headers': headers, 'json': {'message': 'asgi laptop for travel'}}))
+    assert response.status_code == 200
+    body = response.json()
+    assert set(body) == {'success', 'response', 'products'}
+    assert body['response'] == 'Async answer.'
+    assert all(isinstance(product['specifications'], dict) for product in body['products'])
+
+def test_concurrent_chats_overlap_on_the_event_loop(client, asgi):
+    app, completions = asgi
+    headers, _ = login(client, 'user2', 'password2')
+    responses = run(app, *[
+        ('POST', '/api/chat', {'headers': headers, 'json': {'message': f'asgi headphones number {n}'}})
+        for n in range(4)
+    ])
+    assert [response.status_code for response in responses] == [200] * 4
+    assert completions.peak == 4
+
+def test_other_routes_and_auth_errors_match_flask(client, asgi):
+    app, _ = asgi
+    categories, unauthenticated = run(
+        app, ('GET', '/api/categories', {}), ('POST', '/api/chat', {'json': {'message': 'hi'}})
+    )
+    assert categories.json() == client.get('/api/categories').json
+    assert unauthenticated.status_code == 401
+    assert unauthenticated.json() == client.post('/api/chat', json={'message': 'hi'}).json
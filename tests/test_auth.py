@@ -0,0 +1,47 @@
+import jwt
+import pytest
+
+from conftest import login
+from models import User
+
+def test_principal_is_cached_until_the_user_changes(db, monkeypatch):
+    users = User(db)
+    user_id = users.create_user('ada', 'ada@example.com', 'secret')
+    assert users.get_user_by_id(user_id)['username'] == 'ada'
+
+    lookups = []
+    connection = db.connection
+    def counting_connection(span=None):
+        lookups.append(span)
+        return connection(span)
+    monkeypatch.setattr(db, 'connection', counting_connection)
+    assert users.get_user_by_id(user_id)['username'] == 'ada'
+    assert 'get_user_by_id' not in lookups
+
+    users.update_user(user_id, username='ada.l')
+    assert users.get_user_by_id(user_id)['username'] == 'ada.l'
+    users.delete_user(user_id)
+    assert users.get_user_by_id(user_id) is None
+
+def test_token_of_a_deleted_user_stops_working(app_module, client):
+    client.post('/api/register', json={'username': 'leaving', 'email': 'leaving@example.com', 'password': 'pw'})
+    headers, _ = login(client, 'leaving', 'pw')
+    assert client.get('/api/chat/history', headers=headers).status_code == 200
+
+    user_id = app_module.user_service.authenticate_user('leaving', 'pw')['id']
+    app_module.user_service.delete_user(user_id)
+    response = client.get('/api/chat/history', headers=headers)
+    assert response.status_code == 401 and response.json['message'] == 'Invalid token!'
+
+@pytest.mark.parametrize('path, method', [('/api/chat/history', 'get'), ('/api/chat/reset', 'post'), ('/api/chat', 'post')])
+def test_protected_routes_share_one_token_check(app_module, client, path, method):
+    send = getattr(client, method)
+    expired = jwt.encode({'user_id': 1, 'session_id': 's', 'exp': 0}, app_module.app.secret_key, algorithm='HS256')
+    cases = [
+        ({}, 'Token is missing!'),
+        ({'Authorization': 'Bearer not-a-jwt'}, 'Token is invalid!'),
+        ({'Authorization': f'Bearer {expired}'}, 'Token has expired!'),
+    ]
+    for headers, message in cases:
+        response = send(path, headers=headers, json={'message': 'hi'})
+        assert (response.status_code, response.json['message']) == (401, message)
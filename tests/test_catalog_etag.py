@@ -0,0 +1,45 @@
+from models import Database, Product
+
+def test_revision_is_shared_through_the_database(catalog_db):
+    other = Database(catalog_db.db_path)
+    assert other.catalog_revision() == catalog_db.catalog_revision()
+
+def test_etag_survives_a_restart_and_follows_writes(app_module, client):
+    first = client.get('/api/categories')
+    etag = first.headers['ETag']
+    assert etag.strip('"') == app_module.db.catalog_revision()
+    assert client.get('/api/categories', headers={'If-None-Match': etag}).status_code == 304
+
+    # A fresh process starts its in-memory version over but reads the same revision
+    assert Database(app_module.db.db_path).catalog_revision() == etag.strip('"')
+
+    product = app_module.product_service.get_product_by_id(1)
+    Product(app_module.db).update_product(1, stock_quantity=product['stock_quantity'] + 1)
+    second = client.get('/api/categories', headers={'If-None-Match': etag})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != etag
+
+def test_etag_comes_from_memory_until_the_catalog_changes(app_module, client, monkeypatch):
+    db = app_module.db
+    etag = client.get('/api/categories').headers['ETag']
+    reads = []
+    original = db.catalog_revision
+    monkeypatch.setattr(db, 'catalog_revision', lambda: reads.append(1) or original())
+
+    for _ in range(3):
+        assert client.get('/api/categories', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/products/search?q=laptop').status_code == 200
+    assert reads == []
+
+    product = app_module.product_service.get_product_by_id(2)
+    Product(db).update_product(2, stock_quantity=product['stock_quantity'] + 1)
+    assert client.get('/api/categories', headers={'If-None-Match': etag}).status_code == 200
+    assert len(reads) == 1
+
+def test_writes_from_another_worker_show_up_after_the_ttl(catalog_db, monkeypatch):
+    revision = catalog_db.current_catalog_revision()
+    Product(Database(catalog_db.db_path)).update_product(1, price=1.0)
+    assert catalog_db.current_catalog_revision() == revision
+
+    monkeypatch.setattr(catalog_db, 'revision_ttl', 0)
+    assert catalog_db.current_catalog_revision() == catalog_db.catalog_revision() != revision
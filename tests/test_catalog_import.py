@@ -0,0 +1,64 @@
+import gzip
+import io
+import json
+
+from catalog_import import CatalogImporter, main, text_stream
+from models import Product
+
+FEED = [
+    {'sku': 'LAMP-1', 'name': 'Arc Floor Lamp', 'category': 'Home & Garden', 'price': 89.5,
+     'specifications': {'height': '180 cm'}},
+    {'sku': 'LAMP-2', 'name': 'Desk Lamp', 'category': 'Home & Garden', 'price': '24.00'},
+]
+
+def jsonl(rows):
+    return ''.join(json.dumps(row) + '\n' for row in rows).encode()
+
+def test_gzipped_upload_stream_is_decompressed(db):
+    stream = text_stream(io.BytesIO(gzip.compress(jsonl(FEED))), 'feed.jsonl.gz')
+    stats = CatalogImporter(db).import_stream(stream, 'jsonl')
+    assert stats['imported'] == 2 and stats['rejected'] == 0
+    lamp = Product(db).search_products('arc floor lamp')[0]
+    assert json.loads(lamp['specifications']) == {'height': '180 cm'}
+
+def test_gzipped_csv_file(db, tmp_path):
+    path = tmp_path / 'feed.csv.gz'
+    with gzip.open(path, 'wt', newline='') as f:
+        f.write('sku,name,category,price\nLAMP-1,Arc Floor Lamp,Home & Garden,89.5\n')
+    stats = CatalogImporter(db).import_file(str(path))
+    assert stats['imported'] == 1
+
+def test_import_api_accepts_gzip(app_module, client):
+    response = client.post(
+        '/api/admin/catalog/import',
+        headers={'X-Admin-Key': 'test-admin-key'},
+        data={'file': (io.BytesIO(gzip.compress(jsonl(FEED))), 'feed.jsonl.gz')}
+    )
+    assert response.status_code == 200
+    assert response.json['stats']['imported'] == 2
+    assert app_module.product_service.search_products('desk lamp')[0]['price'] == 24.0
+
+def test_import_api_rejects_a_corrupt_gzip(client):
+    response = client.post(
+        '/api/admin/catalog/import',
+        headers={'X-Admin-Key': 'test-admin-key'},
+        data={'file': (io.BytesIO(b'not gzip at all'), 'feed.jsonl.gz')}
+    )
+    assert response.status_code == 400
+
+def test_no_upsert_skips_known_skus_and_keeps_importing(db, capsys, tmp_path):
+    CatalogImporter(db).import_stream(io.StringIO(jsonl(FEED[:1]).decode()), 'jsonl')
+    feed = FEED + [{'sku': 'LAMP-3', 'name': 'Wall Sconce', 'category': 'Home & Garden', 'price': 39}]
+    renamed = [dict(FEED[0], name='Renamed Lamp')] + feed[1:]
+
+    stats = CatalogImporter(db, batch_size=1, upsert=False).import_stream(
+        io.StringIO(jsonl(renamed).decode()), 'jsonl')
+    assert (stats['imported'], stats['skipped'], stats['rejected']) == (2, 1, 0)
+    assert Product(db).search_products('arc floor lamp')[0]['price'] == 89.5
+    assert not Product(db).search_products('renamed lamp')
+    assert Product(db).search_products('wall sconce')
+
+    path = tmp_path / 'feed.jsonl'
+    path.write_bytes(jsonl(renamed))
+    assert main([str(path), '--db', db.db_path, '--no-upsert']) == 0
+    assert '0 of 3 rows' in capsys.readouterr().out
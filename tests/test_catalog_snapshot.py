@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+import catalog_snapshot
+from catalog_snapshot import CatalogSnapshotEngine
+from models import Product
+
+@pytest.fixture
+def products(catalog_db):
+    return Product(catalog_db)
+
+def sql_reads(products):
+    """Every product by ID and the top-rated listing, read without a snapshot"""
+    ids = [product['id'] for product in products.iter_products()]
+    reads = [products.get_product_by_id(product_id) for product_id in ids], products.search_products('', limit=10)
+    # Later reads must come from the snapshot, not the query cache
+    products.db.query_cache.clear()
+    return reads
+
+def wait_until_fresh(engine, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not engine.stats()['fresh']:
+        assert time.monotonic() < deadline, 'snapshot did not reload'
+        time.sleep(0.01)
+
+def count_queries(db, monkeypatch):
+    queries = []
+    connection = db.connection
+    def counting_connection(*args, **kwargs):
+        queries.append(args)
+        return connection(*args, **kwargs)
+    monkeypatch.setattr(db, 'connection', counting_connection)
+    return queries
+
+def test_snapshot_serves_the_same_products_without_sql(catalog_db, products, monkeypatch):
+    by_id, top = sql_reads(products)
+    engine = CatalogSnapshotEngine(catalog_db).start()
+    snapshot = engine.current()
+    assert snapshot.prices.dtype.kind == 'f' and snapshot.stock.dtype.kind == 'i'
+    assert len(snapshot.category_values) == 5
+
+    queries = count_queries(catalog_db, monkeypatch)
+    assert [products.get_product_by_id(product['id']) for product in by_id] == by_id
+    assert products.search_products('', limit=10) == top
+    assert products.get_product_by_id(10 ** 6) is None
+    wanted = [by_id[5]['id'], by_id[0]['id'], 10 ** 6, by_id[2]['id']]
+    assert products.get_products_by_ids(wanted) == [by_id[5], by_id[0], by_id[2]]
+    assert queries == []
+
+def test_filters_match_sql_across_scan_blocks(catalog_db, products, monkeypatch):
+    searches = [
+        {'category': 'Electronics'},
+        {'brand': 'Nike', 'min_rating': 4.0},
+        {'min_price': 20, 'max_price': 150},
+        {'category': 'No Such Category'},
+    ]
+    expected = [products.search_products('', limit=15, **search) for search in searches]
+    catalog_db.query_cache.clear()
+    CatalogSnapshotEngine(catalog_db).start()
+    # Small blocks so the growing-block scan runs several rounds
+    monkeypatch.setattr(catalog_snapshot, 'FILTER_BLOCK_ROWS', 3)
+    queries = count_queries(catalog_db, monkeypatch)
+    assert [products.search_products('', limit=15, **search) for search in searches] == expected
+    assert queries == []
+
+def test_writes_fall_back_to_sql_until_the_new_snapshot_is_swapped_in(catalog_db, products):
+    engine = CatalogSnapshotEngine(catalog_db).start()
+    old = engine.current()
+    products.update_product(1, price=999.0, category='Phones')
+
+    # Never served stale: SQL answers until the replacement is ready
+    assert products.get_product_by_id(1)['price'] == 999.0
+    wait_until_fresh(engine)
+    new = engine.current()
+    assert new is not old
+    assert new.product(new.offset(1))['category'] == 'Phones'
+    assert old.product(old.offset(1))['category'] == 'Electronics'
+    assert [product['id'] for product in products.search_products('', category='Phones')] == [1]
@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import login
+
+ADMIN = {'X-Admin-Key': 'test-admin-key'}
+
+class Completions:
+    def create(self, **kwargs):
+        message = SimpleNamespace(content='<think>ok</think>Here you go.')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason='stop')], usage=None)
+
+@pytest.fixture
+def session(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module.chatbot_service, 'client',
+                        SimpleNamespace(chat=SimpleNamespace(completions=Completions())))
+    _, session_id = login(client, 'user1', 'password1')
+    return session_id, app_module.chat_service.get_session_owner(session_id)
+
+def batch(client, **item):
+    return client.post('/api/chat/batch', headers=ADMIN, json={'items': [{'message': 'any laptops?', **item}]})
+
+def test_owner_may_use_their_session(client, session):
+    session_id, owner = session
+    response = batch(client, session_id=session_id, user_id=owner)
+    assert response.status_code == 200
+    assert response.json['results'][0]['response'] == 'Here you go.'
+
+def test_history_of_another_users_session_is_refused(client, session):
+    session_id, owner = session
+    assert batch(client, session_id=session_id, user_id=owner + 1).status_code == 403
+    assert batch(client, session_id=session_id).status_code == 403
+    assert batch(client, session_id='no-such-session', user_id=owner).status_code == 403
+
+def test_products_carry_specifications_as_objects(client, session):
+    products = batch(client).json['results'][0]['products']
+    assert products and all(isinstance(product['specifications'], dict) for product in products)
@@ -0,0 +1,37 @@
+from conftest import login
+from models import ChatSession
+
+def fill(chat, session_id, count):
+    for number in range(count):
+        chat.save_message(session_id, 'user' if number % 2 == 0 else 'bot', f'{session_id} message {number}')
+
+def test_recent_messages_read_only_the_tail_through_the_index(db):
+    chat = ChatSession(db)
+    fill(chat, 'long', 25)
+    fill(chat, 'other', 5)
+    recent = chat.get_recent_messages('long', 10)
+    assert [message['content'] for message in recent] == [f'long message {n}' for n in range(15, 25)]
+
+    with db.connection() as conn:
+        plan = ' '.join(row[-1] for row in conn.execute(
+            'EXPLAIN QUERY PLAN SELECT id FROM chat_messages WHERE session_id = ? ORDER BY id DESC LIMIT 10',
+            ('long',)
+        ))
+    assert 'idx_chat_messages_session' in plan and 'TEMP B-TREE' not in plan
+
+def test_history_api_pages_backwards_with_before_id(app_module, client):
+    headers, session_id = login(client, 'testuser', 'test123')
+    fill(app_module.chat_service, session_id, 7)
+
+    pages, before_id = [], None
+    while True:
+        query = {'limit': 3, **({'before_id': before_id} if before_id else {})}
+        body = client.get('/api/chat/history', headers=headers, query_string=query).json
+        pages.append([message['content'] for message in body['history']])
+        before_id = body['next_before_id']
+        if before_id is None:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    walked = [content for page in reversed(pages) for content in page]
+    assert walked == [f'{session_id} message {n}' for n in range(7)]
@@ -0,0 +1,55 @@
+from chat_shards import ChatShardDatabase, ChatShards, migrate, shard_index, shard_path
+from models import ChatSession
+
+SESSIONS = [f'session-{number}' for number in range(60)]
+
+def history(chat, session_id):
+    return [(message['type'], message['content']) for message in chat.get_chat_history(session_id)]
+
+def snapshot(chat):
+    """Everything a client can read back about each session"""
+    state = {}
+    for session_id in SESSIONS:
+        messages = chat.get_chat_history(session_id)
+        summary, through_id = chat.get_summary(session_id)
+        folded = [message['content'] for message in messages if message['id'] <= through_id]
+        state[session_id] = (chat.get_session_owner(session_id), history(chat, session_id), summary, folded)
+    return state
+
+def sessions_per_file(directory, count):
+    found = {}
+    for index in range(count):
+        with ChatShardDatabase(shard_path(directory, index)).connection() as conn:
+            for (session_id,) in conn.execute('SELECT session_id FROM chat_sessions'):
+                found.setdefault(session_id, []).append(index)
+    return found
+
+def test_sessions_route_to_their_shard_after_each_migration(db, tmp_path):
+    main = ChatSession(db)
+    for number, session_id in enumerate(SESSIONS):
+        main.create_session(number % 3 + 1, session_id)
+        for turn in range(3):
+            main.save_message(session_id, 'user', f'{session_id} question {turn}')
+            main.save_message(session_id, 'bot', f'{session_id} answer {turn}')
+        second = main.get_chat_history(session_id)[1]['id']
+        main.save_summary(session_id, f'summary of {session_id}', second)
+    expected = snapshot(main)
+
+    directory = str(tmp_path / 'shards')
+    stats = migrate([(db, None)], directory, 4)
+    assert stats['moved'] == len(SESSIONS)
+    four = ChatShards(directory, 4)
+    assert snapshot(ChatSession(db, shards=four)) == expected
+    assert ChatSession(db).get_chat_history(SESSIONS[0]) == []
+
+    # Growing the shard count only moves sessions onto the new shards
+    stats = migrate([(database, index) for index, database in enumerate(four.databases)], directory, 7)
+    placed = sessions_per_file(directory, 7)
+    assert sorted(placed) == sorted(SESSIONS)
+    assert all(indexes == [shard_index(session_id, 7)] for session_id, indexes in placed.items())
+    assert stats['moved'] == sum(shard_index(session_id, 7) >= 4 for session_id in SESSIONS)
+    assert snapshot(ChatSession(db, shards=ChatShards(directory, 7))) == expected
+
+    # A second run finds nothing to move
+    seven = ChatShards(directory, 7)
+    assert migrate([(database, index) for index, database in enumerate(seven.databases)], directory, 7)['moved'] == 0
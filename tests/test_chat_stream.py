@@ -0,0 +1,39 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import login
+
+def chunk(content, finish_reason=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)])
+
+class StreamingCompletions:
+    def create(self, **kwargs):
+        return iter([chunk('<think>plan</think>Try the '), chunk('Dell XPS 13.', finish_reason='stop')])
+
+def events(body):
+    for frame in body.strip().split('\n\n'):
+        event, data = frame.split('\n', 1)
+        yield event[len('event: '):], json.loads(data[len('data: '):])
+
+@pytest.fixture
+def fake_llm(app_module, monkeypatch):
+    monkeypatch.setattr(app_module.chatbot_service, 'client',
+                        SimpleNamespace(chat=SimpleNamespace(completions=StreamingCompletions())))
+    monkeypatch.setattr(app_module.chatbot_service, 'intent_router', None)
+
+def test_done_event_carries_only_the_answer(client, fake_llm):
+    headers, _ = login(client, 'user1', 'password1')
+    response = client.post('/api/chat/stream', headers=headers, json={'message': 'a laptop for travel'})
+    done = dict(events(response.get_data(as_text=True)))['done']
+    assert done == {'success': True, 'response': 'Try the Dell XPS 13.'}
+
+def test_product_cards_match_the_catalog_endpoint(client, fake_llm):
+    headers, _ = login(client, 'user1', 'password1')
+    response = client.post('/api/chat/stream', headers=headers, json={'message': 'a laptop for travel'})
+    products = dict(events(response.get_data(as_text=True)))['products']
+    assert products
+    for product in products:
+        assert isinstance(product['specifications'], dict)
+        assert product == client.get(f"/api/products/{product['id']}").json['product']
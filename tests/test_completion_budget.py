@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from chatbot_service import FALLBACK_RESPONSE, ChatbotService
+from prompt_builder import RETRY_COMPLETION_TOKENS
+
+def completion(content, finish_reason='stop'):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason)],
+        usage=None
+    )
+
+def chunk(content, finish_reason=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)])
+
+class FakeCompletions:
+    """Runs out of tokens inside <think> unless given the retry budget"""
+
+    def __init__(self, answer_on_retry=True):
+        self.answer_on_retry = answer_on_retry
+        self.budgets = []
+
+    def create(self, max_completion_tokens, stream, **kwargs):
+        self.budgets.append(max_completion_tokens)
+        if max_completion_tokens >= RETRY_COMPLETION_TOKENS and self.answer_on_retry:
+            return completion('<think>short</think>The Dell XPS 13 is a great pick.')
+        if stream:
+            return iter([chunk('<think>weighing laptops'), chunk(' at length', finish_reason='length')])
+        return completion('<think>weighing laptops at length', finish_reason='length')
+
+@pytest.fixture
+def service(catalog_db, monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test')
+    monkeypatch.setenv('INTENT_ROUTER', '0')
+    service = ChatbotService(catalog_db)
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    return service
+
+def test_unclosed_reasoning_is_not_shown(service):
+    assert service._clean_response('<think>still thinking about') == ''
+    assert service._clean_response('<think>done</think>Answer: Yes') == 'Yes'
+
+def test_truncated_reasoning_is_retried_with_a_larger_budget(service):
+    result = service.process_user_message('which laptop for travel')
+    assert result['success']
+    assert result['response'] == 'The Dell XPS 13 is a great pick.'
+    assert service.client.chat.completions.budgets[-1] == RETRY_COMPLETION_TOKENS
+
+def test_no_answer_after_retry_gives_the_fallback(service):
+    service.client.chat.completions.answer_on_retry = False
+    result = service.process_user_message('which laptop for travel')
+    assert not result['success']
+    assert result['response'] == FALLBACK_RESPONSE
+    assert service.client.chat.completions.budgets == [4096, RETRY_COMPLETION_TOKENS]
+
+def test_stream_retries_when_nothing_was_shown(service):
+    events = list(service.stream_user_message('which laptop for travel'))
+    tokens = [data for event, data in events if event == 'token']
+    assert tokens == ['The Dell XPS 13 is a great pick.']
+    assert events[-1][0] == 'done'
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from conversation_memory import ConversationMemory, ExtractiveSummarizer
+from models import ChatSession
+from prompt_builder import PromptBuilder
+
+TURNS = [
+    ('user', 'I am looking for a laptop for video editing, my budget is $1500.'),
+    ('bot', 'The **Dell XPS 13** at $1,299 and the MacBook Pro 14-inch M3 are good picks.'),
+    ('user', 'I travel a lot, so it must be light.'),
+    ('bot', 'The Dell XPS 13 weighs about 1.2 kg, which is great for travel.'),
+    ('user', 'Does it have a good display?'),
+    ('bot', 'Yes, it has an InfinityEdge display.'),
+    ('user', 'What about battery life?'),
+    ('bot', 'Expect around 12 hours of mixed use.'),
+    ('user', 'And the warranty?'),
+    ('bot', 'It comes with a 1 year warranty.'),
+]
+
+def settle(memory):
+    """Wait for compactions queued so far (the executor has a single worker)"""
+    memory._executor.submit(lambda: None).result(5)
+
+def chat_with(db, turns, session_id='s'):
+    chat = ChatSession(db)
+    for message_type, content in turns:
+        chat.save_message(session_id, message_type, content)
+    return chat
+
+def test_older_turns_fold_into_a_summary_off_the_request_path(db):
+    chat = chat_with(db, TURNS[:8])
+    memory = ConversationMemory(chat, keep_messages=4, compact_after=8)
+    assert [msg['type'] for msg in memory.history('s')] == ['user', 'bot'] * 4
+
+    chat_with(db, TURNS[8:9])
+    memory.history('s')
+    settle(memory)
+    history = memory.history('s')
+    assert history[0]['type'] == 'summary'
+    assert '$1500' in history[0]['content']
+    # The summary plus the newest keep_messages turns, verbatim
+    assert [msg['content'] for msg in history[1:]] == [content for _, content in TURNS[5:9]]
+    memory.close()
+
+def test_requests_do_not_wait_for_the_summarizer(db):
+    release = threading.Event()
+
+    class SlowSummarizer(ExtractiveSummarizer):
+        def summarize(self, previous, messages):
+            release.wait(5)
+            return super().summarize(previous, messages)
+
+    chat = chat_with(db, TURNS)
+    memory = ConversationMemory(chat, summarizer=SlowSummarizer(), keep_messages=4, compact_after=8)
+    started = time.monotonic()
+    history = memory.history('s')
+    assert time.monotonic() - started < 1.0
+    assert history[0]['type'] != 'summary'
+    release.set()
+    settle(memory)
+    assert memory.history('s')[0]['type'] == 'summary'
+    memory.close()
+
+def test_summarized_prompts_are_shorter_and_keep_the_facts(db):
+    filler = ' Shipping is free, returns are accepted within 30 days and every order includes a care guide.'
+    chat = chat_with(db, [(message_type, content + filler * 3 if message_type == 'bot' else content)
+                          for message_type, content in TURNS])
+    memory = ConversationMemory(chat, keep_messages=4, compact_after=8)
+    memory.history('s')
+    settle(memory)
+
+    builder = PromptBuilder()
+    message = 'Is it available in silver?'
+    _, raw = builder.build(message, '', chat.get_recent_messages('s', 10))
+    messages, summarized = builder.build(message, '', memory.history('s'))
+    assert summarized['history_messages'] == 4 and summarized['summary_tokens'] > 0
+    assert summarized['input_tokens'] < raw['input_tokens']
+    assert '$1500' in messages[0]['content']
+    memory.close()
+
+def test_summary_rolls_forward_within_its_size():
+    summarizer = ExtractiveSummarizer(max_chars=300)
+    summary = ''
+    for round_number in range(20):
+        turns = [{'type': message_type, 'content': f'{content} (round {round_number})'} for message_type, content in TURNS]
+        summary = summarizer.summarize(summary, turns)
+        assert len(summary) <= 300
+    assert summary and all(line.split(': ', 1)[0] in ('Customer', 'Assistant') for line in summary.splitlines())
@@ -0,0 +1,25 @@
+ADMIN = {'X-Admin-Key': 'test-admin-key'}
+
+def test_server_timing_is_only_sent_to_admins(client):
+    assert 'Server-Timing' not in client.get('/api/products/search?q=laptop').headers
+    assert 'Server-Timing' not in client.get('/api/products/search?q=laptop', headers={'X-Admin-Key': 'wrong'}).headers
+
+    stages = client.get('/api/products/search?q=diagnostics+phone', headers=ADMIN).headers['Server-Timing']
+    names = [part.split(';')[0].strip() for part in stages.split(',')]
+    assert 'db' in names and any(name.startswith('sql.') for name in names)
+
+def test_cache_stats_need_the_admin_key(client):
+    assert client.get('/api/cache/stats').status_code == 403
+    stats = client.get('/api/cache/stats', headers=ADMIN).json
+    assert {'hits', 'misses', 'hit_rate'} <= set(stats['catalog']) and 'hits' in stats['llm']
+
+def test_expose_diagnostics_opens_both(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'EXPOSE_DIAGNOSTICS', True)
+    assert 'Server-Timing' in client.get('/api/products/search?q=tablet').headers
+    assert client.get('/api/cache/stats').status_code == 200
+
+def test_metrics_count_requests_and_spans(client):
+    client.get('/api/categories')
+    exposition = client.get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{method="GET",endpoint="/api/categories",status="200"}' in exposition
+    assert 'span_duration_seconds_count{span="db"}' in exposition
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+from chatbot_service import ChatbotService
+from intent_router import ROUTED, IntentRouter
+from models import Product
+
+class CountingCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content='From the model.')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason='stop')], usage=None)
+
+@pytest.fixture
+def router(catalog_db):
+    return IntentRouter(Product(catalog_db))
+
+@pytest.mark.parametrize('message, intent', [
+    ('Is the iPhone 15 Pro in stock?', 'stock'),
+    ('how much is Atomic Habits', 'price'),
+    ('What categories do you have?', 'categories'),
+    ('Tell me about the Dell XPS 13', 'product_detail'),
+    ('what does the sony wh-1000xm5 cost', 'price'),
+    ('Which laptop is better for video editing?', None),
+    ('recommend headphones under 300', None),
+    ('hello there', None),
+])
+def test_classify(router, message, intent):
+    assert router.classify(message) == intent
+
+def test_answers_come_from_the_catalog(router, catalog_db):
+    products = Product(catalog_db)
+    iphone = products.get_product_by_id(1)
+    stock = router.route('Is the iPhone 15 Pro in stock?')
+    assert stock['intent'] == 'stock' and stock['products'] == [iphone]
+    assert f"{iphone['stock_quantity']} available" in stock['response']
+
+    products.update_product(1, stock_quantity=0)
+    assert 'out of stock' in router.route('Is the iPhone 15 Pro in stock?')['response']
+    assert router.route('how much is Atomic Habits')['response'].startswith('The **Atomic Habits**')
+    assert 'Electronics' in router.route('What categories do you have?')['response']
+
+def test_unclear_products_fall_through(router):
+    # Names another product than the catalog has, or none at all
+    assert router.route('Is the iPhone case in stock?') is None
+    assert router.route('how much is it') is None
+
+def test_routed_messages_skip_the_llm_and_are_counted(catalog_db, monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test')
+    monkeypatch.setenv('INTENT_ROUTER', '1')
+    service = ChatbotService(catalog_db)
+    completions = CountingCompletions()
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    before = dict(ROUTED._values)
+
+    routed = service.process_user_message('How much is Atomic Habits?')
+    assert routed['intent'] == 'price' and completions.calls == 0
+    assert service.process_user_message('Which laptop is better for travel?')['response'] == 'From the model.'
+    assert completions.calls == 1
+
+    counted = {labels: value - before.get(labels, 0) for labels, value in ROUTED._values.items()}
+    assert counted[('price',)] == 1 and counted[('llm',)] == 1
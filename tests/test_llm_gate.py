@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from llm_gate import AsyncSingleFlight
+
+def test_followers_survive_a_cancelled_leader():
+    calls = []
+
+    async def scenario():
+        flight = AsyncSingleFlight()
+        started = asyncio.Event()
+
+        async def call():
+            calls.append(len(calls))
+            started.set()
+            await asyncio.sleep(0.05)
+            return 'answer'
+
+        leader = asyncio.create_task(flight.do('key', call))
+        await started.wait()
+        followers = [asyncio.create_task(flight.do('key', call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(scenario())
+    assert [result for result, _ in results] == ['answer'] * 3
+    # One follower took over the call and the other two shared it
+    assert len(calls) == 2
+    assert sorted(shared for _, shared in results) == [False, True, True]
+
+def test_leader_errors_reach_followers():
+    async def scenario():
+        flight = AsyncSingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError('upstream failed')
+
+        return await asyncio.gather(*(flight.do('key', call) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+    assert all(isinstance(error, ValueError) for error in errors)
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from message_writer import MessageWriter
+from models import ChatSession
+
+def test_sessions_read_their_own_queued_writes(db):
+    # A long max_delay means only flush() can get a batch committed in time
+    writer = MessageWriter(db, max_delay=5.0).start()
+    chat = ChatSession(db, writer=writer)
+    failures = []
+
+    def chatter(number):
+        session_id = f'session-{number}'
+        for turn in range(5):
+            chat.save_message(session_id, 'user', f'question {turn}')
+            chat.save_message(session_id, 'bot', f'answer {turn}')
+            history = [message['content'] for message in chat.get_chat_history(session_id)]
+            if history[-2:] != [f'question {turn}', f'answer {turn}'] or len(history) != 2 * (turn + 1):
+                failures.append((session_id, history))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=chatter, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert failures == []
+    assert time.monotonic() - started < 4.0
+    writer.close()
+
+def test_close_commits_what_is_queued(db):
+    writer = MessageWriter(db, max_delay=5.0).start()
+    chat = ChatSession(db, writer=writer)
+    chat.save_message('s', 'user', 'queued')
+    writer.close()
+    # After close the writer inserts directly
+    chat.save_message('s', 'bot', 'direct')
+    assert [message['content'] for message in ChatSession(db).get_chat_history('s')] == ['queued', 'direct']
+
+def test_close_waits_for_a_save_already_enqueueing(db):
+    writer = MessageWriter(db, max_delay=5.0).start()
+    put = writer._queue.put
+    closer = threading.Thread(target=writer.close)
+
+    def slow_put(item, *args, **kwargs):
+        # close() starts while save() is between its running check and the enqueue
+        if isinstance(item, tuple) and closer.ident is None:
+            closer.start()
+            closer.join(0.2)
+        put(item, *args, **kwargs)
+    writer._queue.put = slow_put
+
+    writer.save('s', 'user', 'racing close')
+    closer.join(5)
+    assert not closer.is_alive()
+    assert writer._pending_total == 0 and writer._pending == {}
+    assert [message['content'] for message in ChatSession(db).get_chat_history('s')] == ['racing close']
@@ -0,0 +1,39 @@
+import sqlite3
+
+import pytest
+
+from models import Database, Product
+
+def test_read_only_database_never_writes(catalog_db):
+    revision = catalog_db.catalog_revision()
+    reader = Database(catalog_db.db_path, read_only=True)
+    assert reader.catalog_revision() == revision
+    assert Product(reader).get_product_by_id(1)['name'] == 'iPhone 15 Pro'
+    with pytest.raises(sqlite3.OperationalError), reader.connection() as conn:
+        conn.execute('DELETE FROM products')
+
+def test_pooled_connections_are_reused_with_wal(db):
+    with db.connection() as conn:
+        first = conn
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+    with db.connection() as conn:
+        assert conn is first
+
+def test_connection_commits_or_rolls_back(db):
+    with db.connection() as conn:
+        conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('kept', 'k@x', 'h')")
+    with pytest.raises(RuntimeError), db.connection() as conn:
+        conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('lost', 'l@x', 'h')")
+        raise RuntimeError('boom')
+    with db.connection() as conn:
+        assert [row[0] for row in conn.execute('SELECT username FROM users')] == ['kept']
+
+def test_pool_is_bounded(tmp_path):
+    db = Database(str(tmp_path / 'small.db'), pool_size=2, pool_timeout=0.1)
+    with db.connection(), db.connection():
+        with pytest.raises(sqlite3.OperationalError, match='Timed out'), db.connection():
+            pass
+    # Both connections went back to the pool
+    with db.connection(), db.connection():
+        assert db._open_connections == 2
@@ -0,0 +1,156 @@
+import io
+import json
+
+import pytest
+
+from catalog_import import CatalogImporter
+from catalog_snapshot import CatalogSnapshotEngine
+from models import Product, facet_counts_sql
+
+SEARCHES = [
+    {'query': ''},
+    {'query': '', 'category': 'Clothing'},
+    {'query': '', 'min_price': 50, 'max_price': 300, 'min_rating': 4.2},
+    {'query': 'nike'},
+    {'query': 'premium item', 'match_any': True},
+]
+
+@pytest.fixture
+def products(catalog_db):
+    return Product(catalog_db)
+
+def walk(products, limit, **search):
+    """Every page of a search, following next_cursor"""
+    found, cursor = [], None
+    while True:
+        page = products.search_products_page(limit=limit, cursor=cursor, **search)
+        found += [product['id'] for product in page['products']]
+        assert len(page['products']) <= limit
+        cursor = page['next_cursor']
+        if cursor is None:
+            return found
+
+@pytest.mark.parametrize('search', SEARCHES)
+@pytest.mark.parametrize('limit', [1, 7, 25])
+def test_cursor_pages_match_the_unpaged_results(products, search, limit):
+    unpaged = [product['id'] for product in products.search_products(limit=1000, **search)]
+    assert unpaged
+    assert walk(products, limit, **search) == unpaged
+
+@pytest.mark.parametrize('search', SEARCHES[:3])
+def test_snapshot_pages_match_sql_pages(catalog_db, products, search):
+    sql = walk(products, 6, **search)
+    CatalogSnapshotEngine(catalog_db).start()
+    assert products._snapshot() is not None
+    assert walk(products, 6, **search) == sql
+
+def test_cursor_pages_walk_through_ties(catalog_db, products):
+    # Same rating, price and text: only the id tells these apart
+    feed = ''.join(json.dumps({
+        'sku': f'TIE-{number}', 'name': 'Twin Desk Lamp', 'category': 'Lighting',
+        'brand': 'Lumen', 'price': 25, 'rating': 4.5
+    }) + '\n' for number in range(23))
+    CatalogImporter(catalog_db).import_stream(io.StringIO(feed), 'jsonl')
+    for search in ({'query': '', 'category': 'Lighting'}, {'query': 'twin desk lamp'}):
+        unpaged = [product['id'] for product in products.search_products(limit=1000, **search)]
+        assert len(unpaged) == 23
+        for limit in (1, 4, 10):
+            assert walk(products, limit, **search) == unpaged
+
+def test_malformed_cursor_is_rejected(products):
+    with pytest.raises(ValueError):
+        products.search_products_page('', cursor='not-a-cursor')
+    text_cursor = products.search_products_page('nike', limit=1)['next_cursor']
+    with pytest.raises(ValueError):
+        products.search_products_page('', cursor=text_cursor)
+
+def edit_catalog(products):
+    """Insert, update and delete a product through the normal write paths"""
+    added = products.add_product({
+        'name': 'Zephyr Kettle', 'category': 'Home & Garden', 'price': 39.0, 'brand': 'Brand9',
+        'rating': 4.1, 'description': 'Whistling stovetop kettle', 'stock_quantity': 5
+    })
+    products.update_product(1, name='iPhone 15 Pro Max', category='Phones', price=1199.0)
+    products.delete_product(2)
+    return added
+
+def fts_integrity(db):
+    """Raise if products_fts disagrees with the products table"""
+    with db.connection() as conn:
+        conn.execute("INSERT INTO products_fts(products_fts, rank) VALUES ('integrity-check', 1)")
+
+def test_full_text_index_follows_writes(catalog_db, products):
+    added = edit_catalog(products)
+    fts_integrity(catalog_db)
+    assert [product['id'] for product in products.search_products('zephyr')] == [added]
+    assert [product['name'] for product in products.search_products('iphone max')] == ['iPhone 15 Pro Max']
+    assert products.search_products('galaxy') == []
+
+def stored_facets(db):
+    with db.connection() as conn:
+        return sorted(conn.execute('SELECT facet, value, count FROM product_facets').fetchall())
+
+def counted_facets(db):
+    with db.connection() as conn:
+        return sorted(conn.execute(facet_counts_sql('SELECT category, brand, price, rating FROM products')).fetchall())
+
+def stored_version(db):
+    with db.connection() as conn:
+        return conn.execute('SELECT version FROM catalog_state WHERE id = 0').fetchone()[0]
+
+def test_facet_counts_and_revision_follow_writes(catalog_db, products):
+    version = stored_version(catalog_db)
+    edit_catalog(products)
+    assert stored_facets(catalog_db) == counted_facets(catalog_db)
+    facets = products.get_facets()
+    assert facets['total'] == products.count_products()
+    assert {'value': 'Phones', 'count': 1} in facets['facets']['category']
+    # One bump per written row
+    assert stored_version(catalog_db) == version + 3
+
+def test_bulk_load_rebuilds_triggers_and_counts(catalog_db, products):
+    revision = catalog_db.catalog_revision()
+    feed = ''.join(json.dumps({
+        'sku': f'BULK-{number}', 'name': f'Bulk Lamp {number}', 'category': 'Lighting',
+        'brand': 'Lumen', 'price': 10 + number, 'rating': 4.0
+    }) + '\n' for number in range(30))
+    CatalogImporter(catalog_db).import_stream(io.StringIO(feed), 'jsonl', bulk=True)
+    assert catalog_db.catalog_revision() != revision
+    assert stored_facets(catalog_db) == counted_facets(catalog_db)
+    fts_integrity(catalog_db)
+    assert len(products.search_products('bulk lamp', limit=100)) == 30
+
+    # The per-row triggers are back after the load
+    edit_catalog(products)
+    assert stored_facets(catalog_db) == counted_facets(catalog_db)
+    fts_integrity(catalog_db)
+
+def test_repeated_reads_are_cached_until_a_write(catalog_db, products, monkeypatch):
+    reads = [
+        lambda: products.search_products('laptop', max_price=2000),
+        lambda: products.get_product_by_id(4),
+        lambda: products.get_categories(),
+    ]
+    first = [read() for read in reads]
+
+    queries = []
+    connection = catalog_db.connection
+    def counting_connection(*args, **kwargs):
+        queries.append(args)
+        return connection(*args, **kwargs)
+    monkeypatch.setattr(catalog_db, 'connection', counting_connection)
+    hits = products.cache_stats()['hits']
+    assert [read() for read in reads] == first
+    assert queries == [] and products.cache_stats()['hits'] == hits + 3
+
+    # Normalized queries share an entry
+    assert products.search_products('  LAPTOP ', max_price=2000) == first[0]
+    assert queries == []
+
+    products.update_product(4, name='Dell XPS 13 Plus', price=1099.0, category='Laptops')
+    queries.clear()
+    laptops, product, categories = [read() for read in reads]
+    assert queries
+    assert product['name'] == 'Dell XPS 13 Plus'
+    assert [laptop['price'] for laptop in laptops if laptop['id'] == 4] == [1099.0]
+    assert 'Laptops' in categories
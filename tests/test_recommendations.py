@@ -0,0 +1,73 @@
+import pytest
+
+from chat_shards import ChatShards, migrate
+from models import ChatSession, Product
+from recommendations import RecommendationEngine
+from retrieval import ProductRetriever
+
+@pytest.fixture
+def products(catalog_db):
+    return Product(catalog_db)
+
+def make_engine(db, products, chat_service=None):
+    engine = RecommendationEngine(db, products, chat_service or ChatSession(db), ProductRetriever(db, products))
+    engine._full_rebuild = True
+    while engine.refresh():
+        pass
+    return engine
+
+def names(products, product_ids):
+    return [product['name'] for product in products.get_products_by_ids(product_ids)]
+
+def test_neighbors_share_real_attributes(catalog_db, products):
+    engine = make_engine(catalog_db, products)
+    iphone = names(products, engine.for_product(1, limit=20))
+    assert iphone[:3] == ['MacBook Pro 14-inch M3', 'Samsung Galaxy S24 Ultra', 'Dell XPS 13']
+    assert not any(name.startswith(('Storage', 'Garden')) or name == 'Atomic Habits' for name in iphone)
+    assert names(products, engine.for_product(7)) == ['The Psychology of Money']
+
+def test_session_recommendations_stay_on_topic(catalog_db, products):
+    chat = ChatSession(catalog_db)
+    chat.create_session(1, 'laptops')
+    chat.save_message('laptops', 'user', 'Is the iPhone 15 Pro or the Dell XPS 13 better for travel?')
+    engine = make_engine(catalog_db, products, chat)
+    recommended = products.get_products_by_ids(engine.for_session('laptops'))
+    assert recommended
+    assert {product['category'] for product in recommended} == {'Electronics'}
+
+def test_bulk_change_recomputes_only_changed_products(catalog_db, products):
+    engine = make_engine(catalog_db, products)
+    assert engine._stale_products() == set()
+
+    with catalog_db.connection() as conn:
+        conn.execute("UPDATE products SET description = 'Pocket camera phone' WHERE id = 2")
+        conn.execute('DELETE FROM products WHERE id = 3')
+    catalog_db.catalog_changed()
+    engine.retriever._rebuild_thread.join()
+    assert engine._stale_products() == {2, 3}
+    engine.refresh()
+    assert engine._stale_products() == set()
+    assert engine.for_product(3) == []
+    assert 3 not in engine.for_product(1)
+
+def test_watermarks_follow_shard_files_across_migrations(catalog_db, products, tmp_path):
+    before = ChatSession(catalog_db, shards=ChatShards(str(tmp_path / 'two'), 2))
+    for number in range(20):
+        before.create_session(1, f'old-{number}')
+        before.save_message(f'old-{number}', 'user', 'tell me about the Sony WH-1000XM5')
+    engine = make_engine(catalog_db, products, before)
+
+    after = ChatShards(str(tmp_path / 'three'), 3)
+    migrate([(database, index) for index, database in enumerate(before.shards.databases)],
+            after.directory, len(after))
+    chat = ChatSession(catalog_db, shards=after)
+    chat.create_session(1, 'new')
+    chat.save_message('new', 'user', 'compare the Dell XPS 13 and the MacBook Pro 14-inch M3')
+    engine.chat_service = chat
+    engine.refresh()
+    assert engine.for_session('new')
+
+def test_recommendation_limit_is_clamped(client):
+    assert len(client.get('/api/recommendations?limit=100000').json['products']) <= 100
+    assert len(client.get('/api/recommendations?limit=0').json['products']) == 1
+    assert len(client.get('/api/recommendations?product_id=1&limit=-5').json['products']) == 1
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from chatbot_service import ChatbotService
+from models import Product
+from response_cache import ResponseCache
+
+class CountingCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content=f'Answer {self.calls}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason='stop')], usage=None)
+
+@pytest.fixture
+def service(catalog_db, monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test')
+    monkeypatch.setenv('INTENT_ROUTER', '0')
+    service = ChatbotService(catalog_db)
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=CountingCompletions()))
+    return service
+
+def turns(count):
+    return [{'type': 'user' if i % 2 == 0 else 'bot', 'content': f'message {i}'} for i in range(count)]
+
+def test_repeated_question_is_answered_from_the_cache(service):
+    first = service.process_user_message('Any laptop for travel?')
+    again = service.process_user_message('any laptop for travel')
+    assert again['response'] == first['response'] and again.get('cached')
+    assert service.client.chat.completions.calls == 1
+
+def test_a_price_change_misses(service, catalog_db):
+    service.process_user_message('Any laptop for travel?')
+    laptop = service.retriever.search('laptop for travel', limit=1)[0]
+    Product(catalog_db).update_product(laptop['id'], price=laptop['price'] - 100)
+    assert not service.process_user_message('Any laptop for travel?').get('cached')
+    assert service.client.chat.completions.calls == 2
+
+def test_key_covers_the_whole_prompt_history_window():
+    cache = ResponseCache(history_messages=10)
+    history = turns(10)
+    key = cache.make_key('and the price?', 'context', history)
+
+    # Only the sixth-newest message differs
+    edited = [dict(msg) for msg in history]
+    edited[4]['content'] = 'something else'
+    assert cache.make_key('and the price?', 'context', edited) != key
+    # Messages older than the window do not reach the prompt
+    assert cache.make_key('and the price?', 'context', turns(2)[:1] + history) == key
+
+def test_key_covers_the_summary():
+    cache = ResponseCache()
+    history = turns(4)
+    summary = {'type': 'summary', 'content': 'Customer wants a laptop.'}
+    key = cache.make_key('which one?', 'context', [summary] + history)
+    assert key != cache.make_key('which one?', 'context', history)
+    other = dict(summary, content='Customer wants a tent.')
+    assert key != cache.make_key('which one?', 'context', [other] + history)
@@ -0,0 +1,83 @@
+import threading
+
+import numpy as np
+
+from models import Product
+from retrieval import MIN_SIMILARITY, ProductRetriever, ProductVectorIndex
+
+def names(products):
+    return [product['name'] for product in products]
+
+def test_unrelated_messages_find_nothing(catalog_db):
+    retriever = ProductRetriever(catalog_db, Product(catalog_db))
+    assert retriever.search('what is your return policy') == []
+    assert retriever.search('running shoes') == []
+
+def test_hits_share_a_word_with_the_message(catalog_db):
+    retriever = ProductRetriever(catalog_db, Product(catalog_db))
+    found = retriever.search('I need a laptop for video editing under 1500', limit=5)
+    assert names(found)[0] == 'Dell XPS 13'
+    assert all(product['category'] == 'Electronics' for product in found)
+    assert all(product['price'] <= 1500 for product in found)
+    assert names(retriever.search('iphones')) == ['iPhone 15 Pro']
+
+def test_word_forms_match_without_sharing_the_exact_word(catalog_db):
+    retriever = ProductRetriever(catalog_db, Product(catalog_db))
+    # "psychological" / "Psychology", "cancelling" / "canceling"
+    assert names(retriever.search('something psychological')) == ['The Psychology of Money']
+    assert names(retriever.search('cancelling')) == ['Sony WH-1000XM5']
+
+def test_index_hits_respect_the_floor(catalog_db):
+    retriever = ProductRetriever(catalog_db, Product(catalog_db))
+    hits = retriever.index.search('laptop', k=50, min_score=MIN_SIMILARITY)
+    assert hits and all(score > MIN_SIMILARITY for _, score in hits)
+
+def test_upsert_and_remove_keep_document_frequencies_exact(catalog_db):
+    products = Product(catalog_db)
+    catalog = list(products.iter_products())
+    index = ProductVectorIndex()
+    index.build(catalog)
+
+    edited = dict(catalog[0], name='Walnut Bookshelf', description='Solid walnut shelving for living rooms')
+    index.upsert(edited)
+    index.remove(catalog[1]['id'])
+
+    expected = ProductVectorIndex()
+    expected.build([edited] + catalog[2:])
+    assert np.array_equal(index.doc_freq, expected.doc_freq)
+    assert index.doc_count == expected.doc_count
+
+def test_saved_index_is_rebuilt_after_an_edit(catalog_db, tmp_path):
+    products = Product(catalog_db)
+    path = str(tmp_path / 'products-index')
+    ProductRetriever(catalog_db, products, path)
+
+    first = next(products.iter_products())
+    products.update_product(first['id'], name='Walnut Bookshelf', description='Solid walnut shelving')
+
+    # Same product count, new catalog revision: the saved file must not be reused
+    reopened = ProductRetriever(catalog_db, products, path)
+    assert names(reopened.search('walnut bookshelf', limit=1)) == ['Walnut Bookshelf']
+    assert ProductVectorIndex.load(path).revision == catalog_db.catalog_revision()
+
+def test_bulk_changes_during_a_rebuild_queue_one_more_pass(catalog_db, monkeypatch):
+    retriever = ProductRetriever(catalog_db, Product(catalog_db))
+    started, release = threading.Event(), threading.Event()
+    passes = []
+
+    def rebuild():
+        passes.append(threading.current_thread())
+        started.set()
+        release.wait(5)
+    monkeypatch.setattr(retriever, 'rebuild', rebuild)
+
+    catalog_db.catalog_changed()
+    assert started.wait(5)
+    worker = retriever._rebuild_thread
+    for _ in range(3):
+        catalog_db.catalog_changed()
+    assert retriever._rebuild_thread is worker
+    release.set()
+    worker.join(5)
+    assert not retriever.rebuilding
+    assert passes == [worker, worker]